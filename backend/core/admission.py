@@ -0,0 +1,64 @@
+from fastapi import status
+from fastapi.responses import JSONResponse
+from services.admission import admission_controller
+
+# Never shed: a lost claim submission costs more than a slow one
+CRITICAL_PATHS = ("/api/v1/claims/submit", "/api/v1/ml-fraud/submit-with-ml", "/health")
+# Shed first: dashboards and admin lists can simply retry
+LOW_PRIORITY_PREFIXES = (
+    "/api/v1/analytics",
+    "/api/v1/admin/users/list",
+    "/api/v1/admin/users/search",
+    "/api/v1/admin/flagged-claims",
+)
+# Long-lived streams are shed on connect but never hold an in-flight slot
+UNCOUNTED_PATHS = ("/api/v1/analytics/stream",)
+# Per-job event streams: /api/v1/ml-fraud/jobs/{job_id}/events
+UNCOUNTED_PREFIX, UNCOUNTED_SUFFIX = "/api/v1/ml-fraud/jobs/", "/events"
+
+def is_uncounted(path: str) -> bool:
+    return path in UNCOUNTED_PATHS or (path.startswith(UNCOUNTED_PREFIX) and path.endswith(UNCOUNTED_SUFFIX))
+
+def route_priority(path: str) -> str:
+    if path in CRITICAL_PATHS:
+        return "critical"
+    if path.startswith(LOW_PRIORITY_PREFIXES):
+        return "low"
+    return "normal"
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying admission_controller (ADMISSION_CONTROL_ENABLED=true)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(
+            {"detail": "Server is overloaded, please retry shortly"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(admission_controller.retry_after_seconds)}
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not admission_controller.enabled or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        priority = route_priority(path)
+        if is_uncounted(path):
+            if admission_controller.should_shed(priority):
+                admission_controller.stats[priority]["shed"] += 1
+                await self._reject(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+
+        if not await admission_controller.admit(priority):
+            await self._reject(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_controller.release()
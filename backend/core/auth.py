@@ -0,0 +1,74 @@
+import os
+from typing import Any, Dict, Optional
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from services.api_keys import api_key_store
+
+class ApiKeyMiddleware:
+    """
+    Pure ASGI middleware requiring a valid X-API-Key when API_KEY_AUTH_ENABLED=true.
+
+    The verified identity (key id, mode, store id) is attached as
+    request.state.api_key. CORS preflights and API_KEY_EXEMPT_PATHS pass through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.exempt_paths = {
+            path.strip() for path in
+            os.getenv("API_KEY_EXEMPT_PATHS", "/health,/docs,/redoc,/openapi.json").split(",") if path.strip()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not api_key_store.enabled or scope["method"] == "OPTIONS" \
+                or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        api_key = None
+        for name, value in scope["headers"]:
+            if name == b"x-api-key":
+                api_key = value.decode("latin-1").strip()
+                break
+
+        try:
+            identity = await api_key_store.verify(api_key)
+        except Exception as e:
+            print(f"❌ API key lookup failed: {e}")
+            response = JSONResponse({"detail": "Authentication temporarily unavailable"},
+                                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+            await response(scope, receive, send)
+            return
+        if identity is None:
+            detail = "Invalid API key" if api_key else "Missing API key"
+            response = JSONResponse({"detail": detail}, status_code=status.HTTP_401_UNAUTHORIZED,
+                                    headers={"WWW-Authenticate": "X-API-Key"})
+            await response(scope, receive, send)
+            return
+
+        scope.setdefault("state", {})["api_key"] = identity
+        await self.app(scope, receive, send)
+
+def get_api_key_identity(request: Request) -> Optional[Dict[str, Any]]:
+    """Identity of the request's API key, None when authentication is off"""
+    return getattr(request.state, "api_key", None)
+
+def require_platform_key(request: Request):
+    """Route dependency: store-bound (merchant) keys may not use platform operations"""
+    identity = get_api_key_identity(request)
+    if identity is not None and identity.get("store_id"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="API key lacks permission")
+
+def scoped_store_id(request: Request, store_id: Optional[Any]) -> Optional[str]:
+    """The store a request may read: merchant keys are pinned to their own store, 403 for another"""
+    identity = get_api_key_identity(request)
+    own_store_id = identity.get("store_id") if identity else None
+    if not own_store_id:
+        return str(store_id) if store_id is not None else None
+    if store_id is not None and str(store_id).lower() != str(own_store_id).lower():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="API key lacks access to this store")
+    return str(own_store_id)
+
+def require_store_access(request: Request):
+    """Route dependency: a merchant key may only use its own store's /{store_id} routes"""
+    scoped_store_id(request, request.path_params.get("store_id"))
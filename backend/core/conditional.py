@@ -0,0 +1,42 @@
+from typing import Callable
+from fastapi import Depends, HTTPException, Request, Response, status
+from core.responses import wants_msgpack
+
+# Cache-Control hints; no-cache still lets clients store the body but makes them revalidate
+REVALIDATE = "private, no-cache"
+SHARED_SHORT = "public, max-age=30, must-revalidate"
+
+def etag_matches(if_none_match: str, tag: str) -> bool:
+    """Weak comparison of an If-None-Match header against a tag (RFC 9110 13.1.2)"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = tag[2:] if tag.startswith("W/") else tag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def conditional_get(make_tag: Callable[[Request], str], cache_control: str = REVALIDATE):
+    """
+    Route dependency that tags the response with an ETag and answers a matching
+    If-None-Match with 304 before the handler runs.
+
+    make_tag must be cheap: it reads version counters, never the database.
+    """
+    def dependency(request: Request, response: Response):
+        tag = make_tag(request)
+        if wants_msgpack():
+            # Each representation gets its own tag
+            tag = tag[:-1] + '-msgpack"'
+        headers = {"ETag": tag, "Cache-Control": cache_control}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, tag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+        # Picked up by fast_response, which bypasses the injected response
+        request.state.conditional_headers = headers
+
+    return Depends(dependency)
@@ -0,0 +1,129 @@
+"""
+Service container: one lazily built instance of each heavy client or service per process.
+
+Route handlers receive them through FastAPI dependencies (`Depends(get_ml_fraud_service)`);
+services call `container.get(name)`. Nothing is built until first use, so importing the
+app does not import the Cohere SDK or open clients that a worker never needs. The SDK
+import itself is paid once before serving by preload_sdks() (gunicorn master, app startup).
+"""
+
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from crud.crud_analytics import AnalyticsCRUD
+    from crud.crud_claim import ClaimCRUD
+    from crud.crud_customer import CustomerCRUD
+    from crud.crud_store import StoreCRUD
+    from services.ml_fraud_service import MLFraudService
+
+class ServiceContainer:
+    """Registry of named factories whose results are built once and then shared"""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._build_ms: Dict[str, float] = {}
+        # Re-entrant: a factory may get() the services it depends on
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                started = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self._build_ms[name] = round((time.perf_counter() - started) * 1000, 2)
+                print(f"🧩 Built {name} in {self._build_ms[name]}ms")
+            return self._instances[name]
+
+    def override(self, name: str, instance: Any):
+        """Replace a service (e.g. with a stub in a script); None drops it so it is rebuilt"""
+        with self._lock:
+            if instance is None:
+                self._instances.pop(name, None)
+            else:
+                self._instances[name] = instance
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Which services were built in this process, and how long each took"""
+        return {
+            "registered": sorted(self._factories),
+            "built": dict(self._build_ms)
+        }
+
+# Global container, one per worker process
+container = ServiceContainer()
+
+def preload_sdks():
+    """Import the Cohere SDK (about half a second) so the first AI request does not pay for it"""
+    if os.getenv("COHERE_ENABLED", "true").lower() != "true" or "cohere" in sys.modules:
+        return
+    started = time.perf_counter()
+    # Only the module: clients open connections, so they are still built per worker on first use
+    import cohere  # noqa: F401
+    print(f"🧩 Imported the Cohere SDK in {round((time.perf_counter() - started) * 1000, 2)}ms")
+
+def _cohere_client():
+    import cohere
+    return cohere.ClientV2(api_key=os.getenv("COHERE_API_KEY"))
+
+def _customer_crud():
+    from crud.crud_customer import customer_crud
+    return customer_crud
+
+def _claim_crud():
+    from crud.crud_claim import ClaimCRUD
+    return ClaimCRUD()
+
+def _store_crud():
+    from crud.crud_store import StoreCRUD
+    return StoreCRUD()
+
+def _analytics_crud():
+    from crud.crud_analytics import AnalyticsCRUD
+    return AnalyticsCRUD()
+
+def _ml_fraud_service():
+    from services.ml_fraud_service import MLFraudService
+    return MLFraudService()
+
+def _cohere_detector():
+    from services.cohere_scorer import CohereEnhancedFraudDetector
+    return CohereEnhancedFraudDetector()
+
+container.register("cohere_client", _cohere_client)
+container.register("customer_crud", _customer_crud)
+container.register("claim_crud", _claim_crud)
+container.register("store_crud", _store_crud)
+container.register("analytics_crud", _analytics_crud)
+container.register("ml_fraud_service", _ml_fraud_service)
+container.register("cohere_detector", _cohere_detector)
+
+# FastAPI dependencies; async so resolving them does not hop to the threadpool
+
+async def get_cohere_client():
+    return container.get("cohere_client")
+
+async def get_customer_crud() -> "CustomerCRUD":
+    return container.get("customer_crud")
+
+async def get_claim_crud() -> "ClaimCRUD":
+    return container.get("claim_crud")
+
+async def get_store_crud() -> "StoreCRUD":
+    return container.get("store_crud")
+
+async def get_analytics_crud() -> "AnalyticsCRUD":
+    return container.get("analytics_crud")
+
+async def get_ml_fraud_service() -> "MLFraudService":
+    return container.get("ml_fraud_service")
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+from fastapi import status
+from fastapi.responses import JSONResponse
+from core.responses import wants_msgpack
+from services.idempotency import idempotency_store
+
+# Endpoints that create claims and run the scoring pipeline
+IDEMPOTENT_PATHS = ("/api/v1/claims/submit", "/api/v1/ml-fraud/submit-with-ml")
+MAX_KEY_LENGTH = 255
+
+class IdempotencyMiddleware:
+    """
+    Pure ASGI middleware honouring an Idempotency-Key header on claim submission.
+
+    Keys are scoped to the caller's API key and the path, and bound to a hash
+    of the request body and the negotiated response type (JSON or MessagePack,
+    see core/responses.py): reusing a key with a different body or Accept is
+    rejected with 422, since the stored response could not be replayed as is.
+    Replayed responses carry `Idempotent-Replayed: true`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not idempotency_store.enabled or scope["method"] != "POST" \
+                or scope["path"] not in IDEMPOTENT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                idempotency_key = value.decode("latin-1").strip()
+                break
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            await self._error(scope, receive, send, status.HTTP_400_BAD_REQUEST,
+                              f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+            return
+
+        # Buffer the body to fingerprint it, then hand it to the app unchanged
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        media_type = "msgpack" if wants_msgpack() else "json"
+        fingerprint = f"{media_type}:{hashlib.sha256(body).hexdigest()}"
+
+        identity = scope.get("state", {}).get("api_key")
+        caller = identity["key_id"] if identity else "anonymous"
+        key = (caller, scope["path"], idempotency_key)
+
+        while True:
+            record, owner = await idempotency_store.begin(key, fingerprint)
+            if record.fingerprint != fingerprint:
+                idempotency_store.stats["conflicts"] += 1
+                same_body = record.fingerprint.partition(":")[2] == fingerprint.partition(":")[2]
+                await self._error(scope, receive, send, status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                  "Idempotency-Key was already used with a different Accept media type" if same_body
+                                  else "Idempotency-Key was already used with a different request body")
+                return
+            if owner:
+                break
+            if not record.completed:
+                idempotency_store.stats["waited"] += 1
+                try:
+                    await asyncio.wait_for(idempotency_store.wait(key, record), idempotency_store.wait_timeout_seconds)
+                except asyncio.TimeoutError:
+                    await self._error(scope, receive, send, status.HTTP_409_CONFLICT,
+                                      "A request with this Idempotency-Key is still being processed")
+                    return
+            if record.completed:
+                idempotency_store.stats["replayed"] += 1
+                await send({"type": "http.response.start", "status": record.status,
+                            "headers": [*record.headers, (b"idempotent-replayed", b"true")]})
+                await send({"type": "http.response.body", "body": record.body})
+                return
+            # The first attempt failed and was discarded; try to become the owner
+
+        response_status = None
+        response_headers = []
+        response_body = []
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message):
+            nonlocal response_status, response_headers
+            if message["type"] == "http.response.start":
+                response_status = message["status"]
+                response_headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            await idempotency_store.complete(key, record, response_status, response_headers, b"".join(response_body))
+
+    @staticmethod
+    async def _error(scope, receive, send, status_code: int, detail: str):
+        response = JSONResponse({"detail": detail}, status_code=status_code)
+        await response(scope, receive, send)
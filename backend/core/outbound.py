@@ -0,0 +1,44 @@
+import asyncio
+import ipaddress
+import os
+import socket
+from urllib.parse import urlsplit
+
+# Local development only: lets callbacks and webhooks reach http:// and private addresses
+ALLOW_PRIVATE_URLS = os.getenv("OUTBOUND_ALLOW_PRIVATE_URLS", "false").lower() == "true"
+
+class UnsafeURLError(ValueError):
+    """Raised for a caller-supplied URL the server must not send requests to"""
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    # is_global excludes private, loopback, link-local (169.254.169.254), shared and reserved ranges
+    return ip.is_global and not ip.is_multicast
+
+def check_outbound_url(url: str):
+    """
+    Refuse URLs that would make the server call itself or its network (SSRF).
+
+    Requires https and checks every address the host resolves to. Blocking (DNS);
+    use check_outbound_url_async from the event loop. Run it again right before
+    sending, since a host can resolve differently later.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "https" and not (ALLOW_PRIVATE_URLS and parts.scheme == "http"):
+        raise UnsafeURLError("URL must use https")
+    if not parts.hostname:
+        raise UnsafeURLError("URL has no host")
+    if ALLOW_PRIVATE_URLS:
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 443,
+                                                                type=socket.SOCK_STREAM)}
+    except (socket.gaierror, UnicodeError) as e:
+        raise UnsafeURLError(f"Cannot resolve {parts.hostname}: {e}") from None
+    if not addresses or not all(_is_public(address) for address in addresses):
+        raise UnsafeURLError(f"{parts.hostname} resolves to a private or reserved address")
+
+async def check_outbound_url_async(url: str):
+    await asyncio.to_thread(check_outbound_url, url)
@@ -0,0 +1,51 @@
+import os
+from fastapi import status
+from fastapi.responses import JSONResponse
+from services.rate_limiter import rate_limiter
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware applying rate_limiter (RATE_LIMIT_ENABLED=true).
+
+    Runs inside ApiKeyMiddleware so callers are keyed by API key; without a key
+    the client address is used. Every limited response carries RateLimit-*
+    headers, refusals get 429 with Retry-After.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.trust_forwarded = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+        self.exempt_paths = {"/health"}
+
+    def _caller(self, scope) -> str:
+        identity = scope.get("state", {}).get("api_key")
+        if identity:
+            return f"key:{identity['key_id']}"
+        if self.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == b"x-forwarded-for":
+                    return f"ip:{value.decode('latin-1').split(',')[0].strip()}"
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not rate_limiter.enabled or scope["method"] == "OPTIONS" \
+                or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        allowed, headers = rate_limiter.check(self._caller(scope), rate_limiter.classify(scope["path"]))
+        if not allowed:
+            response = JSONResponse({"detail": "Rate limit exceeded"},
+                                    status_code=status.HTTP_429_TOO_MANY_REQUESTS, headers=headers)
+            await response(scope, receive, send)
+            return
+
+        raw_headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), *raw_headers]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
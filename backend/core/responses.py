@@ -0,0 +1,93 @@
+import datetime
+import decimal
+import os
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+import orjson
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is optional; JSON is always available
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+# Set per request by NegotiationMiddleware from the Accept header
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+def wants_msgpack() -> bool:
+    """Whether the current response will be encoded as MessagePack"""
+    return _wants_msgpack.get()
+
+def _default(value: Any) -> Any:
+    """Encode the types orjson/msgpack do not know natively"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, "item"):
+        # NumPy scalars
+        return value.item()
+    return jsonable_encoder(value)
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson, or MessagePack when the client asked
+    for it with Accept: application/msgpack.
+    """
+
+    # Explicit status_code default: FastAPI reads it from the signature to document responses
+    def __init__(self, content: Any, status_code: int = 200, *args, **kwargs):
+        super().__init__(content, status_code, *args, **kwargs)
+        if msgpack is not None:
+            self.headers.append("Vary", "Accept")
+
+    def render(self, content: Any) -> bytes:
+        if msgpack is not None and wants_msgpack():
+            self.media_type = "application/msgpack"
+            return msgpack.packb(content, default=_default, use_bin_type=True)
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+
+def fast_response(request: Request, content: Any, status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    """
+    Serialize a handler result directly, skipping jsonable_encoder and response
+    model re-validation. Keeps the ETag/Cache-Control set by conditional_get.
+    """
+    merged = dict(getattr(request.state, "conditional_headers", None) or {})
+    merged.update(headers or {})
+    return FastJSONResponse(content, status_code=status_code, headers=merged)
+
+class NegotiationMiddleware:
+    """Pure ASGI middleware recording whether the client accepts MessagePack"""
+
+    def __init__(self, app):
+        self.app = app
+        self.enabled = msgpack is not None and os.getenv("MSGPACK_RESPONSES", "true").lower() == "true"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope["headers"]:
+            if name == b"accept":
+                accept = value.decode("latin-1").lower()
+                break
+        token = _wants_msgpack.set(any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _wants_msgpack.reset(token)
@@ -0,0 +1,68 @@
+import asyncio
+import fcntl
+import os
+import tempfile
+from typing import Dict
+
+def get_available_cores() -> int:
+    """Number of CPU cores this process is allowed to run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def get_worker_count() -> int:
+    """
+    Number of serving worker processes.
+
+    WEB_CONCURRENCY may be an integer or "auto" (one worker per available core).
+    Defaults to a single process.
+    """
+    value = os.getenv("WEB_CONCURRENCY", "1").strip().lower()
+    if value == "auto":
+        return get_available_cores()
+    try:
+        return max(1, int(value))
+    except ValueError:
+        return 1
+
+class HostSemaphore:
+    """
+    Counting semaphore shared by every worker process on a host.
+
+    Each of the `slots` permits is a lock file held with a non-blocking flock;
+    a worker that finds none free polls until one is released. Closing the
+    descriptor (or the process dying) gives the permit back.
+    """
+
+    def __init__(self, name: str, slots: int, poll_seconds: float = 0.05):
+        base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.paths = [os.path.join(base_dir, f"bastion-{name}.{slot}.lock") for slot in range(max(1, slots))]
+        self.poll_seconds = poll_seconds
+        # Tasks of this worker queue here first, so only as many poll as there are permits
+        self._local = asyncio.Semaphore(len(self.paths))
+        self._held: Dict[asyncio.Task, int] = {}
+
+    def _try_acquire(self):
+        for path in self.paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    async def __aenter__(self):
+        await self._local.acquire()
+        try:
+            while (fd := self._try_acquire()) is None:
+                await asyncio.sleep(self.poll_seconds)
+        except BaseException:
+            self._local.release()
+            raise
+        self._held[asyncio.current_task()] = fd
+
+    async def __aexit__(self, *exc_info):
+        os.close(self._held.pop(asyncio.current_task()))
+        self._local.release()
@@ -0,0 +1,51 @@
+from typing import List, Dict, Any, Optional
+from datetime import date
+from supabase import Client
+from core.supabase_client import get_supabase
+
+class AnalyticsCRUD:
+    """Reads the pre-aggregated claim rollups (see setup/analytics_rollups.sql)"""
+
+    def __init__(self):
+        self.supabase: Client = get_supabase()
+
+    async def get_status_counts(self, start_day: date, bucket: str,
+                                store_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get claim counts per time bucket and status since start_day, optionally for one store"""
+        response = self.supabase.rpc("claim_status_counts", {
+            "p_start": start_day.isoformat(),
+            "p_bucket": bucket,
+            "p_store_id": store_id
+        }).execute()
+        return response.data if response.data else []
+
+    async def get_category_counts(self, store_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get claimed item counts per (lower-cased) category, optionally for one store"""
+        response = self.supabase.rpc("claim_category_counts", {"p_store_id": store_id}).execute()
+        return response.data if response.data else []
+
+    async def get_top_disputed_items(self, limit: int, store_id: Optional[str] = None,
+                                     start_day: Optional[date] = None) -> List[Dict[str, Any]]:
+        """Get the most disputed items with their dispute count and last dispute time, optionally since start_day"""
+        response = self.supabase.rpc("top_disputed_items", {
+            "p_limit": limit,
+            "p_store_id": store_id,
+            "p_start": start_day.isoformat() if start_day else None
+        }).execute()
+        return response.data if response.data else []
+
+    async def get_dashboard_bundle(self, start_day: date, bucket: str, sections: List[str], limit: int,
+                                   store_id: Optional[str] = None) -> Dict[str, Any]:
+        """Get status counts, category counts and top items in one round trip"""
+        response = self.supabase.rpc("analytics_dashboard", {
+            "p_start": start_day.isoformat(),
+            "p_bucket": bucket,
+            "p_sections": sections,
+            "p_limit": limit,
+            "p_store_id": store_id
+        }).execute()
+        return response.data if response.data else {}
+
+    def rebuild_rollups(self) -> None:
+        """Recompute all rollup tables from the claims table (blocking; run it in a thread from async code)"""
+        self.supabase.rpc("rebuild_claim_rollups").execute()
@@ -1,9 +1,11 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set, Tuple
+import asyncio
 from datetime import datetime
 import uuid
 from supabase import Client
 from schemas import Claim, ClaimCreate, ClaimStatus, ItemData
 from core.supabase_client import get_supabase
+from services.claim_events import claim_events
 
 class ClaimCRUD:
     def __init__(self):
@@ -39,21 +41,97 @@ class ClaimCRUD:
             }
             
             response = self.supabase.table('claims').insert(claim_record).execute()
-            return response.data[0] if response.data else claim_record
+            claim = response.data[0] if response.data else claim_record
+            claim_events.claim_created(claim)
+            return claim
         except Exception as e:
             print(f"Error creating claim: {e}")
             raise
     
-    async def update_claim_status(self, claim_id: uuid.UUID, status: ClaimStatus) -> bool:
-        """Update claim status"""
+    async def update_claim_status(self, claim_id: uuid.UUID, status: ClaimStatus, max_attempts: int = 3) -> bool:
+        """Update claim status, telling listeners the status it replaced"""
         try:
-            update_data = {'status': status.value}
-            response = self.supabase.table('claims').update(update_data).eq('id', str(claim_id)).execute()
-            return len(response.data) > 0
+            for _ in range(max_attempts):
+                current = self.supabase.table('claims').select('status').eq('id', str(claim_id)).execute()
+                if not current.data:
+                    return False
+                previous_status = current.data[0]['status']
+                if previous_status == status.value:
+                    return True
+                # Only applies if no one changed the status since it was read; otherwise read again
+                response = (self.supabase.table('claims')
+                           .update({'status': status.value})
+                           .eq('id', str(claim_id))
+                           .eq('status', previous_status)
+                           .execute())
+                if response.data:
+                    for claim in response.data:
+                        claim_events.status_changed(claim, previous_status)
+                    return True
+            return False
         except Exception as e:
             print(f"Error updating claim status: {e}")
             return False
     
+    async def update_claim_statuses(self, statuses: Dict[str, ClaimStatus], store_id: Optional[str] = None,
+                                    ids_per_request: int = 100, max_attempts: int = 3) -> Dict[str, Any]:
+        """
+        Apply many status changes with one read and one update per status transition per chunk
+
+        Claims outside `store_id` (when given) are reported as not found. Claims
+        already in the requested status are left alone. Each update only applies
+        while the claim still has the status that was read, so listeners always
+        learn the status it replaced; claims changed concurrently are read again
+        and, after `max_attempts`, reported as conflicts.
+        """
+        claim_ids = list(statuses)
+        found: Set[str] = set()
+        pending = claim_ids
+        updated = 0
+        unchanged = 0
+        for _ in range(max_attempts):
+            previous: Dict[str, str] = {}
+            for i in range(0, len(pending), ids_per_request):
+                query = self.supabase.table('claims').select('id, status').in_('id', pending[i:i + ids_per_request])
+                if store_id:
+                    query = query.eq('store_id', store_id)
+                response = await asyncio.to_thread(query.execute)
+                previous.update({row['id']: row['status'] for row in response.data})
+            found.update(previous)
+
+            groups: Dict[Tuple[str, str], List[str]] = {}
+            for claim_id in pending:
+                if claim_id not in previous:
+                    continue
+                if previous[claim_id] == statuses[claim_id].value:
+                    unchanged += 1
+                    continue
+                groups.setdefault((previous[claim_id], statuses[claim_id].value), []).append(claim_id)
+
+            applied: Set[str] = set()
+            for (previous_status, new_status), ids in groups.items():
+                for i in range(0, len(ids), ids_per_request):
+                    query = (self.supabase.table('claims')
+                            .update({'status': new_status})
+                            .in_('id', ids[i:i + ids_per_request])
+                            .eq('status', previous_status))
+                    response = await asyncio.to_thread(query.execute)
+                    for claim in response.data:
+                        claim_events.status_changed(claim, previous_status)
+                        applied.add(claim['id'])
+            updated += len(applied)
+
+            pending = [claim_id for ids in groups.values() for claim_id in ids if claim_id not in applied]
+            if not pending:
+                break
+
+        return {
+            'updated': updated,
+            'unchanged': unchanged,
+            'not_found': [claim_id for claim_id in claim_ids if claim_id not in found],
+            'conflicts': pending
+        }
+    
     async def get_claim_by_id(self, claim_id: uuid.UUID) -> Optional[Dict[str, Any]]:
         """Get claim by ID"""
         try:
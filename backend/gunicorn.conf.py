@@ -0,0 +1,34 @@
+# Multi-worker serving: `WEB_CONCURRENCY=auto python main.py` or `gunicorn main:app -c gunicorn.conf.py`
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.workers import get_worker_count
+
+workers = get_worker_count()
+# Export the resolved count so the app can split shared budgets (e.g. Cohere concurrency)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Import the app once in the master so workers fork with modules already loaded
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+loglevel = "info"
+
+def on_starting(server):
+    """Drop the shared risk cache, rate-limit buckets and data versions left over from a previous run"""
+    from services.shared_risk_cache import SharedRiskScoreSegment
+    from services.rate_limiter import SharedTokenBuckets
+    from services.data_versions import SharedVersionCounters
+    SharedRiskScoreSegment.remove_files()
+    SharedTokenBuckets.remove_files()
+    SharedVersionCounters.remove_files()
+
+def when_ready(server):
+    """Import the Cohere SDK in the master, so forked workers start with it loaded"""
+    from core.container import preload_sdks
+    preload_sdks()
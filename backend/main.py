@@ -1,5 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import Response
 from routes.customer import router as customer_router
 from routes.user_api import router as user_router
@@ -9,24 +10,79 @@ from routes.ml_fraud_api import router as ml_fraud_router
 from routes.admin_api import router as admin_router
 from routes.analytics_api import router as analytics_router
 from routes.users_api import router as users_router
+from routes.webhooks_api import router as webhooks_router
 from services.risk_score_cache import risk_score_cache
+from services.claim_item_store import claim_item_store
+from services.admission import admission_controller
+from services.webhooks import webhook_dispatcher
+from services.outcome_statistics import outcome_statistics
+from services.scoring_jobs import scoring_jobs
+from services.scheduler import scheduler
+from services.background_jobs import register_background_jobs
+from core.workers import get_worker_count
+from core.container import preload_sdks
+from core.responses import FastJSONResponse, NegotiationMiddleware
+from core.auth import ApiKeyMiddleware
+from core.rate_limit import RateLimitMiddleware
+from core.admission import AdmissionMiddleware
+from core.idempotency import IdempotencyMiddleware
 import asyncio
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="Project BASTION - B2B Fraud Detection API", version="1.0.0")
+app = FastAPI(
+    title="Project BASTION - B2B Fraud Detection API",
+    version="1.0.0",
+    # orjson (or MessagePack on request) instead of the stdlib encoder
+    default_response_class=FastJSONResponse
+)
 storefront_url = os.getenv("STOREFRONT_URL")
 bastion_frontend_url = os.getenv("BASTION_FRONTEND_URL")
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize risk score cache on startup"""
+    """Start background services and the scheduled jobs (cache warm-up, analytics loads, refreshes)"""
+    # Off the event loop; a no-op in gunicorn workers, whose master already imported it
+    await asyncio.to_thread(preload_sdks)
     try:
-        asyncio.create_task(risk_score_cache.initialize_cache())
+        register_background_jobs(scheduler)
     except Exception as e:
-        print(f"Warning: Could not initialize cache: {e}")
+        print(f"Warning: Could not register background jobs: {e}")
+    scheduler.start()
+    # Event-loop lag sampling for load shedding (ADMISSION_CONTROL_ENABLED=true)
+    admission_controller.start()
+    # Outbound decision webhooks (WEBHOOKS_ENABLED=true)
+    webhook_dispatcher.start()
+    # Worker pool for queued ML fraud analyses
+    scoring_jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending risk score writes and persist in-memory analytics before exiting"""
+    await scheduler.close()
+    await risk_score_cache.write_buffer.close()
+    await claim_item_store.close()
+    await webhook_dispatcher.close()
+    await outcome_statistics.close()
+    await scoring_jobs.close()
+
+# Idempotency-Key replay for claim submission, innermost so it stores the bare handler response
+app.add_middleware(IdempotencyMiddleware)
+
+# Per-caller token buckets (RATE_LIMIT_ENABLED=true), inside auth so callers are keyed by API key
+app.add_middleware(RateLimitMiddleware)
+
+# X-API-Key authentication (API_KEY_AUTH_ENABLED=true), inside CORS so 401s carry its headers
+app.add_middleware(ApiKeyMiddleware)
+
+# Overload shedding (ADMISSION_CONTROL_ENABLED=true), outside auth so shed requests cost nothing
+app.add_middleware(AdmissionMiddleware)
+
+# Compress large bodies (SSE streams are left alone). Registered before the header
+# middleware below so it sees complete bodies rather than re-streamed ones
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MINIMUM_SIZE", "1024")), compresslevel=5)
 
 # Add explicit CORS headers for all responses
 @app.middleware("http")
@@ -63,6 +119,9 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# Outermost, so the response encoder sees the client's Accept header
+app.add_middleware(NegotiationMiddleware)
+
 # Include routers
 app.include_router(customer_router)
 app.include_router(user_router)
@@ -72,6 +131,7 @@ app.include_router(ml_fraud_router)
 app.include_router(admin_router)
 app.include_router(analytics_router)
 app.include_router(users_router)
+app.include_router(webhooks_router)
 
 @app.get("/health")
 def read_root():
@@ -82,7 +142,13 @@ def options_handler(full_path: str):
     return {"message": "OK"}
 
 if __name__ == "__main__":
-    import uvicorn
     port = int(os.getenv("PORT", 8000))
+    workers = get_worker_count()
+    if workers > 1:
+        # Hand over to gunicorn, which preloads the app and forks uvicorn workers
+        print(f"🚀 Starting {workers} workers on 0.0.0.0:{port}")
+        os.execvp("gunicorn", ["gunicorn", "main:app", "--config", "gunicorn.conf.py"])
+
+    import uvicorn
     print(f"🚀 Starting server on 0.0.0.0:{port}")
     uvicorn.run(app, host="0.0.0.0", port=port, reload=False, log_level="info")
\ No newline at end of file
@@ -1,29 +1,142 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+import asyncio
 import uuid
 from datetime import datetime
 
-from schemas import ClaimStatus
+from schemas import ClaimStatus, ApiKeyCreate
 from crud.crud_claim import ClaimCRUD
+from services.risk_score_cache import risk_score_cache
+from services.risk_recompute import risk_recompute_engine
+from core.responses import fast_response
+from core.auth import require_platform_key
+from core.container import get_claim_crud
+from services.api_keys import api_key_store
+from services.rate_limiter import rate_limiter
+from services.admission import admission_controller
+from services.idempotency import idempotency_store
+from services.scheduler import scheduler
 
-router = APIRouter(prefix="/api/v1/admin", tags=["admin"])
-
-# Initialize services
-claim_crud = ClaimCRUD()
+# Platform operations only: merchant (store-bound) keys are refused on every admin route
+router = APIRouter(prefix="/api/v1/admin", tags=["admin"], dependencies=[Depends(require_platform_key)])
 
 @router.get("/flagged-claims")
-async def get_flagged_claims(limit: int = 100):
+async def get_flagged_claims(request: Request, limit: int = 100, claim_crud: ClaimCRUD = Depends(get_claim_crud)):
     """Get claims from flagged users (admin endpoint)"""
     try:
         claims = await claim_crud.get_flagged_claims(limit)
-        return {"flagged_claims": claims, "total": len(claims)}
+        return fast_response(request, {"flagged_claims": claims, "total": len(claims)})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {str(e)}"
         )
 
+@router.get("/risk-cache/stats")
+async def get_risk_cache_stats():
+    """Get risk score cache and write-back statistics"""
+    return risk_score_cache.get_cache_stats()
+
+@router.post("/risk-recompute", status_code=status.HTTP_202_ACCEPTED)
+async def start_risk_recompute():
+    """Start a full-population risk score recompute on the process pool"""
+    try:
+        job = risk_recompute_engine.start(reason="admin")
+        return job.to_dict()
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+
+@router.get("/risk-recompute/status")
+async def get_risk_recompute_status():
+    """Get progress of the current or last risk recompute job"""
+    job = risk_recompute_engine.current_job
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No risk recompute job has run yet"
+        )
+    return job.to_dict()
+
+@router.post("/api-keys", status_code=status.HTTP_201_CREATED)
+async def create_api_key(payload: ApiKeyCreate):
+    """Issue an API key; the plaintext key is only returned once"""
+    try:
+        store_id = str(payload.store_id) if payload.store_id else None
+        return await asyncio.to_thread(api_key_store.create_key, payload.name, payload.mode, store_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create API key: {str(e)}"
+        )
+
+@router.delete("/api-keys/{key_id}")
+async def revoke_api_key(key_id: uuid.UUID):
+    """Revoke an API key, effective immediately on this worker"""
+    try:
+        revoked = await asyncio.to_thread(api_key_store.revoke_key, str(key_id))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to revoke API key: {str(e)}"
+        )
+    if not revoked:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"API key {key_id} not found"
+        )
+    return {"id": str(key_id), "revoked": True}
+
+@router.get("/api-keys/stats")
+async def get_api_key_stats():
+    """Get API key verification cache statistics"""
+    return api_key_store.get_stats()
+
+@router.get("/rate-limits/stats")
+async def get_rate_limit_stats():
+    """Get rate limiter configuration and counters"""
+    return rate_limiter.get_stats()
+
+@router.get("/admission/stats")
+async def get_admission_stats():
+    """Get load-shedding signals and counters"""
+    return admission_controller.get_stats()
+
+@router.get("/idempotency/stats")
+async def get_idempotency_stats():
+    """Get Idempotency-Key replay counters"""
+    return idempotency_store.get_stats()
+
+@router.get("/jobs")
+async def get_background_jobs():
+    """Get this worker's scheduled jobs with their last status and durations"""
+    return scheduler.get_status()
+
+@router.post("/jobs/{name}/run", status_code=status.HTTP_202_ACCEPTED)
+async def run_background_job(name: str):
+    """Run a scheduled job now on this worker"""
+    if name not in scheduler.jobs:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Unknown job {name}"
+        )
+    try:
+        started = scheduler.run_now(name)
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    if started is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job {name} is already running"
+        )
+    return scheduler.jobs[name].to_dict()
+
 @router.get("/{claim_id}")
-async def get_claim(claim_id: uuid.UUID):
+async def get_claim(claim_id: uuid.UUID, claim_crud: ClaimCRUD = Depends(get_claim_crud)):
     """Get specific claim details"""
     try:
         claim = await claim_crud.get_claim_by_id(claim_id)
@@ -42,7 +155,7 @@ async def get_claim(claim_id: uuid.UUID):
         )
 
 @router.put("/{claim_id}/status")
-async def update_claim_status(claim_id: uuid.UUID, status: ClaimStatus):
+async def update_claim_status(claim_id: uuid.UUID, status: ClaimStatus, claim_crud: ClaimCRUD = Depends(get_claim_crud)):
     """Update claim status (approve/deny)"""
     try:
         success = await claim_crud.update_claim_status(claim_id, status)
@@ -1,228 +1,692 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import os
 import uuid
 from core.supabase_client import get_supabase_client
+from core.container import container
+from services.analytics_cache import analytics_cache
+from services.claim_item_store import claim_item_store
+from services.heavy_hitters import heavy_hitters
+from services.distinct_claimants import distinct_claimants, UNCATEGORIZED
+from services.risk_score_cache import risk_score_cache
+from services.analytics_stream import analytics_stream
+from services.data_versions import data_versions
+from core.conditional import conditional_get
+from core.auth import require_platform_key, require_store_access, scoped_store_id
+from core.responses import fast_response
 
 router = APIRouter(prefix="/api/v1/analytics", tags=["analytics"])
 
-@router.get("/dashboard-metrics")
-async def get_dashboard_metrics(
-    time_range: str = Query("7d", regex="^(7d|1m|3m|1y)$")
-):
-    """Get dashboard metrics for different time ranges"""
+# Polling dashboards revalidate against the analytics cache generation
+ANALYTICS_ETAG = conditional_get(lambda request: data_versions.tag("analytics", data_versions.analytics_version()))
+# Host-wide diagnostics and score distributions across every store's users
+PLATFORM_ONLY = Depends(require_platform_key)
+RISK_ETAG = conditional_get(lambda request: data_versions.tag("risk", data_versions.scope_version("risk")))
+# Read time-series counts from the claim rollups (setup/analytics_rollups.sql)
+USE_ROLLUPS = os.getenv("ANALYTICS_USE_ROLLUPS", "true").lower() == "true"
+
+# Claims are bucketed per time range: days for 7d, weeks for 1m, 14-day blocks for 3m, months for 1y
+TIME_RANGE_DAYS = {"7d": 7, "1m": 30, "3m": 90, "1y": 365}
+ROLLUP_BUCKETS = {"7d": "day", "1m": "week", "3m": "fortnight", "1y": "month"}
+
+def _time_range_start(time_range: str) -> datetime:
+    return datetime.utcnow() - timedelta(days=TIME_RANGE_DAYS[time_range])
+
+def _bucket_start(day: date, time_range: str) -> date:
+    """Map a claim's UTC day to the first day of its chart bucket"""
+    if time_range == "1m":
+        # Group by week
+        return day - timedelta(days=day.weekday())
+    if time_range == "3m":
+        # Group by 2 weeks (14 days)
+        days_since_epoch = (day - date(1970, 1, 1)).days
+        return date(1970, 1, 1) + timedelta(days=(days_since_epoch // 14) * 14)
+    if time_range == "1y":
+        # Group by month
+        return day.replace(day=1)
+    return day
+
+def _bucket_label(bucket: date, time_range: str) -> str:
+    return bucket.strftime("%b %Y") if time_range == "1y" else bucket.strftime("%b %d")
+
+async def _get_status_counts(time_range: str, store_id: Optional[str] = None) -> Dict[date, Dict[str, int]]:
+    """Claim counts per bucket and status, read from the rollups when available"""
+    start_date = _time_range_start(time_range)
+
+    if claim_item_store.ready:
+        return claim_item_store.status_counts(start_date.date(), ROLLUP_BUCKETS[time_range], store_id)
+
+    if USE_ROLLUPS:
+        try:
+            rows = await container.get("analytics_crud").get_status_counts(start_date.date(), ROLLUP_BUCKETS[time_range], store_id)
+            return _status_rows_to_counts(rows)
+        except Exception as e:
+            print(f"Warning: claim rollups unavailable, scanning claims instead: {e}")
+
+    # Fallback: scan raw claims in the window
     supabase = get_supabase_client()
+    query = supabase.table("claims").select("created_at, status").gte("created_at", start_date.isoformat())
+    if store_id:
+        query = query.eq("store_id", store_id)
+    claims_response = query.execute()
+    return _aggregate_status_counts_locally(claims_response.data or [], time_range, start_date)
+
+def _status_rows_to_counts(rows: List[Dict[str, Any]]) -> Dict[date, Dict[str, int]]:
+    """Convert claim_status_counts rows into {bucket: {status: count}}"""
+    counts: Dict[date, Dict[str, int]] = {}
+    for row in rows:
+        bucket = date.fromisoformat(row["bucket"])
+        counts.setdefault(bucket, {})[row["status"]] = int(row["claim_count"])
+    return counts
+
+def _aggregate_status_counts_locally(claims: List[Dict[str, Any]], time_range: str,
+                                     start_date: datetime) -> Dict[date, Dict[str, int]]:
+    """Bucket raw claims created since start_date by status (used when the rollups are unavailable)"""
+    counts: Dict[date, Dict[str, int]] = {}
+    start = start_date.isoformat()
+    for claim in claims:
+        if claim['created_at'] < start:
+            continue
+        claim_date = datetime.fromisoformat(claim['created_at'].replace('Z', '+00:00'))
+        bucket = _bucket_start(claim_date.date(), time_range)
+        statuses = counts.setdefault(bucket, {})
+        statuses[claim.get('status')] = statuses.get(claim.get('status'), 0) + 1
+    return counts
+
+def _format_dashboard_metrics(counts: Dict[date, Dict[str, int]], time_range: str) -> Dict[str, Any]:
+    """Chart series for the dashboard"""
+    # Process data for charts, oldest bucket first
+    suspicious_disputes = []
+    approved_disputes = []
     
-    # Calculate date range
-    now = datetime.utcnow()
-    if time_range == "7d":
-        start_date = now - timedelta(days=7)
-        date_format = "Mon DD"
-    elif time_range == "1m":
-        start_date = now - timedelta(days=30)
-        date_format = "Mon DD"
-    elif time_range == "3m":
-        start_date = now - timedelta(days=90)
-        date_format = "Mon DD"
-    else:  # 1y
-        start_date = now - timedelta(days=365)
-        date_format = "QQ YYYY"
+    for bucket in sorted(counts):
+        date_key = _bucket_label(bucket, time_range)
+        # All disputes are suspicious disputes
+        suspicious_disputes.append({"date": date_key, "value": sum(counts[bucket].values())})
+        approved_disputes.append({"date": date_key, "value": counts[bucket].get("APPROVED", 0)})
     
+    return {
+        "suspiciousDisputes": suspicious_disputes,
+        "approvedDisputes": approved_disputes
+    }
+
+async def _build_dashboard_metrics(time_range: str, store_id: Optional[str] = None):
+    return _format_dashboard_metrics(await _get_status_counts(time_range, store_id), time_range)
+
+@router.get("/dashboard-metrics", dependencies=[ANALYTICS_ETAG])
+async def get_dashboard_metrics(
+    request: Request,
+    time_range: str = Query("7d", regex="^(7d|1m|3m|1y)$")
+):
+    """Get dashboard metrics for different time ranges (a merchant key sees its own store)"""
+    store_id = scoped_store_id(request, None)
     try:
-        # Get claims data with user info for the time period
-        claims_response = supabase.table("claims").select(
-            "id, created_at, status, claim_data, users!inner(risk_score, is_flagged)"
-        ).gte("created_at", start_date.isoformat()).execute()
-        
-        claims = claims_response.data if claims_response.data else []
-        
-        # Process data for charts
-        suspicious_disputes = []
-        approved_disputes = []
-        
-        # Group by date periods
-        date_groups = {}
-        for claim in claims:
-            claim_date = datetime.fromisoformat(claim['created_at'].replace('Z', '+00:00'))
-            
-            if time_range == "7d":
-                date_key = claim_date.strftime("%b %d")
-            elif time_range == "1m":
-                # Group by week
-                week_start = claim_date - timedelta(days=claim_date.weekday())
-                date_key = week_start.strftime("%b %d")
-            elif time_range == "3m":
-                # Group by 2 weeks (14 days)
-                days_since_epoch = (claim_date.replace(tzinfo=None) - datetime(1970, 1, 1)).days
-                week_group = days_since_epoch // 14
-                week_start = datetime(1970, 1, 1) + timedelta(days=week_group * 14)
-                date_key = week_start.strftime("%b %d")
-            else:  # 1y
-                # Group by month
-                date_key = claim_date.strftime("%b %Y")
-            
-            if date_key not in date_groups:
-                date_groups[date_key] = {"suspicious": 0, "approved": 0}
-            
-            # All disputes are suspicious disputes
-            date_groups[date_key]["suspicious"] += 1
-            
-            if claim.get('status') == 'APPROVED':
-                date_groups[date_key]["approved"] += 1
-        
-        # Convert to chart format
-        for date_key, counts in date_groups.items():
-            suspicious_disputes.append({"date": date_key, "value": counts["suspicious"]})
-            approved_disputes.append({"date": date_key, "value": counts["approved"]})
-        
-        # Sort by date
-        suspicious_disputes.sort(key=lambda x: x["date"])
-        approved_disputes.sort(key=lambda x: x["date"])
-        
-        return {
-            "suspiciousDisputes": suspicious_disputes,
-            "approvedDisputes": approved_disputes
-        }
-        
+        return await analytics_cache.get_or_compute(
+            "dashboard-metrics", {"time_range": time_range, "store_id": store_id},
+            lambda: _build_dashboard_metrics(time_range, store_id)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch dashboard metrics: {str(e)}")
 
-@router.get("/category-distribution")
-async def get_category_distribution():
-    """Get distribution of disputes by category"""
-    supabase = get_supabase_client()
+def _aggregate_categories_locally(claims: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Count claimed items per category in Python (used when the RPC is unavailable)"""
+    category_counts: Dict[str, int] = {}
+    for claim in claims:
+        claim_data = claim.get('claim_data', [])
+        if isinstance(claim_data, list):
+            for item in claim_data:
+                if isinstance(item, dict) and 'category' in item:
+                    category = item['category'].title()
+                    category_counts[category] = category_counts.get(category, 0) + 1
+    return category_counts
+
+def _aggregate_top_items_locally(claims: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    """Rank claimed items by dispute count in Python (used when the RPC is unavailable)"""
+    item_disputes: Dict[str, Dict[str, Any]] = {}
+    for claim in claims:
+        claim_data = claim.get('claim_data', [])
+        claim_date = claim.get('created_at', '')
+        
+        if isinstance(claim_data, list):
+            for item in claim_data:
+                if isinstance(item, dict) and 'item_name' in item:
+                    item_name = item['item_name']
+                    if item_name not in item_disputes:
+                        item_disputes[item_name] = {
+                            "item_name": item_name,
+                            "category": item.get('category', 'Unknown'),
+                            "disputes": 0,
+                            "last_dispute": claim_date
+                        }
+                    
+                    item_disputes[item_name]["disputes"] += 1
+                    # Keep the most recent dispute date
+                    if claim_date > item_disputes[item_name]["last_dispute"]:
+                        item_disputes[item_name]["last_dispute"] = claim_date
     
+    return sorted(item_disputes.values(), key=lambda x: x["disputes"], reverse=True)[:limit]
+
+def _category_rows_to_counts(rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Convert claim_category_counts rows into {Category: item count}"""
+    category_counts: Dict[str, int] = {}
+    for row in rows:
+        category = row["category"].title()
+        category_counts[category] = category_counts.get(category, 0) + int(row["item_count"])
+    return category_counts
+
+async def _get_category_counts(exact: bool = True, store_id: Optional[str] = None) -> Dict[str, int]:
+    """Item counts per category, aggregated in the database when available"""
+    if not exact and heavy_hitters.ready:
+        counts = heavy_hitters.category_counts(store_id=store_id)
+        return {category.title(): count for category, count in counts.items()}
+
+    if claim_item_store.ready:
+        counts = claim_item_store.category_counts(store_id)
+        return {category.title(): count for category, count in counts.items()}
+
     try:
-        # Get all claims with category data
-        claims_response = supabase.table("claims").select("claim_data").execute()
-        claims = claims_response.data if claims_response.data else []
-        
-        category_counts = {}
-        total_items = 0
-        
-        for claim in claims:
-            claim_data = claim.get('claim_data', [])
-            if isinstance(claim_data, list):
-                for item in claim_data:
-                    if isinstance(item, dict) and 'category' in item:
-                        category = item['category'].title()
-                        category_counts[category] = category_counts.get(category, 0) + 1
-                        total_items += 1
-        
-        # Convert to percentage and format for frontend
-        category_data = []
-        colors = [
-            'hsl(var(--chart-1))',
-            'hsl(var(--chart-2))', 
-            'hsl(var(--chart-3))',
-            'hsl(var(--chart-4))',
-            'hsl(var(--chart-5))'
-        ]
-        
-        for i, (category, count) in enumerate(sorted(category_counts.items(), key=lambda x: x[1], reverse=True)):
-            percentage = round((count / total_items) * 100) if total_items > 0 else 0
-            category_data.append({
-                "name": category,
-                "value": percentage,
-                "color": colors[i % len(colors)]
-            })
-        
-        return category_data
-        
+        return _category_rows_to_counts(await container.get("analytics_crud").get_category_counts(store_id))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch category distribution: {str(e)}")
+        print(f"Warning: category aggregation RPC unavailable, aggregating locally: {e}")
+    
+    query = get_supabase_client().table("claims").select("claim_data")
+    if store_id:
+        query = query.eq("store_id", store_id)
+    return _aggregate_categories_locally(query.execute().data or [])
 
-@router.get("/top-disputed-items")
-async def get_top_disputed_items(limit: int = Query(5, ge=1, le=20)):
-    """Get most disputed items"""
-    supabase = get_supabase_client()
+async def _get_top_items(limit: int, store_id: Optional[str] = None, days: Optional[int] = None,
+                         exact: bool = True) -> List[Dict[str, Any]]:
+    """Most disputed items, from the heavy-hitter sketches unless exact counts are requested"""
+    if not exact and heavy_hitters.ready and not (store_id and days):
+        # A days window merges the per-day sketches it covers
+        return heavy_hitters.top_items(limit, store_id=store_id, days=days)
+
+    # Day-aligned like the rollups and the per-day sketches
+    start_day = datetime.utcnow().date() - timedelta(days=days) if days else None
+    if claim_item_store.ready:
+        return claim_item_store.top_items(limit, store_id, start_day)
+
+    try:
+        return await container.get("analytics_crud").get_top_disputed_items(limit, store_id, start_day)
+    except Exception as e:
+        print(f"Warning: top items RPC unavailable, aggregating locally: {e}")
+
+    query = get_supabase_client().table("claims").select("claim_data, created_at")
+    if store_id:
+        query = query.eq("store_id", store_id)
+    if start_day:
+        query = query.gte("created_at", start_day.isoformat())
+    return _aggregate_top_items_locally(query.execute().data or [], limit)
+
+def _format_category_distribution(category_counts: Dict[str, int]) -> List[Dict[str, Any]]:
+    """Category shares for the dashboard"""
+    total_items = sum(category_counts.values())
+    
+    # Convert to percentage and format for frontend
+    category_data = []
+    colors = [
+        'hsl(var(--chart-1))',
+        'hsl(var(--chart-2))', 
+        'hsl(var(--chart-3))',
+        'hsl(var(--chart-4))',
+        'hsl(var(--chart-5))'
+    ]
+    
+    for i, (category, count) in enumerate(sorted(category_counts.items(), key=lambda x: x[1], reverse=True)):
+        percentage = round((count / total_items) * 100) if total_items > 0 else 0
+        category_data.append({
+            "name": category,
+            "value": percentage,
+            "color": colors[i % len(colors)]
+        })
     
+    return category_data
+
+async def _build_category_distribution(exact: bool, store_id: Optional[str] = None):
+    return _format_category_distribution(await _get_category_counts(exact, store_id))
+
+@router.get("/category-distribution", dependencies=[ANALYTICS_ETAG])
+async def get_category_distribution(request: Request,
+                                    exact: bool = Query(False, description="Bypass the heavy-hitter sketches")):
+    """Get distribution of disputes by category (a merchant key sees its own store)"""
+    store_id = scoped_store_id(request, None)
     try:
-        # Get all claims with item data
-        claims_response = supabase.table("claims").select("claim_data, created_at").execute()
-        claims = claims_response.data if claims_response.data else []
-        
-        item_disputes = {}
-        
-        for claim in claims:
-            claim_data = claim.get('claim_data', [])
-            claim_date = claim.get('created_at', '')
-            
-            if isinstance(claim_data, list):
-                for item in claim_data:
-                    if isinstance(item, dict) and 'item_name' in item:
-                        item_name = item['item_name']
-                        category = item.get('category', 'Unknown').title()
-                        
-                        if item_name not in item_disputes:
-                            item_disputes[item_name] = {
-                                "item": item_name,
-                                "category": category,
-                                "disputes": 0,
-                                "lastDispute": claim_date,
-                                "productLink": f"https://example.com/products/{item_name.lower().replace(' ', '-')}"
-                            }
-                        
-                        item_disputes[item_name]["disputes"] += 1
-                        # Keep the most recent dispute date
-                        if claim_date > item_disputes[item_name]["lastDispute"]:
-                            item_disputes[item_name]["lastDispute"] = claim_date
-        
-        # Sort by dispute count and return top items
-        top_items = sorted(item_disputes.values(), key=lambda x: x["disputes"], reverse=True)[:limit]
+        return await analytics_cache.get_or_compute(
+            "category-distribution", {"exact": exact, "store_id": store_id},
+            lambda: _build_category_distribution(exact, store_id)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch category distribution: {str(e)}")
+
+def _format_top_disputed_items(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Top disputed items for the dashboard"""
+    top_items = []
+    for row in rows:
+        item_name = row["item_name"]
+        last_dispute = row.get("last_dispute") or ""
         
         # Format dates
-        for item in top_items:
-            if item["lastDispute"]:
-                try:
-                    date_obj = datetime.fromisoformat(item["lastDispute"].replace('Z', '+00:00'))
-                    item["lastDispute"] = date_obj.strftime("%Y-%m-%d")
-                except:
-                    item["lastDispute"] = "2024-01-15"
-        
-        return top_items
+        if last_dispute:
+            try:
+                date_obj = datetime.fromisoformat(last_dispute.replace('Z', '+00:00'))
+                last_dispute = date_obj.strftime("%Y-%m-%d")
+            except:
+                last_dispute = "2024-01-15"
         
+        top_items.append({
+            "item": item_name,
+            "category": (row.get("category") or "Unknown").title(),
+            "disputes": int(row["disputes"]),
+            "lastDispute": last_dispute,
+            "productLink": f"https://example.com/products/{item_name.lower().replace(' ', '-')}"
+        })
+        # Sketch counts may overestimate by up to this many disputes
+        if "max_overestimate" in row:
+            top_items[-1]["maxOverestimate"] = row["max_overestimate"]
+    
+    return top_items
+
+async def _build_top_disputed_items(limit: int, store_id: Optional[str], days: Optional[int], exact: bool):
+    return _format_top_disputed_items(await _get_top_items(limit, store_id, days, exact))
+
+@router.get("/top-disputed-items", dependencies=[ANALYTICS_ETAG])
+async def get_top_disputed_items(
+    request: Request,
+    limit: int = Query(5, ge=1, le=20),
+    store_id: Optional[str] = Query(None, description="Only count this store's claims"),
+    days: Optional[int] = Query(None, ge=1, le=365, description="Only count claims from the last N days"),
+    exact: bool = Query(False, description="Bypass the heavy-hitter sketches")
+):
+    """Get most disputed items"""
+    store_id = scoped_store_id(request, store_id)
+    try:
+        params = {"limit": limit, "store_id": store_id, "days": days, "exact": exact}
+        return await analytics_cache.get_or_compute(
+            "top-disputed-items", params, lambda: _build_top_disputed_items(limit, store_id, days, exact)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch top disputed items: {str(e)}")
 
-@router.get("/summary-stats")
-async def get_summary_stats(time_range: str = Query("7d", regex="^(7d|1m|3m|1y)$")):
-    """Get summary statistics for the dashboard"""
-    supabase = get_supabase_client()
+def _count_claimants_exactly(claims: List[Dict[str, Any]], start_date: date, category: Optional[str],
+                             group_by: Optional[str]) -> Dict[str, Any]:
+    """Distinct/new/repeat claimants from raw claims (used when the sketches are unavailable)"""
+    in_range: set = set()
+    before: set = set()
+    groups: Dict[str, set] = {}
+    for claim in claims:
+        claim_data = claim.get('claim_data') or []
+        categories = {
+            item['category'].lower() for item in (claim_data if isinstance(claim_data, list) else [])
+            if isinstance(item, dict) and item.get('category')
+        } or {UNCATEGORIZED}
+        if category and category.lower() not in categories:
+            continue
+        claim_day = datetime.fromisoformat(claim['created_at'].replace('Z', '+00:00')).date()
+        if claim_day < start_date:
+            before.add(claim['user_id'])
+            continue
+        in_range.add(claim['user_id'])
+        if group_by == "store":
+            groups.setdefault(str(claim.get('store_id')), set()).add(claim['user_id'])
+        elif group_by == "category":
+            for name in categories:
+                if not category or name == category.lower():
+                    groups.setdefault(name, set()).add(claim['user_id'])
+    new = len(in_range - before)
+    return {
+        "distinct": len(in_range),
+        "new": new,
+        "repeat": len(in_range) - new,
+        "groups": {name: len(users) for name, users in groups.items()}
+    }
+
+async def _build_distinct_claimants(start_date: date, end_date: date, store_id: Optional[str],
+                                    category: Optional[str], group_by: Optional[str], exact: bool):
+    """Distinct claimant counts from the HyperLogLog sketches, or from raw claims when exact"""
+    # Ranges reaching past the sketch retention horizon are counted exactly
+    if not exact and distinct_claimants.ready and distinct_claimants.covers(start_date):
+        counts = distinct_claimants.count(start_date, end_date, store_id, category)
+        groups = distinct_claimants.breakdown(start_date, end_date, group_by, store_id, category) if group_by else {}
+        standard_error = round(1.04 / (1 << distinct_claimants.precision) ** 0.5, 4)
+    else:
+        # Claims before the range are needed to tell first-time from repeat claimants
+        query = get_supabase_client().table("claims").select("user_id, store_id, created_at, claim_data").lt(
+            "created_at", (end_date + timedelta(days=1)).isoformat()
+        )
+        if store_id:
+            query = query.eq("store_id", store_id)
+        counts = _count_claimants_exactly(query.execute().data or [], start_date, category, group_by)
+        groups = counts.pop("groups")
+        standard_error = 0.0
+
+    result = {
+        "startDate": start_date.isoformat(),
+        "endDate": end_date.isoformat(),
+        "distinctClaimants": counts["distinct"],
+        "firstTimeClaimants": counts["new"],
+        "repeatClaimants": counts["repeat"],
+        "standardError": standard_error
+    }
+    if group_by:
+        result["breakdown"] = [
+            {"name": name if group_by == "store" else name.title(), "distinctClaimants": count}
+            for name, count in sorted(groups.items(), key=lambda x: x[1], reverse=True)
+        ]
+    return result
+
+@router.get("/distinct-claimants", dependencies=[ANALYTICS_ETAG])
+async def get_distinct_claimants(
+    request: Request,
+    start_date: Optional[date] = Query(None, description="First day (UTC), defaults to 30 days ago"),
+    end_date: Optional[date] = Query(None, description="Last day (UTC), inclusive, defaults to today"),
+    store_id: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    group_by: Optional[str] = Query(None, regex="^(store|category)$"),
+    exact: bool = Query(False, description="Count from raw claims instead of the HyperLogLog sketches")
+):
+    """Get distinct, first-time and repeat claimant counts for a date range"""
+    store_id = scoped_store_id(request, store_id)
+    end_date = end_date or datetime.utcnow().date()
+    start_date = start_date or end_date - timedelta(days=30)
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    try:
+        params = {
+            "start_date": start_date, "end_date": end_date, "store_id": store_id,
+            "category": category, "group_by": group_by, "exact": exact
+        }
+        return await analytics_cache.get_or_compute(
+            "distinct-claimants", params,
+            lambda: _build_distinct_claimants(start_date, end_date, store_id, category, group_by, exact)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch distinct claimants: {str(e)}")
+
+def _format_summary_stats(counts: Dict[date, Dict[str, int]]) -> Dict[str, Any]:
+    """Summary figures for the dashboard"""
+    # Total disputes = ALL claims (suspicious disputes is actually total disputes)
+    total_disputes = sum(sum(statuses.values()) for statuses in counts.values())
+    
+    # Approved disputes = only APPROVED claims
+    total_approved = sum(statuses.get('APPROVED', 0) for statuses in counts.values())
     
-    # Calculate date range
-    now = datetime.utcnow()
-    if time_range == "7d":
-        start_date = now - timedelta(days=7)
-    elif time_range == "1m":
-        start_date = now - timedelta(days=30)
-    elif time_range == "3m":
-        start_date = now - timedelta(days=90)
-    else:  # 1y
-        start_date = now - timedelta(days=365)
+    # Approval rate = (approved / total) * 100% (will always be <= 100%)
+    approval_rate = (total_approved / total_disputes * 100) if total_disputes > 0 else 0
     
+    return {
+        "totalSuspiciousDisputes": total_disputes,  # This is actually total disputes
+        "totalApprovedDisputes": total_approved,
+        "approvalRate": round(approval_rate, 1)
+    }
+
+async def _build_summary_stats(time_range: str, store_id: Optional[str] = None):
+    return _format_summary_stats(await _get_status_counts(time_range, store_id))
+
+@router.get("/summary-stats", dependencies=[ANALYTICS_ETAG])
+async def get_summary_stats(request: Request, time_range: str = Query("7d", regex="^(7d|1m|3m|1y)$")):
+    """Get summary statistics for the dashboard (a merchant key sees its own store)"""
+    store_id = scoped_store_id(request, None)
     try:
-        # Get claims for the period
-        claims_response = supabase.table("claims").select(
-            "id, status"
-        ).gte("created_at", start_date.isoformat()).execute()
-        
-        claims = claims_response.data if claims_response.data else []
-        
-        # Total disputes = ALL claims (suspicious disputes is actually total disputes)
-        total_disputes = len(claims)
-        
-        # Approved disputes = only APPROVED claims
-        total_approved = sum(1 for claim in claims if claim.get('status') == 'APPROVED')
-        
-        # Approval rate = (approved / total) * 100% (will always be <= 100%)
-        approval_rate = (total_approved / total_disputes * 100) if total_disputes > 0 else 0
-        
-        return {
-            "totalSuspiciousDisputes": total_disputes,  # This is actually total disputes
-            "totalApprovedDisputes": total_approved,
-            "approvalRate": round(approval_rate, 1)
-        }
-        
+        return await analytics_cache.get_or_compute(
+            "summary-stats", {"time_range": time_range, "store_id": store_id},
+            lambda: _build_summary_stats(time_range, store_id)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch summary stats: {str(e)}")
+
+DASHBOARD_SECTIONS = ("timeseries", "summary", "categories", "top_items")
+
+async def _get_dashboard_data(time_range: str, store_id: Optional[str], sections: List[str], limit: int,
+                              exact: bool) -> Dict[str, Any]:
+    """Status counts, category counts and top items for the bundle from a single read"""
+    start_date = _time_range_start(time_range)
+    needed = set()
+    if "timeseries" in sections or "summary" in sections:
+        needed.add("status_counts")
+    if "categories" in sections:
+        needed.add("category_counts")
+    if "top_items" in sections:
+        needed.add("top_items")
+    data: Dict[str, Any] = {}
+
+    # Approximate sections come straight from the in-memory sketches
+    if not exact and heavy_hitters.ready:
+        if "category_counts" in needed:
+            counts = heavy_hitters.category_counts(store_id=store_id)
+            data["category_counts"] = {category.title(): count for category, count in counts.items()}
+        if "top_items" in needed:
+            data["top_items"] = heavy_hitters.top_items(limit, store_id=store_id)
+        needed -= set(data)
+
+    if not needed:
+        return data
+
+    if claim_item_store.ready:
+        if "status_counts" in needed:
+            data["status_counts"] = claim_item_store.status_counts(
+                start_date.date(), ROLLUP_BUCKETS[time_range], store_id
+            )
+        if "category_counts" in needed:
+            counts = claim_item_store.category_counts(store_id)
+            data["category_counts"] = {category.title(): count for category, count in counts.items()}
+        if "top_items" in needed:
+            data["top_items"] = claim_item_store.top_items(limit, store_id)
+        return data
+
+    if USE_ROLLUPS:
+        try:
+            bundle = await container.get("analytics_crud").get_dashboard_bundle(
+                start_date.date(), ROLLUP_BUCKETS[time_range], sorted(needed), limit, store_id
+            )
+            if "status_counts" in needed:
+                data["status_counts"] = _status_rows_to_counts(bundle.get("status_counts") or [])
+            if "category_counts" in needed:
+                data["category_counts"] = _category_rows_to_counts(bundle.get("category_counts") or [])
+            if "top_items" in needed:
+                data["top_items"] = bundle.get("top_items") or []
+            return data
+        except Exception as e:
+            print(f"Warning: dashboard rollup bundle unavailable, scanning claims instead: {e}")
+
+    # Fallback: one scan of raw claims feeds every section
+    columns = "created_at, status"
+    query = get_supabase_client().table("claims")
+    if needed & {"category_counts", "top_items"}:
+        query = query.select(columns + ", claim_data")
+    else:
+        query = query.select(columns).gte("created_at", start_date.isoformat())
+    if store_id:
+        query = query.eq("store_id", store_id)
+    claims = query.execute().data or []
+
+    if "status_counts" in needed:
+        data["status_counts"] = _aggregate_status_counts_locally(claims, time_range, start_date)
+    if "category_counts" in needed:
+        data["category_counts"] = _aggregate_categories_locally(claims)
+    if "top_items" in needed:
+        data["top_items"] = _aggregate_top_items_locally(claims, limit)
+    return data
+
+async def _build_dashboard(time_range: str, store_id: Optional[str], sections: List[str], limit: int,
+                           exact: bool) -> Dict[str, Any]:
+    """All requested dashboard sections in one response"""
+    data = await _get_dashboard_data(time_range, store_id, sections, limit, exact)
+    result: Dict[str, Any] = {"timeRange": time_range, "sections": sections}
+    if "timeseries" in sections:
+        result["dashboardMetrics"] = _format_dashboard_metrics(data["status_counts"], time_range)
+    if "summary" in sections:
+        result["summaryStats"] = _format_summary_stats(data["status_counts"])
+    if "categories" in sections:
+        result["categoryDistribution"] = _format_category_distribution(data["category_counts"])
+    if "top_items" in sections:
+        result["topDisputedItems"] = _format_top_disputed_items(data["top_items"])
+    return result
+
+@router.get("/dashboard", dependencies=[ANALYTICS_ETAG])
+async def get_dashboard(
+    request: Request,
+    time_range: str = Query("7d", regex="^(7d|1m|3m|1y)$"),
+    sections: Optional[str] = Query(None, description="Comma-separated: timeseries,summary,categories,top_items"),
+    limit: int = Query(5, ge=1, le=20),
+    store_id: Optional[uuid.UUID] = Query(None, description="Only include this store's claims"),
+    exact: bool = Query(False, description="Bypass the heavy-hitter sketches")
+):
+    """Get every dashboard section in one call"""
+    requested = [section.strip() for section in sections.split(",")] if sections else list(DASHBOARD_SECTIONS)
+    unknown = [section for section in requested if section not in DASHBOARD_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dashboard sections: {', '.join(unknown)}")
+    requested = [section for section in DASHBOARD_SECTIONS if section in requested]
+    store = scoped_store_id(request, store_id)
+
+    try:
+        params = {
+            "time_range": time_range, "sections": ",".join(requested), "limit": limit,
+            "store_id": store, "exact": exact
+        }
+        dashboard = await analytics_cache.get_or_compute(
+            "dashboard", params, lambda: _build_dashboard(time_range, store, requested, limit, exact)
+        )
+        return fast_response(request, dashboard)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch dashboard: {str(e)}")
+
+# Risk distributions, computed from the risk score cache without touching the database
+
+@router.get("/risk/histogram", dependencies=[PLATFORM_ONLY, RISK_ETAG])
+async def get_risk_histogram(bins: int = Query(10, ge=2, le=100)):
+    """Get the distribution of cached user risk scores"""
+    try:
+        distribution = await risk_score_cache.get_distribution()
+        return distribution.histogram(bins)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch risk histogram: {str(e)}")
+
+@router.get("/risk/flagged-by-store", dependencies=[RISK_ETAG])
+async def get_flagged_by_store(request: Request):
+    """Get the share of flagged users among each store's claimants (a merchant key gets its own row)"""
+    store_id = scoped_store_id(request, None)
+    try:
+        distribution = await risk_score_cache.get_distribution()
+        rows = distribution.flagged_by_store()
+        if store_id:
+            rows = [row for row in rows if str(row["storeId"]).lower() == store_id.lower()]
+        return rows
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch flagged users by store: {str(e)}")
+
+@router.get("/risk/calibration", dependencies=[PLATFORM_ONLY, RISK_ETAG])
+async def get_risk_calibration():
+    """Get approval and denial rates of users per risk score decile"""
+    try:
+        distribution = await risk_score_cache.get_distribution()
+        return distribution.calibration()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch risk calibration: {str(e)}")
+
+@router.get("/stream")
+async def stream_analytics(
+    request: Request,
+    cursor: Optional[str] = Query(None, description="Resume after this event id (same as Last-Event-ID)"),
+    store_id: Optional[uuid.UUID] = Query(None, description="Only stream this store's claims")
+):
+    """Stream live dashboard deltas (claim created, status changed) as Server-Sent Events"""
+    return StreamingResponse(
+        analytics_stream.subscribe(
+            request.headers.get("last-event-id") or cursor,
+            scoped_store_id(request, store_id),
+            request.is_disconnected
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Merchant-scoped variants: every read is restricted to one store's partition.
+# Access is checked before the ETag so another store's tag never answers 304
+STORE_ACCESS = Depends(require_store_access)
+
+@router.get("/stores/{store_id}/dashboard-metrics", dependencies=[STORE_ACCESS, ANALYTICS_ETAG])
+async def get_store_dashboard_metrics(
+    store_id: uuid.UUID,
+    time_range: str = Query("7d", regex="^(7d|1m|3m|1y)$")
+):
+    """Get dashboard metrics for a single store"""
+    try:
+        return await analytics_cache.get_or_compute(
+            "store-dashboard-metrics", {"store_id": str(store_id), "time_range": time_range},
+            lambda: _build_dashboard_metrics(time_range, str(store_id))
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch store dashboard metrics: {str(e)}")
+
+@router.get("/stores/{store_id}/summary-stats", dependencies=[STORE_ACCESS, ANALYTICS_ETAG])
+async def get_store_summary_stats(
+    store_id: uuid.UUID,
+    time_range: str = Query("7d", regex="^(7d|1m|3m|1y)$")
+):
+    """Get summary statistics for a single store"""
+    try:
+        return await analytics_cache.get_or_compute(
+            "store-summary-stats", {"store_id": str(store_id), "time_range": time_range},
+            lambda: _build_summary_stats(time_range, str(store_id))
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch store summary stats: {str(e)}")
+
+@router.get("/stores/{store_id}/category-distribution", dependencies=[STORE_ACCESS, ANALYTICS_ETAG])
+async def get_store_category_distribution(
+    store_id: uuid.UUID,
+    exact: bool = Query(False, description="Bypass the heavy-hitter sketches")
+):
+    """Get distribution of a single store's disputes by category"""
+    try:
+        return await analytics_cache.get_or_compute(
+            "store-category-distribution", {"store_id": str(store_id), "exact": exact},
+            lambda: _build_category_distribution(exact, str(store_id))
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch store category distribution: {str(e)}")
+
+@router.get("/stores/{store_id}/top-disputed-items", dependencies=[STORE_ACCESS, ANALYTICS_ETAG])
+async def get_store_top_disputed_items(
+    store_id: uuid.UUID,
+    limit: int = Query(5, ge=1, le=20),
+    days: Optional[int] = Query(None, ge=1, le=365, description="Only count claims from the last N days"),
+    exact: bool = Query(False, description="Bypass the heavy-hitter sketches")
+):
+    """Get a single store's most disputed items"""
+    try:
+        params = {"store_id": str(store_id), "limit": limit, "days": days, "exact": exact}
+        return await analytics_cache.get_or_compute(
+            "store-top-disputed-items", params,
+            lambda: _build_top_disputed_items(limit, str(store_id), days, exact)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch store top disputed items: {str(e)}")
+
+@router.get("/cache-stats", dependencies=[PLATFORM_ONLY])
+async def get_analytics_cache_stats():
+    """Get analytics response cache hit/miss metrics"""
+    return analytics_cache.get_stats()
+
+@router.get("/columnar-stats", dependencies=[PLATFORM_ONLY])
+async def get_columnar_store_stats():
+    """Get size and load metrics of the in-memory claim item store"""
+    return claim_item_store.get_stats()
+
+@router.get("/heavy-hitters/stats", dependencies=[PLATFORM_ONLY])
+async def get_heavy_hitter_stats():
+    """Get heavy-hitter sketch sizes and error bounds"""
+    return heavy_hitters.get_stats()
+
+@router.get("/distinct-claimants/stats", dependencies=[PLATFORM_ONLY])
+async def get_distinct_claimant_stats():
+    """Get HyperLogLog sketch count, memory and error metrics"""
+    return distinct_claimants.get_stats()
+
+@router.get("/stream/stats", dependencies=[PLATFORM_ONLY])
+async def get_stream_stats():
+    """Get live stream subscriber and fan-out metrics"""
+    return analytics_stream.get_stats()
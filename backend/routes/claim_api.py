@@ -1,25 +1,35 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from typing import Optional
 import uuid
 
 from schemas.claim_submission import ClaimSubmissionPayload
-from schemas.claim import ClaimResponse
+from schemas.claim import ClaimResponse, ClaimStatus
 from crud.crud_customer import CustomerCRUD
 from crud.crud_store import StoreCRUD
 from crud.crud_claim import ClaimCRUD
 from services.ml_fraud_service import MLFraudService
 from services.risk_score_cache import risk_score_cache
+from core.container import get_customer_crud, get_store_crud, get_claim_crud, get_ml_fraud_service
+from core.auth import scoped_store_id
+from services.webhooks import webhook_dispatcher, decision_for
+from services.score_refinement import score_refiner
+from services.outcome_statistics import outcome_statistics
 
 router = APIRouter(prefix="/api/v1/claims", tags=["claims"])
 
-# Initialize services
-customer_crud = CustomerCRUD()
-store_crud = StoreCRUD()
-claim_crud = ClaimCRUD()
-ml_fraud_service = MLFraudService()
+# Services come from the shared container (core/container.py)
 # risk_score_cache is already imported as an instance
 
 @router.post("/submit", response_model=ClaimResponse)
-async def submit_claim(payload: ClaimSubmissionPayload):
+async def submit_claim(
+    payload: ClaimSubmissionPayload,
+    request: Request,
+    two_phase: Optional[bool] = Query(None, description="Return the rule-based score now and refine it with AI in the background"),
+    customer_crud: CustomerCRUD = Depends(get_customer_crud),
+    store_crud: StoreCRUD = Depends(get_store_crud),
+    claim_crud: ClaimCRUD = Depends(get_claim_crud),
+    ml_fraud_service: MLFraudService = Depends(get_ml_fraud_service)
+):
     """
     Submit a new return claim for fraud detection analysis
     
@@ -29,7 +39,12 @@ async def submit_claim(payload: ClaimSubmissionPayload):
     3. Calculates fraud risk score
     4. Stores the claim in the database
     5. Returns the analysis results
+    
+    In two-phase mode (TWO_PHASE_SCORING_ENABLED or ?two_phase=true) step 3 only
+    applies the rules; the AI-adjusted score follows via webhook and job result.
     """
+    # A merchant key may only submit claims to its own store
+    scoped_store_id(request, payload.claim_context.store_id)
     try:
         # Extract data from payload
         user_id = payload.user_id
@@ -63,17 +78,28 @@ async def submit_claim(payload: ClaimSubmissionPayload):
             for item in claim_context.claim_data
         ]
         
+        # Two-phase scoring only pays off when the AI phase would run at all
+        use_two_phase = (score_refiner.enabled if two_phase is None else two_phase) and ml_fraud_service.cohere_enabled
+        previously_flagged = bool(user.get('is_flagged'))
+        
         # Calculate fraud risk score using ML service
-        ml_result = await ml_fraud_service.calculate_fraud_score(
-            user_id=user_id,
-            claim_data=claim_data_dict
-        )
+        if use_two_phase:
+            ml_result, refine_score = await ml_fraud_service.calculate_two_phase_score(
+                user_id=user_id,
+                claim_data=claim_data_dict
+            )
+            analysis_method = "Rule-based, AI review pending"
+        else:
+            ml_result = await ml_fraud_service.calculate_fraud_score(
+                user_id=user_id,
+                claim_data=claim_data_dict
+            )
+            analysis_method = "ML Enhanced"
         
         risk_score = ml_result["fraud_score"]
-        analysis_method = "ML Enhanced"
         
         # Determine if user should be flagged
-        should_flag = await ml_fraud_service.should_flag_user(risk_score, user_id)
+        should_flag = await ml_fraud_service.should_flag_user(risk_score, user_id, previously_flagged)
         
         # Update user's risk score and flagged status
         await customer_crud.update_user_risk_score(user_id, risk_score, should_flag)
@@ -86,6 +112,23 @@ async def submit_claim(payload: ClaimSubmissionPayload):
             claim_data=claim_context.claim_data
         )
         
+        refinement_job_id = None
+        if use_two_phase:
+            async def refine():
+                refined = await refine_score()
+                outcome_statistics.remember_patterns(claim['id'], refined.get('risk_factors'))
+                refined_score = refined["fraud_score"]
+                return refined_score, await ml_fraud_service.should_flag_user(refined_score, user_id, previously_flagged)
+            
+            async def on_refined(refined_score: int, refined_flagged: bool):
+                await customer_crud.update_user_risk_score(user_id, refined_score, refined_flagged)
+                await risk_score_cache.recalculate_user_risk_score(str(user_id))
+            
+            refinement_job_id = await score_refiner.schedule(claim, risk_score, should_flag, refine, on_refined)
+            if refinement_job_id is None:
+                # Scoring queue full: the rule-based score is all this claim gets
+                analysis_method = "Rule-based, AI review skipped"
+        
         # Determine response message
         if should_flag:
             message = f"Claim submitted - HIGH RISK detected ({analysis_method}: {risk_score}/100). Manual review required."
@@ -97,8 +140,24 @@ async def submit_claim(payload: ClaimSubmissionPayload):
             message = f"Claim submitted successfully - Low risk detected ({analysis_method}: {risk_score}/100)."
             claim_status = ClaimStatus.PENDING
         
-        # Trigger risk score recalculation for this user
-        await risk_score_cache.recalculate_user_risk_score(str(user_id))
+        # Push the decision to the store's webhooks in the background (no await since scheduling,
+        # so it is journaled before the refinement job can run)
+        webhook_dispatcher.claim_decision(claim, risk_score, should_flag, preliminary=refinement_job_id is not None)
+        # Credit the matched patterns once the merchant reports the outcome (refinements add the AI's)
+        outcome_statistics.remember_patterns(claim['id'], ml_result.get('risk_factors'))
+        
+        # Trigger risk score recalculation for this user; two-phase mode answers without waiting for it
+        if use_two_phase:
+            risk_score_cache.recalculate_in_background(str(user_id))
+        else:
+            await risk_score_cache.recalculate_user_risk_score(str(user_id))
+        
+        if refinement_job_id:
+            scoring_phase = "preliminary"
+        elif use_two_phase:
+            scoring_phase = "rules_only"
+        else:
+            scoring_phase = "final"
         
         return ClaimResponse(
             claim_id=uuid.UUID(claim['id']),
@@ -106,9 +165,14 @@ async def submit_claim(payload: ClaimSubmissionPayload):
             status=claim_status,
             risk_score=risk_score,
             is_flagged=should_flag,
-            message=message
+            message=message,
+            scoring_phase=scoring_phase,
+            decision=decision_for(risk_score, should_flag),
+            refinement_job_id=refinement_job_id
         )
         
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from schemas.customer import CustomerCreate, CustomerResponse, CustomerCreateResponse, CustomerGetResponse
-from crud.crud_customer import customer_crud
+from crud.crud_customer import CustomerCRUD
+from core.container import get_customer_crud
 from pydantic import EmailStr
 
 router = APIRouter(prefix="/api/v1", tags=["customers"])
 
 @router.post("/customers", response_model=CustomerCreateResponse, status_code=status.HTTP_201_CREATED)
-async def create_customer(customer: CustomerCreate) -> CustomerCreateResponse:
+async def create_customer(customer: CustomerCreate,
+                          customer_crud: CustomerCRUD = Depends(get_customer_crud)) -> CustomerCreateResponse:
     """Create a new customer"""
     # Check if customer with email already exists
     existing_customer = await customer_crud.get_customer_by_email(customer.email)
@@ -31,7 +33,7 @@ async def create_customer(customer: CustomerCreate) -> CustomerCreateResponse:
         )
 
 @router.get("/customers/{customer_id}", response_model=CustomerGetResponse)
-async def get_customer(customer_id: str) -> CustomerGetResponse:
+async def get_customer(customer_id: str, customer_crud: CustomerCRUD = Depends(get_customer_crud)) -> CustomerGetResponse:
     """Get a customer by ID"""
     result = await customer_crud.get_customer_by_id(customer_id)
     
@@ -52,7 +54,8 @@ async def get_customer(customer_id: str) -> CustomerGetResponse:
         )
 
 @router.get("/customers/by-email", response_model=CustomerGetResponse)
-async def get_customer_by_email(email: EmailStr = Query(..., description="Customer email address")) -> CustomerGetResponse:
+async def get_customer_by_email(email: EmailStr = Query(..., description="Customer email address"),
+                                customer_crud: CustomerCRUD = Depends(get_customer_crud)) -> CustomerGetResponse:
     """Get a customer by email address"""
     result = await customer_crud.get_customer_by_email(email)
     
@@ -1,27 +1,41 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any, Optional
 import uuid
-from pydantic import BaseModel
+from pydantic import BaseModel, HttpUrl
 
 from schemas import ItemData, ClaimSubmissionPayload, ClaimResponse, ClaimStatus
 from crud.crud_customer import CustomerCRUD
 from crud.crud_store import StoreCRUD
 from crud.crud_claim import ClaimCRUD
 from services.ml_fraud_service import MLFraudService
+from services.webhooks import webhook_dispatcher
+from services.outcome_statistics import outcome_statistics
+from services.scoring_jobs import scoring_jobs, QueueFullError
+from services.score_refinement import score_refiner
+from services.data_versions import data_versions
+from core.conditional import conditional_get
+from core.container import get_customer_crud, get_store_crud, get_claim_crud, get_ml_fraud_service
+from core.auth import scoped_store_id
+from core.outbound import check_outbound_url_async, UnsafeURLError
 
 router = APIRouter(prefix="/api/v1/ml-fraud", tags=["ml-fraud"])
 
-# Initialize services
-customer_crud = CustomerCRUD()
-store_crud = StoreCRUD()
-claim_crud = ClaimCRUD()
-ml_fraud_service = MLFraudService()
+# Services come from the shared container (core/container.py)
+# Same per-user version as the admin user details
+USER_ETAG = conditional_get(
+    lambda request: data_versions.tag("user", data_versions.user_version(request.path_params["user_id"]))
+)
 
 class MLFraudAnalysisRequest(BaseModel):
     user_id: uuid.UUID
     claim_data: List[ItemData]
     store_id: Optional[uuid.UUID] = None
 
+class MLFraudJobRequest(MLFraudAnalysisRequest):
+    # Receives the finished job as a signed POST; must be a public https URL
+    callback_url: Optional[HttpUrl] = None
+
 class MLFraudAnalysisResponse(BaseModel):
     fraud_score: int
     confidence: float
@@ -32,7 +46,10 @@ class MLFraudAnalysisResponse(BaseModel):
     historical_summary: Dict[str, Any]
 
 @router.post("/analyze", response_model=MLFraudAnalysisResponse)
-async def analyze_ml_fraud_risk(request: MLFraudAnalysisRequest):
+async def analyze_ml_fraud_risk(
+    request: MLFraudAnalysisRequest,
+    ml_fraud_service: MLFraudService = Depends(get_ml_fraud_service)
+):
     """
     Analyze fraud risk using Cohere ML enhanced detection
     """
@@ -67,11 +84,122 @@ async def analyze_ml_fraud_risk(request: MLFraudAnalysisRequest):
             detail=f"ML fraud analysis failed: {str(e)}"
         )
 
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_ml_fraud_job(
+    request: MLFraudJobRequest,
+    http_request: Request,
+    ml_fraud_service: MLFraudService = Depends(get_ml_fraud_service)
+):
+    """
+    Queue an ML fraud analysis and return its job id at once
+
+    Fetch the result with GET /jobs/{job_id}, stream it from /jobs/{job_id}/events
+    or receive it at `callback_url`. A merchant key's jobs belong to its store.
+    """
+    store_id = scoped_store_id(http_request, request.store_id)
+    if request.callback_url:
+        try:
+            await check_outbound_url_async(str(request.callback_url))
+        except UnsafeURLError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid callback_url: {e}"
+            )
+    claim_data_dict = [
+        {
+            "item_name": item.item_name,
+            "category": item.category,
+            "price": item.price,
+            "quantity": item.quantity,
+            "url": item.url
+        }
+        for item in request.claim_data
+    ]
+
+    async def analyze():
+        result = await ml_fraud_service.calculate_fraud_score(user_id=request.user_id, claim_data=claim_data_dict)
+        return MLFraudAnalysisResponse(**result).model_dump()
+
+    try:
+        job = await scoring_jobs.submit(
+            analyze,
+            callback_url=str(request.callback_url) if request.callback_url else None,
+            metadata={
+                "user_id": str(request.user_id),
+                "store_id": store_id
+            }
+        )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to queue ML fraud analysis: {str(e)}"
+        )
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"{router.prefix}/jobs/{job.id}",
+        "events_url": f"{router.prefix}/jobs/{job.id}/events",
+        # Verifies the Bastion-Signature header of the callback; shown only once
+        "callback_secret": job.callback_secret
+    }
+
+@router.get("/jobs/stats")
+async def get_ml_fraud_job_stats():
+    """Get job queue depth and counters, including two-phase score refinements"""
+    return {**scoring_jobs.get_stats(), "refinements": score_refiner.get_stats()}
+
+async def _get_visible_job(request: Request, job_id: str) -> Dict[str, Any]:
+    """A job's state; another store's job is reported as not found to a merchant key"""
+    try:
+        job = await scoring_jobs.get(job_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get ML fraud job: {str(e)}"
+        )
+    own_store_id = scoped_store_id(request, None)
+    if job is None or (own_store_id and str(job.get("store_id") or "").lower() != own_store_id.lower()):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} not found or expired"
+        )
+    return job
+
+@router.get("/jobs/{job_id}")
+async def get_ml_fraud_job(job_id: str, request: Request):
+    """Get a job's status and, once finished, its result"""
+    return await _get_visible_job(request, job_id)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_ml_fraud_job(job_id: str, request: Request):
+    """Stream a job's status changes and final result as Server-Sent Events"""
+    await _get_visible_job(request, job_id)
+    return StreamingResponse(
+        scoring_jobs.events(job_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/submit-with-ml", response_model=ClaimResponse)
-async def submit_claim_with_ml_analysis(payload: ClaimSubmissionPayload):
+async def submit_claim_with_ml_analysis(
+    payload: ClaimSubmissionPayload,
+    request: Request,
+    customer_crud: CustomerCRUD = Depends(get_customer_crud),
+    store_crud: StoreCRUD = Depends(get_store_crud),
+    claim_crud: ClaimCRUD = Depends(get_claim_crud),
+    ml_fraud_service: MLFraudService = Depends(get_ml_fraud_service)
+):
     """
     Submit a claim with enhanced ML fraud detection
     """
+    # A merchant key may only submit claims to its own store
+    scoped_store_id(request, payload.claim_context.store_id)
     try:
         user_id = payload.user_id
         claim_context = payload.claim_context
@@ -137,6 +265,11 @@ async def submit_claim_with_ml_analysis(payload: ClaimSubmissionPayload):
             message = f"Claim submitted successfully - Low risk detected (ML Score: {risk_score}/100)."
             claim_status = ClaimStatus.PENDING
         
+        # Push the decision to the store's webhooks in the background
+        webhook_dispatcher.claim_decision(claim, risk_score, should_flag)
+        # Credit the matched patterns once the merchant reports the outcome
+        outcome_statistics.remember_patterns(claim['id'], ml_result['risk_factors'])
+        
         return ClaimResponse(
             claim_id=uuid.UUID(claim['id']),
             user_id=user_id,
@@ -154,8 +287,12 @@ async def submit_claim_with_ml_analysis(payload: ClaimSubmissionPayload):
             detail=f"Internal server error: {str(e)}"
         )
 
-@router.get("/user/{user_id}/risk-profile")
-async def get_user_risk_profile(user_id: uuid.UUID):
+@router.get("/user/{user_id}/risk-profile", dependencies=[USER_ETAG])
+async def get_user_risk_profile(
+    user_id: uuid.UUID,
+    customer_crud: CustomerCRUD = Depends(get_customer_crud),
+    claim_crud: ClaimCRUD = Depends(get_claim_crud)
+):
     """
     Get comprehensive risk profile for a user using ML analysis
     """
@@ -1,22 +1,30 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from typing import List
 import uuid
 from datetime import datetime
 
 from schemas import StoreResponse
 from crud.crud_store import StoreCRUD
+from crud.crud_claim import ClaimCRUD
+from services.data_versions import data_versions
+from core.conditional import conditional_get, SHARED_SHORT
+from core.responses import fast_response
+from core.container import get_store_crud, get_claim_crud
+from core.auth import require_store_access
 
 router = APIRouter(prefix="/api/v1/stores", tags=["stores"])
 
-# Initialize services
-store_crud = StoreCRUD()
+# Stores rarely change; the version moves on every create
+STORES_ETAG = conditional_get(lambda request: data_versions.tag("stores", data_versions.scope_version("stores")), SHARED_SHORT)
 
-@router.get("", response_model=List[StoreResponse])
-async def get_stores():
+# Documented through `responses` only: fast_response skips response_model validation
+@router.get("", responses={200: {"model": List[StoreResponse]}}, dependencies=[STORES_ETAG])
+async def get_stores(request: Request, store_crud: StoreCRUD = Depends(get_store_crud)):
     """Get all stores"""
     try:
         stores = await store_crud.get_all_stores()
-        return stores
+        # Already StoreResponse models, no need to validate them again
+        return fast_response(request, stores)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -24,10 +32,11 @@ async def get_stores():
         )
 
 @router.post("", response_model=StoreResponse)
-async def create_store(name: str):
+async def create_store(name: str, store_crud: StoreCRUD = Depends(get_store_crud)):
     """Create a new store"""
     try:
         store = await store_crud.create_store(name)
+        data_versions.bump("stores")
         return StoreResponse(
             id=uuid.UUID(store['id']),
             name=store['name'],
@@ -39,14 +48,13 @@ async def create_store(name: str):
             detail=f"Internal server error: {str(e)}"
         )
 
-@router.get("/{store_id}/claims")
-async def get_store_claims(store_id: uuid.UUID, limit: int = 50):
+@router.get("/{store_id}/claims", dependencies=[Depends(require_store_access)])
+async def get_store_claims(request: Request, store_id: uuid.UUID, limit: int = 50,
+                           claim_crud: ClaimCRUD = Depends(get_claim_crud)):
     """Get all claims for a specific store"""
     try:
-        from crud.crud_claim import ClaimCRUD
-        claim_crud = ClaimCRUD()
         claims = await claim_crud.get_claims_by_store(store_id, limit)
-        return {"store_id": store_id, "claims": claims, "total": len(claims)}
+        return fast_response(request, {"store_id": store_id, "claims": claims, "total": len(claims)})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,16 +1,16 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 import uuid
 
 from schemas import UserResponse
 from crud.crud_customer import CustomerCRUD
+from crud.crud_claim import ClaimCRUD
+from core.responses import fast_response
+from core.container import get_customer_crud, get_claim_crud
 
 router = APIRouter(prefix="/api/v1/users", tags=["users"])
 
-# Initialize services
-customer_crud = CustomerCRUD()
-
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user(user_id: uuid.UUID):
+async def get_user(user_id: uuid.UUID, customer_crud: CustomerCRUD = Depends(get_customer_crud)):
     """Get user information and statistics"""
     try:
         user_stats = await customer_crud.get_user_stats(user_id)
@@ -27,13 +27,12 @@ async def get_user(user_id: uuid.UUID):
         )
 
 @router.get("/{user_id}/claims")
-async def get_user_claims(user_id: uuid.UUID, limit: int = 50):
+async def get_user_claims(request: Request, user_id: uuid.UUID, limit: int = 50,
+                          claim_crud: ClaimCRUD = Depends(get_claim_crud)):
     """Get all claims for a specific user"""
     try:
-        from crud.crud_claim import ClaimCRUD
-        claim_crud = ClaimCRUD()
         claims = await claim_crud.get_claims_by_user(user_id, limit)
-        return {"user_id": user_id, "claims": claims, "total": len(claims)}
+        return fast_response(request, {"user_id": user_id, "claims": claims, "total": len(claims)})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,11 +1,21 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 import uuid
 from core.supabase_client import get_supabase_client
 from services.risk_score_cache import risk_score_cache
+from services.data_versions import data_versions
+from core.conditional import conditional_get
+from core.responses import fast_response
+from core.auth import require_platform_key
 
-router = APIRouter(prefix="/api/v1/admin/users", tags=["admin-users"])
+# Admin routes: merchant (store-bound) keys are refused, as in admin_api
+router = APIRouter(prefix="/api/v1/admin/users", tags=["admin-users"], dependencies=[Depends(require_platform_key)])
+
+# Bumped by the user's claim writes and risk score updates
+USER_ETAG = conditional_get(
+    lambda request: data_versions.tag("user", data_versions.user_version(request.path_params["user_id"]))
+)
 
 @router.get("/list")
 async def get_users_list(
@@ -184,8 +194,8 @@ async def search_users(
         # Return the error message to help diagnose (can be narrowed later)
         raise HTTPException(status_code=500, detail=f"Failed to search users: {type(e).__name__}: {str(e)}")
 
-@router.get("/{user_id}/details")
-async def get_user_details(user_id: str):
+@router.get("/{user_id}/details", dependencies=[USER_ETAG])
+async def get_user_details(request: Request, user_id: str):
     """Get detailed user information with dispute history"""
     supabase = get_supabase_client()
     
@@ -243,7 +253,7 @@ async def get_user_details(user_id: str):
             calculated_risk_score = user["risk_score"] if processed_claims else None  # N/A if no claims
             calculated_is_flagged = user["is_flagged"] if processed_claims else False
         
-        return {
+        return fast_response(request, {
             "user": {
                 "id": user["id"],
                 "full_name": user["full_name"],
@@ -257,7 +267,7 @@ async def get_user_details(user_id: str):
                 "total_claim_value": total_value
             },
             "claims": processed_claims
-        }
+        })
         
     except HTTPException:
         raise
@@ -0,0 +1,128 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from typing import Optional
+from datetime import datetime
+import asyncio
+import uuid
+
+from schemas import WebhookEndpointCreate, ClaimOutcomeBatch
+from core.auth import get_api_key_identity, require_platform_key, scoped_store_id
+from core.outbound import check_outbound_url_async, UnsafeURLError
+from core.supabase_client import get_supabase_client
+from core.container import get_claim_crud
+from crud.crud_claim import ClaimCRUD
+from services.webhooks import webhook_dispatcher, EVENT_TYPES
+from services.outcome_statistics import outcome_statistics
+
+router = APIRouter(prefix="/api/v1/webhooks", tags=["webhooks"])
+
+@router.post("/endpoints", status_code=status.HTTP_201_CREATED)
+async def create_webhook_endpoint(payload: WebhookEndpointCreate, request: Request):
+    """Register a merchant endpoint; the signing secret is only returned once"""
+    # A merchant key may only register endpoints for its own store
+    store_id = scoped_store_id(request, payload.store_id)
+    try:
+        await check_outbound_url_async(str(payload.url))
+    except UnsafeURLError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid webhook url: {e}"
+        )
+    unknown = [event for event in payload.events or [] if event not in EVENT_TYPES]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown event types: {', '.join(unknown)}"
+        )
+    try:
+        record = {
+            "id": str(uuid.uuid4()),
+            "store_id": store_id,
+            "url": str(payload.url),
+            "secret": webhook_dispatcher.new_secret(),
+            "events": payload.events or [],
+            "enabled": True,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        await asyncio.to_thread(lambda: get_supabase_client().table("webhook_endpoints").insert(record).execute())
+        webhook_dispatcher.invalidate_endpoints(record["store_id"])
+        return record
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create webhook endpoint: {str(e)}"
+        )
+
+@router.get("/endpoints")
+async def list_webhook_endpoints(request: Request, store_id: Optional[uuid.UUID] = None):
+    """List registered endpoints (without their secrets); a merchant key sees only its own"""
+    store_id = scoped_store_id(request, store_id)
+    try:
+        def fetch():
+            query = get_supabase_client().table("webhook_endpoints").select("id, store_id, url, events, enabled, created_at")
+            if store_id:
+                query = query.eq("store_id", store_id)
+            return query.execute().data or []
+        endpoints = await asyncio.to_thread(fetch)
+        return {"endpoints": endpoints, "total": len(endpoints)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to list webhook endpoints: {str(e)}"
+        )
+
+@router.delete("/endpoints/{endpoint_id}")
+async def disable_webhook_endpoint(endpoint_id: uuid.UUID, request: Request):
+    """Stop sending events to an endpoint; another store's endpoint is reported as not found"""
+    store_id = scoped_store_id(request, None)
+    try:
+        def disable():
+            query = get_supabase_client().table("webhook_endpoints").update({"enabled": False}).eq(
+                "id", str(endpoint_id)
+            )
+            if store_id:
+                query = query.eq("store_id", store_id)
+            return query.execute()
+        response = await asyncio.to_thread(disable)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to disable webhook endpoint: {str(e)}"
+        )
+    if not response.data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Webhook endpoint {endpoint_id} not found"
+        )
+    webhook_dispatcher.invalidate_endpoints(response.data[0].get("store_id"))
+    return {"id": str(endpoint_id), "enabled": False}
+
+@router.get("/stats", dependencies=[Depends(require_platform_key)])
+async def get_webhook_stats():
+    """Get delivery counters and per-endpoint backlog"""
+    return webhook_dispatcher.get_stats()
+
+@router.post("/outcomes")
+async def report_claim_outcomes(payload: ClaimOutcomeBatch, request: Request,
+                                claim_crud: ClaimCRUD = Depends(get_claim_crud)):
+    """
+    Record final outcomes (APPROVED/DENIED) reported by a merchant, in bulk
+
+    Feeds the outcome statistics. A merchant key can only update its own store's claims.
+    """
+    # Later entries for the same claim win
+    statuses = {str(outcome.claim_id): outcome.status for outcome in payload.outcomes}
+    identity = get_api_key_identity(request)
+    store_id = identity.get("store_id") if identity else None
+    try:
+        result = await claim_crud.update_claim_statuses(statuses, store_id=store_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to apply claim outcomes: {str(e)}"
+        )
+    return {"received": len(payload.outcomes), **result}
+
+@router.get("/outcomes/stats")
+async def get_outcome_stats(limit: int = 20):
+    """Get learned denial rates per category, rule signal and fraud pattern"""
+    return outcome_statistics.get_stats(limit)
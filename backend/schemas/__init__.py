@@ -5,6 +5,8 @@ from .store import Store, StoreCreate, StoreResponse
 from .item_data import ItemData, ItemDataResponse
 from .claim import Claim, ClaimCreate, ClaimResponse, ClaimUpdateStatus, ClaimStatus
 from .claim_submission import ClaimContext, ClaimSubmissionPayload
+from .api_key import ApiKeyCreate
+from .webhook import WebhookEndpointCreate, ClaimOutcome, ClaimOutcomeBatch
 
 __all__ = [
     # Customer models
@@ -24,5 +26,11 @@ __all__ = [
     "Claim", "ClaimCreate", "ClaimResponse", "ClaimUpdateStatus", "ClaimStatus",
     
     # Submission models
-    "ClaimContext", "ClaimSubmissionPayload"
+    "ClaimContext", "ClaimSubmissionPayload",
+
+    # API key models
+    "ApiKeyCreate",
+
+    # Webhook models
+    "WebhookEndpointCreate", "ClaimOutcome", "ClaimOutcomeBatch"
 ]
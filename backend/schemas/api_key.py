@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from typing import Literal, Optional
+import uuid
+
+class ApiKeyCreate(BaseModel):
+    name: str
+    mode: Literal["test", "live"] = "test"
+    # Merchant keys are bound to one store; platform keys have none
+    store_id: Optional[uuid.UUID] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from enum import Enum
 import uuid
@@ -32,6 +32,10 @@ class ClaimResponse(BaseModel):
     risk_score: int
     is_flagged: bool
     message: str
+    # Two-phase scoring: "preliminary" rule-based result, refined later by job refinement_job_id
+    scoring_phase: Optional[str] = None
+    decision: Optional[str] = None
+    refinement_job_id: Optional[str] = None
 
 class ClaimUpdateStatus(BaseModel):
     status: ClaimStatus
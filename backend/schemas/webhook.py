@@ -0,0 +1,20 @@
+from pydantic import BaseModel, Field, HttpUrl
+from typing import List, Optional
+import uuid
+from .claim import ClaimStatus
+
+# Largest outcome batch accepted in one request
+MAX_OUTCOMES_PER_BATCH = 5000
+
+class WebhookEndpointCreate(BaseModel):
+    store_id: uuid.UUID
+    url: HttpUrl
+    # Empty means every event type
+    events: Optional[List[str]] = None
+
+class ClaimOutcome(BaseModel):
+    claim_id: uuid.UUID
+    status: ClaimStatus
+
+class ClaimOutcomeBatch(BaseModel):
+    outcomes: List[ClaimOutcome] = Field(min_length=1, max_length=MAX_OUTCOMES_PER_BATCH)
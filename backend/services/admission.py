@@ -0,0 +1,150 @@
+"""
+Admission Control
+Sheds low-priority requests early when the event loop or the in-flight queue is overloaded
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+PRIORITIES = ("critical", "normal", "low")
+
+class AdmissionController:
+    """
+    Caps in-flight requests and rejects work it cannot finish in time.
+
+    Three signals drive the overload level: event-loop lag (how late a
+    periodic timer fires), time spent waiting for an in-flight slot, and the
+    in-flight count itself. At level 1 low-priority routes (analytics, admin
+    lists) are shed; at level 2 normal routes too. Critical routes (claim
+    submission) are never shed: they jump the slot queue and are admitted
+    over the cap if they waited too long.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ADMISSION_CONTROL_ENABLED", "false").lower() == "true"
+        self.max_in_flight = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "256"))
+        self.lag_low_ms = float(os.getenv("ADMISSION_LAG_LOW_MS", "50"))
+        self.lag_high_ms = float(os.getenv("ADMISSION_LAG_HIGH_MS", "250"))
+        self.wait_low_ms = float(os.getenv("ADMISSION_QUEUE_WAIT_LOW_MS", "100"))
+        self.wait_high_ms = float(os.getenv("ADMISSION_QUEUE_WAIT_HIGH_MS", "500"))
+        # How long a request may wait for a slot before it is shed (normal) or let through (critical)
+        self.max_wait_seconds = {
+            "normal": float(os.getenv("ADMISSION_NORMAL_MAX_WAIT_MS", "500")) / 1000,
+            "critical": float(os.getenv("ADMISSION_CRITICAL_MAX_WAIT_MS", "2000")) / 1000,
+        }
+        self.retry_after_seconds = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "2"))
+        self.sample_interval = float(os.getenv("ADMISSION_LAG_SAMPLE_MS", "100")) / 1000
+
+        self.in_flight = 0
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {"critical": deque(), "normal": deque()}
+        # Exponentially weighted moving averages, in milliseconds
+        self.lag_ms = 0.0
+        self.wait_ms = 0.0
+        self._monitor_task: Optional[asyncio.Task] = None
+        self.stats = {priority: {"admitted": 0, "shed": 0} for priority in PRIORITIES}
+        self.stats["critical"]["over_cap"] = 0
+
+    def start(self):
+        """Start sampling event-loop lag (once per worker)"""
+        if self.enabled and self._monitor_task is None:
+            self._monitor_task = asyncio.create_task(self._monitor_lag())
+
+    async def _monitor_lag(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.sample_interval)
+            lag = max(0.0, (time.perf_counter() - started - self.sample_interval) * 1000)
+            # Rise fast, decay slowly, so a burst of lag is acted on at once
+            weight = 0.5 if lag > self.lag_ms else 0.1
+            self.lag_ms += weight * (lag - self.lag_ms)
+            # Queue wait only updates on admissions; let it decay while idle
+            if not any(self.waiters.values()):
+                self.wait_ms *= 0.9
+
+    def _record_wait(self, seconds: float):
+        self.wait_ms += 0.2 * (seconds * 1000 - self.wait_ms)
+
+    def overload_level(self) -> int:
+        if self.lag_ms >= self.lag_high_ms or self.wait_ms >= self.wait_high_ms:
+            return 2
+        if self.lag_ms >= self.lag_low_ms or self.wait_ms >= self.wait_low_ms or self.in_flight >= self.max_in_flight:
+            return 1
+        return 0
+
+    def should_shed(self, priority: str) -> bool:
+        level = self.overload_level()
+        return (priority == "low" and level >= 1) or (priority == "normal" and level >= 2)
+
+    async def admit(self, priority: str) -> bool:
+        """Take an in-flight slot; False means the request should be rejected"""
+        if priority != "critical" and self.should_shed(priority):
+            self.stats[priority]["shed"] += 1
+            return False
+
+        if self.in_flight < self.max_in_flight:
+            self.in_flight += 1
+            self._record_wait(0.0)
+            self.stats[priority]["admitted"] += 1
+            return True
+        if priority == "low":
+            self.stats[priority]["shed"] += 1
+            return False
+
+        # Wait for a slot handed over by release()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters[priority].append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait({waiter}, timeout=self.max_wait_seconds[priority])
+        except asyncio.CancelledError:
+            # Client went away; pass on a slot that was already handed over
+            if waiter.done():
+                self.release()
+            else:
+                waiter.cancel()
+                self.waiters[priority].remove(waiter)
+            raise
+        if not waiter.done():
+            waiter.cancel()
+            self.waiters[priority].remove(waiter)
+        self._record_wait(time.perf_counter() - started)
+
+        if waiter.cancelled():
+            if priority == "normal":
+                self.stats[priority]["shed"] += 1
+                return False
+            # Never turn a claim submission away; run it over the cap instead
+            self.in_flight += 1
+            self.stats["critical"]["over_cap"] += 1
+        self.stats[priority]["admitted"] += 1
+        return True
+
+    def release(self):
+        """Free a slot, handing it straight to the oldest critical, then normal, waiter"""
+        for priority in ("critical", "normal"):
+            waiters = self.waiters[priority]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(True)
+                    return
+        self.in_flight -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get overload signals and per-priority counters"""
+        return {
+            "enabled": self.enabled,
+            "overload_level": self.overload_level(),
+            "event_loop_lag_ms": round(self.lag_ms, 1),
+            "queue_wait_ms": round(self.wait_ms, 1),
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "waiting": {priority: len(waiters) for priority, waiters in self.waiters.items()},
+            "priorities": self.stats
+        }
+
+# Global controller, one per worker
+admission_controller = AdmissionController()
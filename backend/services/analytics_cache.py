@@ -0,0 +1,119 @@
+"""
+Analytics Response Cache
+Caches computed analytics responses until the next claim write
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from services.claim_events import claim_events
+
+CacheKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+class AnalyticsCache:
+    """
+    Result cache keyed by endpoint and parameters.
+
+    Entries are tagged with the generation counter at computation time; claim
+    inserts and status updates bump the counter, which invalidates everything
+    computed before them. A TTL bounds staleness for writes this process never
+    sees (other workers, scripts, the SQL editor). Concurrent misses for the
+    same key share a single computation.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self.ttl_seconds = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+        self.max_entries = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "256"))
+        self.entries: "OrderedDict[CacheKey, Tuple[int, float, Any]]" = OrderedDict()
+        self.inflight: Dict[CacheKey, asyncio.Future] = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "invalidations": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def make_key(endpoint: str, params: Optional[Dict[str, Any]] = None) -> CacheKey:
+        return endpoint, tuple(sorted((params or {}).items()))
+
+    def bump(self, *_):
+        """Invalidate all cached results (claim inserted or status changed)"""
+        self.generation += 1
+        self.stats["invalidations"] += 1
+
+    def _lookup(self, key: CacheKey) -> Tuple[bool, Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        generation, expires_at, value = entry
+        if generation != self.generation or expires_at < time.monotonic():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key: CacheKey, generation: int, value: Any):
+        self.entries[key] = (generation, time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get_or_compute(self, endpoint: str, params: Optional[Dict[str, Any]],
+                             compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached result for (endpoint, params) or compute it once"""
+        key = self.make_key(endpoint, params)
+        found, value = self._lookup(key)
+        if found:
+            self.stats["hits"] += 1
+            return value
+
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        self.stats["misses"] += 1
+        generation = self.generation
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception nobody else awaited is not logged
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            # Results that raced with a write are served but not cached
+            if generation == self.generation:
+                self._store(key, generation, value)
+            return value
+        finally:
+            self.inflight.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss metrics"""
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "hit_ratio": round((self.stats["hits"] + self.stats["coalesced"]) / lookups, 4) if lookups else 0.0,
+            "entries": len(self.entries),
+            "inflight": len(self.inflight),
+            "generation": self.generation,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+# Global cache instance, invalidated by every claim write
+analytics_cache = AnalyticsCache()
+claim_events.on_claim_created(analytics_cache.bump)
+claim_events.on_status_changed(analytics_cache.bump)
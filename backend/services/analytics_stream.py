@@ -0,0 +1,220 @@
+"""
+Analytics Stream
+Server-Sent Events fan-out of dashboard metric deltas from the claim write path
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+from services.claim_events import claim_events
+
+class _Subscriber:
+    """One open stream: a bounded queue plus the id of the last event it was sent"""
+
+    def __init__(self, queue_size: int, store_id: Optional[str], last_seq: int):
+        # None entries only wake the reader up after an overflow
+        self.queue: "asyncio.Queue[Optional[Tuple[int, Optional[str], str]]]" = asyncio.Queue(maxsize=queue_size)
+        self.store_id = store_id
+        self.last_seq = last_seq
+        # Set when the queue overflowed; the reader replays from the ring buffer
+        self.lagging = False
+
+class AnalyticsStream:
+    """
+    Broadcasts claim deltas to every open dashboard.
+
+    Each write is serialized once into a ring buffer entry and pushed onto the
+    per-connection queues without awaiting. A slow client whose queue fills up
+    is marked lagging and catches up from the ring buffer; a client too far
+    behind (or resuming across a restart) gets a `resync` event and should
+    refetch /api/v1/analytics/dashboard. Event ids are `<boot id>-<sequence>`
+    and can be passed back as Last-Event-ID or ?cursor= to resume.
+    """
+
+    def __init__(self):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.buffer_size = int(os.getenv("ANALYTICS_STREAM_BUFFER", "1000"))
+        self.queue_size = int(os.getenv("ANALYTICS_STREAM_QUEUE_SIZE", "100"))
+        self.heartbeat_seconds = float(os.getenv("ANALYTICS_STREAM_HEARTBEAT_SECONDS", "15"))
+        # (seq, store_id, encoded SSE frame)
+        self.buffer: Deque[Tuple[int, Optional[str], str]] = deque(maxlen=self.buffer_size)
+        self.subscribers: Set[_Subscriber] = set()
+        # Last known status per claim, to turn status updates into -1/+1 deltas
+        self.claim_statuses: "OrderedDict[str, str]" = OrderedDict()
+        self.max_tracked_claims = 10000
+        self.stats = {"published": 0, "delivered": 0, "lagged": 0, "resyncs": 0}
+
+    def _event_id(self, seq: int) -> str:
+        return f"{self.boot_id}-{seq}"
+
+    def parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        """Sequence number of a cursor from this process, None if unknown or from another boot"""
+        if not cursor:
+            return None
+        boot_id, _, seq = cursor.partition("-")
+        if boot_id != self.boot_id or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _remember_status(self, claim_id: str, status: Optional[str]):
+        if not status:
+            return
+        self.claim_statuses[claim_id] = status
+        self.claim_statuses.move_to_end(claim_id)
+        while len(self.claim_statuses) > self.max_tracked_claims:
+            self.claim_statuses.popitem(last=False)
+
+    def publish(self, event: str, data: Dict[str, Any], store_id: Optional[str] = None):
+        """Append an event to the ring buffer and fan it out without blocking"""
+        self.seq += 1
+        frame = f"id: {self._event_id(self.seq)}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        entry = (self.seq, store_id, frame)
+        self.buffer.append(entry)
+        self.stats["published"] += 1
+
+        for subscriber in self.subscribers:
+            if subscriber.lagging or (subscriber.store_id and subscriber.store_id != store_id):
+                continue
+            try:
+                subscriber.queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                # Drop the backlog and wake the reader, which replays from the ring buffer instead
+                subscriber.lagging = True
+                self.stats["lagged"] += 1
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(None)
+
+    def on_claim_created(self, claim: Dict[str, Any]):
+        claim_id = str(claim.get("id"))
+        status = claim.get("status")
+        self._remember_status(claim_id, status)
+
+        categories: Dict[str, int] = {}
+        claim_data = claim.get("claim_data") or []
+        for item in claim_data if isinstance(claim_data, list) else []:
+            if isinstance(item, dict) and item.get("category"):
+                category = item["category"].title()
+                categories[category] = categories.get(category, 0) + 1
+
+        store_id = str(claim.get("store_id")) if claim.get("store_id") else None
+        self.publish("claim_created", {
+            "claimId": claim_id,
+            "storeId": store_id,
+            "createdAt": claim.get("created_at"),
+            "deltas": {
+                "totalDisputes": 1,
+                "statuses": {status: 1} if status else {},
+                "categories": categories
+            }
+        }, store_id)
+
+    def on_status_changed(self, claim: Dict[str, Any], previous_status: Optional[str] = None):
+        claim_id = str(claim.get("id"))
+        status = claim.get("status")
+        previous_status = previous_status or self.claim_statuses.get(claim_id)
+        self._remember_status(claim_id, status)
+        if previous_status == status:
+            return
+
+        statuses = {status: 1} if status else {}
+        if previous_status:
+            statuses[previous_status] = -1
+        store_id = str(claim.get("store_id")) if claim.get("store_id") else None
+        self.publish("status_changed", {
+            "claimId": claim_id,
+            "storeId": store_id,
+            "createdAt": claim.get("created_at"),
+            # None when this process never saw the claim's earlier status
+            "previousStatus": previous_status,
+            "status": status,
+            "deltas": {
+                "approvedDisputes": statuses.get("APPROVED", 0),
+                "statuses": statuses
+            }
+        }, store_id)
+
+    def _replay(self, subscriber: _Subscriber) -> Optional[List[Tuple[int, str]]]:
+        """Buffered (seq, frame) pairs after the subscriber's cursor, None if the buffer no longer reaches back"""
+        if self.buffer and self.buffer[0][0] > subscriber.last_seq + 1:
+            return None
+        return [
+            (seq, frame) for seq, store_id, frame in self.buffer
+            if seq > subscriber.last_seq and (not subscriber.store_id or subscriber.store_id == store_id)
+        ]
+
+    def _resync_frame(self, reason: str) -> str:
+        data = json.dumps({"reason": reason, "at": datetime.now(timezone.utc).isoformat()})
+        return f"id: {self._event_id(self.seq)}\nevent: resync\ndata: {data}\n\n"
+
+    async def subscribe(self, cursor: Optional[str] = None, store_id: Optional[str] = None,
+                        is_disconnected=None) -> AsyncIterator[str]:
+        """Yield SSE frames for one client until it disconnects"""
+        resume_seq = self.parse_cursor(cursor)
+        subscriber = _Subscriber(self.queue_size, store_id, resume_seq if resume_seq is not None else self.seq)
+        self.subscribers.add(subscriber)
+        try:
+            # A resuming client keeps its own Last-Event-ID until the replay moves it forward
+            ready_id = f"id: {self._event_id(self.seq)}\n" if resume_seq is None else ""
+            yield f"retry: 3000\n{ready_id}event: ready\ndata: {{}}\n\n"
+            if cursor and resume_seq is None:
+                self.stats["resyncs"] += 1
+                yield self._resync_frame("unknown cursor")
+                subscriber.last_seq = self.seq
+            elif resume_seq is not None:
+                subscriber.lagging = True
+
+            while True:
+                if subscriber.lagging:
+                    # Catch up from the ring buffer, then go back to live delivery
+                    # Events published meanwhile are queued again and deduplicated by sequence
+                    subscriber.lagging = False
+                    frames = self._replay(subscriber)
+                    if frames is None:
+                        self.stats["resyncs"] += 1
+                        subscriber.last_seq = self.seq
+                        yield self._resync_frame("fell behind")
+                        continue
+                    for seq, frame in frames:
+                        subscriber.last_seq = seq
+                        self.stats["delivered"] += 1
+                        yield frame
+                    continue
+
+                try:
+                    entry = await asyncio.wait_for(subscriber.queue.get(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if entry is None:
+                    continue
+                seq, _, frame = entry
+                if seq <= subscriber.last_seq:
+                    continue
+                subscriber.last_seq = seq
+                self.stats["delivered"] += 1
+                yield frame
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get fan-out metrics"""
+        return {
+            **self.stats,
+            "subscribers": len(self.subscribers),
+            "lagging_subscribers": sum(1 for subscriber in self.subscribers if subscriber.lagging),
+            "buffered_events": len(self.buffer),
+            "cursor": self._event_id(self.seq)
+        }
+
+# Global stream, fed by every claim write
+analytics_stream = AnalyticsStream()
+claim_events.on_claim_created(analytics_stream.on_claim_created)
+claim_events.on_status_changed(analytics_stream.on_status_changed)
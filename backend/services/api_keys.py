@@ -0,0 +1,204 @@
+"""
+API Keys
+Salted-hash API key verification behind a bounded in-memory cache
+"""
+
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from core.supabase_client import get_supabase_client
+from services.data_versions import data_versions
+
+KEY_MODES = ("test", "live")
+# "sk_live_" plus the first characters of the secret, stored in clear to find the row
+PREFIX_LENGTH = 16
+
+class ApiKeyStore:
+    """
+    Issues and verifies `sk_test_...` / `sk_live_...` keys (setup/api_keys.sql).
+
+    Only a per-key salted SHA-256 of each key is stored. Verified keys are cached
+    in memory for API_KEY_CACHE_TTL_SECONDS and unknown keys for
+    API_KEY_NEGATIVE_TTL_SECONDS, so an authenticated request costs one keyed
+    hash and a dict lookup. Revoking a key bumps the cache version and the
+    shared "api_keys" data version, which drops every cached verdict in this
+    process at once and in the other workers on their next lookup.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("API_KEY_AUTH_ENABLED", "false").lower() == "true"
+        self.ttl_seconds = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "60"))
+        self.negative_ttl_seconds = float(os.getenv("API_KEY_NEGATIVE_TTL_SECONDS", "30"))
+        self.max_entries = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+        self.version = 0
+        # Keyed digest of the presented key -> (generation, expires_at, identity or None)
+        self.entries: "OrderedDict[bytes, Tuple[Tuple[int, int], float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self.inflight: Dict[bytes, asyncio.Future] = {}
+        # Cache keys are hashed with a per-process secret so plaintext keys are never kept
+        self._cache_secret = secrets.token_bytes(16)
+        self.stats = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "rejected": 0,
+            "revocations": 0,
+            "lookup_errors": 0,
+        }
+
+    @staticmethod
+    def hash_key(api_key: str, salt: str) -> str:
+        return hashlib.sha256(salt.encode() + api_key.encode()).hexdigest()
+
+    @staticmethod
+    def is_well_formed(api_key: str) -> bool:
+        return any(api_key.startswith(f"sk_{mode}_") for mode in KEY_MODES) and len(api_key) > PREFIX_LENGTH
+
+    def _cache_key(self, api_key: str) -> bytes:
+        return hashlib.blake2b(api_key.encode(), key=self._cache_secret, digest_size=16).digest()
+
+    def _generation(self) -> Tuple[int, int]:
+        """Local cache version plus the revocation counter shared by all workers"""
+        return self.version, data_versions.scope_version("api_keys")
+
+    def _lookup_cached(self, cache_key: bytes) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        entry = self.entries.get(cache_key)
+        if entry is None:
+            return False, None
+        generation, expires_at, identity = entry
+        if generation != self._generation() or expires_at < time.monotonic():
+            del self.entries[cache_key]
+            return False, None
+        self.entries.move_to_end(cache_key)
+        return True, identity
+
+    def _remember(self, cache_key: bytes, generation: Tuple[int, int], identity: Optional[Dict[str, Any]]):
+        ttl = self.ttl_seconds if identity is not None else self.negative_ttl_seconds
+        self.entries[cache_key] = (generation, time.monotonic() + ttl, identity)
+        self.entries.move_to_end(cache_key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _fetch_identity(self, api_key: str) -> Optional[Dict[str, Any]]:
+        """Find the key's row by prefix and check its salted hash"""
+        rows = get_supabase_client().table("api_keys").select(
+            "id, name, mode, store_id, salt, key_hash"
+        ).eq("prefix", api_key[:PREFIX_LENGTH]).is_("revoked_at", "null").execute().data or []
+        for row in rows:
+            if hmac.compare_digest(row["key_hash"], self.hash_key(api_key, row["salt"])):
+                return {
+                    "key_id": row["id"],
+                    "name": row.get("name"),
+                    "mode": row["mode"],
+                    "livemode": row["mode"] == "live",
+                    "store_id": row.get("store_id")
+                }
+        return None
+
+    async def verify(self, api_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Identity of a valid key, None for a missing, unknown or revoked one"""
+        if not api_key or not self.is_well_formed(api_key):
+            self.stats["rejected"] += 1
+            return None
+
+        cache_key = self._cache_key(api_key)
+        found, identity = self._lookup_cached(cache_key)
+        if found:
+            self.stats["hits" if identity is not None else "negative_hits"] += 1
+            return identity
+
+        inflight = self.inflight.get(cache_key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The leading lookup was cancelled (its client went away); look the key up ourselves
+                return await self.verify(api_key)
+
+        self.stats["misses"] += 1
+        generation = self._generation()
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[cache_key] = future
+        try:
+            identity = await asyncio.to_thread(self._fetch_identity, api_key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            self.stats["lookup_errors"] += 1
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(identity)
+            # A revocation that raced the lookup wins
+            if generation == self._generation():
+                self._remember(cache_key, generation, identity)
+            return identity
+        finally:
+            self.inflight.pop(cache_key, None)
+
+    def invalidate(self):
+        """Drop every cached verdict in this process"""
+        self.version += 1
+
+    def create_key(self, name: str, mode: str = "test", store_id: Optional[str] = None) -> Dict[str, Any]:
+        """Issue a new key; the plaintext is only ever returned here"""
+        if mode not in KEY_MODES:
+            raise ValueError(f"mode must be one of {', '.join(KEY_MODES)}")
+        api_key = f"sk_{mode}_{secrets.token_urlsafe(24)}"
+        salt = secrets.token_hex(16)
+        record = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "mode": mode,
+            "store_id": store_id,
+            "prefix": api_key[:PREFIX_LENGTH],
+            "salt": salt,
+            "key_hash": self.hash_key(api_key, salt),
+            "created_at": datetime.utcnow().isoformat()
+        }
+        get_supabase_client().table("api_keys").insert(record).execute()
+        return {
+            "id": record["id"],
+            "name": name,
+            "mode": mode,
+            "store_id": store_id,
+            "prefix": record["prefix"],
+            "created_at": record["created_at"],
+            "api_key": api_key
+        }
+
+    def revoke_key(self, key_id: str) -> bool:
+        """Revoke a key; cached verdicts are dropped in every worker"""
+        response = get_supabase_client().table("api_keys").update(
+            {"revoked_at": datetime.utcnow().isoformat()}
+        ).eq("id", key_id).execute()
+        self.invalidate()
+        data_versions.bump("api_keys")
+        self.stats["revocations"] += 1
+        return bool(response.data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache hit/miss metrics"""
+        lookups = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "hit_ratio": round((self.stats["hits"] + self.stats["negative_hits"]) / lookups, 4) if lookups else 0.0,
+            "entries": len(self.entries),
+            "version": self.version,
+            "ttl_seconds": self.ttl_seconds,
+            "negative_ttl_seconds": self.negative_ttl_seconds
+        }
+
+# Global key store
+api_key_store = ApiKeyStore()
@@ -0,0 +1,68 @@
+"""
+Background Jobs
+The periodic and startup work each serving worker runs through the scheduler
+"""
+
+import asyncio
+import os
+from core.container import container
+from services.scheduler import Scheduler
+from services.risk_score_cache import risk_score_cache
+from services.risk_recompute import risk_recompute_engine
+from services.claim_item_store import claim_item_store
+from services.heavy_hitters import heavy_hitters
+from services.distinct_claimants import distinct_claimants
+from services.outcome_statistics import outcome_statistics
+from services.scoring_jobs import scoring_jobs
+from services.idempotency import idempotency_store
+
+async def _rebuild_rollups():
+    # The RPC call is synchronous; keep it off the event loop
+    await asyncio.to_thread(container.get("analytics_crud").rebuild_rollups)
+
+def register_background_jobs(scheduler: Scheduler):
+    """Register the jobs this worker should run; disabled features get none"""
+    # With several workers only the owner of the shared segment scores, on a process pool.
+    # Its own lane, so a long recompute never holds a shared slot the refreshes need
+    if risk_score_cache.should_warm_up():
+        cron = risk_recompute_engine.cron
+        interval = None if cron else (risk_recompute_engine.interval_seconds or None)
+        scheduler.add_job("risk_recompute", lambda: risk_recompute_engine.run_scheduled(reason="scheduled"),
+                          interval=interval, cron=cron, run_at_start=True,
+                          timeout=risk_recompute_engine.timeout_seconds, lane="risk_recompute")
+
+    # One-off startup loads are uncapped (lane=None) so they do not queue behind each other
+    # Optional columnar store for analytics (ANALYTICS_COLUMNAR=true)
+    if claim_item_store.enabled:
+        scheduler.add_job("claim_item_store.load", claim_item_store.load, run_at_start=True, lane=None)
+        if claim_item_store.refresh_seconds > 0:
+            scheduler.add_job("claim_item_store.refresh", claim_item_store.refresh,
+                              interval=claim_item_store.refresh_seconds, jitter=5.0)
+        if claim_item_store.snapshot_seconds > 0:
+            # Every worker shares the snapshot path, so one writes it per interval
+            scheduler.add_job("claim_item_store.snapshot", claim_item_store.snapshot,
+                              interval=claim_item_store.snapshot_seconds, jitter=30.0, singleton=True)
+
+    # Optional top-k and distinct-claimant sketches
+    if heavy_hitters.enabled:
+        scheduler.add_job("heavy_hitters.load", heavy_hitters.load, run_at_start=True, lane=None)
+    if distinct_claimants.enabled:
+        scheduler.add_job("distinct_claimants.load", distinct_claimants.load, run_at_start=True, lane=None)
+
+    # Denial rates learned from merchant outcomes (OUTCOME_STATS_ENABLED=true)
+    if outcome_statistics.enabled:
+        scheduler.add_job("outcome_statistics.refresh", outcome_statistics.refresh,
+                          interval=outcome_statistics.refresh_seconds, run_at_start=True, jitter=10.0, timeout=60.0)
+
+    # Retention for results shared between workers
+    if scoring_jobs.persist and scoring_jobs.purge_interval_seconds > 0:
+        scheduler.add_job("scoring_jobs.purge", scoring_jobs.purge_expired,
+                          interval=scoring_jobs.purge_interval_seconds, jitter=30.0, timeout=60.0, singleton=True)
+    if idempotency_store.enabled and idempotency_store.persist and idempotency_store.purge_interval_seconds > 0:
+        scheduler.add_job("idempotency.purge", idempotency_store.purge_expired,
+                          interval=idempotency_store.purge_interval_seconds, jitter=30.0, timeout=60.0, singleton=True)
+
+    # Nightly rollup rebuild to repair drift, e.g. "30 3 * * *" (ANALYTICS_ROLLUP_REBUILD_CRON)
+    rollup_cron = os.getenv("ANALYTICS_ROLLUP_REBUILD_CRON")
+    if rollup_cron:
+        scheduler.add_job("analytics.rebuild_rollups", _rebuild_rollups, cron=rollup_cron, jitter=30.0, singleton=True)
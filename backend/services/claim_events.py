@@ -0,0 +1,48 @@
+"""
+Claim Events
+In-process notifications fired by the claim write path
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+
+ClaimHandler = Callable[[Dict[str, Any]], None]
+StatusHandler = Callable[[Dict[str, Any], Optional[str]], None]
+
+class ClaimEvents:
+    """
+    Fan-out of claim writes to in-memory consumers (caches, sketches, streams).
+
+    Handlers run synchronously on the writer's event loop and must be cheap;
+    a failing handler is logged and never breaks the write.
+    """
+
+    def __init__(self):
+        self._created_handlers: List[ClaimHandler] = []
+        self._status_handlers: List[StatusHandler] = []
+
+    def on_claim_created(self, handler: ClaimHandler) -> ClaimHandler:
+        self._created_handlers.append(handler)
+        return handler
+
+    def on_status_changed(self, handler: StatusHandler) -> StatusHandler:
+        self._status_handlers.append(handler)
+        return handler
+
+    def claim_created(self, claim: Dict[str, Any]):
+        """Notify consumers of a newly inserted claim row"""
+        for handler in self._created_handlers:
+            try:
+                handler(claim)
+            except Exception as e:
+                print(f"Error in claim created handler {handler.__name__}: {e}")
+
+    def status_changed(self, claim: Dict[str, Any], previous_status: Optional[str] = None):
+        """Notify consumers of a claim row whose status was updated"""
+        for handler in self._status_handlers:
+            try:
+                handler(claim, previous_status)
+            except Exception as e:
+                print(f"Error in claim status handler {handler.__name__}: {e}")
+
+# Global event hub
+claim_events = ClaimEvents()
@@ -0,0 +1,535 @@
+"""
+Columnar Claim Item Store
+In-process NumPy columns of every claimed item, used for vectorized analytics
+"""
+
+import asyncio
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Any, Tuple
+import numpy as np
+from core.supabase_client import get_supabase_client
+from services.claim_events import claim_events
+from services.data_versions import data_versions
+
+# Page size for bulk reads, matches PostgREST's default max-rows
+PAGE_SIZE = 1000
+STATUSES = ["PENDING", "APPROVED", "DENIED"]
+
+# (name, dtype) of the per-item and per-claim columns
+ITEM_COLUMNS = [
+    ("claim", np.int32),     # row in the claim columns
+    ("category", np.int32),  # -1 when the item has no category
+    ("item", np.int32),
+    ("price", np.float64),
+    ("quantity", np.int32),
+]
+# Indexed by item code
+ITEM_NAME_COLUMNS = [
+    ("category", np.int32),  # first category seen for the item name
+    ("last_seen", np.int64), # latest created_at of a claim with the item, epoch seconds
+]
+# Row numbers of one store's claims or items
+ROW_COLUMNS = [("row", np.int32)]
+CLAIM_COLUMNS = [
+    ("ts", np.int64),        # created_at, epoch seconds (UTC)
+    ("day", np.int32),       # created_at, days since 1970-01-01 (UTC)
+    ("store", np.int32),
+    ("user", np.int32),
+    ("status", np.int8),
+]
+
+def _parse_timestamp(value: str) -> int:
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+def _default_path() -> str:
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "claim_items")
+
+class _Dictionary:
+    """Dictionary encoding of a string column"""
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values: List[str] = list(values or [])
+        self.codes: Dict[str, int] = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+class _Columns:
+    """Growable set of equally sized NumPy columns"""
+
+    def __init__(self, spec: List[Tuple[str, Any]], capacity: int = 1024):
+        self.spec = spec
+        self.size = 0
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in spec}
+
+    def append(self, **values):
+        if self.size == len(self.arrays[self.spec[0][0]]):
+            self.reserve(self.size * 2)
+        for name, value in values.items():
+            self.arrays[name][self.size] = value
+        self.size += 1
+
+    def reserve(self, capacity: int):
+        # Also moves memory-mapped snapshot columns into RAM, with room to grow
+        capacity = max(capacity, self.size + self.size // 4)
+        for name, dtype in self.spec:
+            grown = np.empty(max(capacity, 1024), dtype=dtype)
+            grown[:self.size] = self.arrays[name][:self.size]
+            self.arrays[name] = grown
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name][:self.size]
+
+class ClaimItemStore:
+    """
+    One row per claimed item plus one row per claim, held as NumPy columns.
+
+    Strings (stores, users, categories, item names) are dictionary encoded; a
+    claim's status lives on the claim row so status updates are O(1). The store
+    loads once from Supabase (or from its memory-mapped snapshot plus a catch-up
+    of newer claims), then follows claim inserts and status changes through
+    claim_events. Writes made by other workers are picked up by the periodic
+    refresh: it catches up on new claims, and re-reads statuses when the shared
+    "claim_status" data version moved. One process at a time writes the
+    snapshot (an flock on <path>.lock); the others skip their save.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ANALYTICS_COLUMNAR", "false").lower() == "true"
+        self.path = os.getenv("ANALYTICS_COLUMNAR_PATH") or _default_path()
+        self.refresh_seconds = float(os.getenv("ANALYTICS_COLUMNAR_REFRESH_SECONDS", "60"))
+        self.snapshot_seconds = float(os.getenv("ANALYTICS_COLUMNAR_SNAPSHOT_SECONDS", "900"))
+        self.ready = False
+        self.last_load_ms: Optional[float] = None
+        self.loaded_from_snapshot = False
+        self._lock = threading.Lock()
+        # Shared claim_status version the statuses were last synced at
+        self._status_version: Optional[int] = None
+        self._reset()
+
+    def _reset(self):
+        self.items = _Columns(ITEM_COLUMNS)
+        self.claims = _Columns(CLAIM_COLUMNS)
+        self.claim_rows: Dict[str, int] = {}
+        self.claim_ids: List[str] = []
+        self.stores = _Dictionary()
+        self.users = _Dictionary()
+        self.categories = _Dictionary()
+        self.item_names = _Dictionary()
+        self.item_info = _Columns(ITEM_NAME_COLUMNS)
+        # Per-store partitions (store code -> row numbers) so store queries scale with the store
+        self.store_claims: Dict[int, _Columns] = {}
+        self.store_items: Dict[int, _Columns] = {}
+        self.watermark: Optional[str] = None
+
+    # Ingestion
+
+    def add_claim(self, claim: Dict[str, Any]) -> bool:
+        """Append one claim row and its items, False if it is already stored"""
+        claim_id = str(claim.get("id"))
+        created_at = claim.get("created_at")
+        if not created_at:
+            return False
+
+        claim_data = claim.get("claim_data") or []
+        if isinstance(claim_data, str):
+            try:
+                claim_data = json.loads(claim_data)
+            except ValueError:
+                claim_data = []
+
+        ts = _parse_timestamp(created_at)
+        status = claim.get("status")
+        with self._lock:
+            if claim_id in self.claim_rows:
+                return False
+            row = self.claims.size
+            store_code = self.stores.encode(str(claim.get("store_id")))
+            self.claims.append(
+                ts=ts,
+                day=ts // 86400,
+                store=store_code,
+                user=self.users.encode(str(claim.get("user_id"))),
+                status=STATUSES.index(status) if status in STATUSES else -1
+            )
+            self.claim_rows[claim_id] = row
+            self.claim_ids.append(claim_id)
+            self._partition(self.store_claims, store_code).append(row=row)
+
+            for item in claim_data if isinstance(claim_data, list) else []:
+                if not isinstance(item, dict) or "item_name" not in item:
+                    continue
+                category = item.get("category")
+                category_code = self.categories.encode(category.lower()) if category else -1
+                item_code = self.item_names.encode(item["item_name"])
+                if item_code == self.item_info.size:
+                    self.item_info.append(category=category_code, last_seen=ts)
+                elif ts > self.item_info.arrays["last_seen"][item_code]:
+                    self.item_info.arrays["last_seen"][item_code] = ts
+                self.items.append(
+                    claim=row,
+                    category=category_code,
+                    item=item_code,
+                    price=float(item.get("price") or 0),
+                    quantity=int(item.get("quantity") or 1)
+                )
+                # Partitions only ever point at rows that are fully written
+                self._partition(self.store_items, store_code).append(row=self.items.size - 1)
+
+            if self.watermark is None or created_at > self.watermark:
+                self.watermark = created_at
+        return True
+
+    @staticmethod
+    def _partition(partitions: Dict[int, _Columns], store_code: int) -> _Columns:
+        partition = partitions.get(store_code)
+        if partition is None:
+            partition = partitions[store_code] = _Columns(ROW_COLUMNS, capacity=64)
+        return partition
+
+    def _index_stores(self):
+        """Rebuild the per-store partitions from the store column (after loading a snapshot)"""
+        for partitions, store_codes in ((self.store_claims, self.claims["store"]),
+                                        (self.store_items, self.claims["store"][self.items["claim"]])):
+            partitions.clear()
+            order = np.argsort(store_codes, kind="stable").astype(np.int32)
+            boundaries = np.cumsum(np.bincount(store_codes, minlength=len(self.stores)))
+            start = 0
+            for store_code, end in enumerate(boundaries.tolist()):
+                partition = self._partition(partitions, store_code)
+                partition.reserve(end - start)
+                partition.arrays["row"][:end - start] = order[start:end]
+                partition.size = end - start
+                start = end
+
+    def _store_rows(self, partitions: Dict[int, _Columns], store_id: str) -> np.ndarray:
+        store_code = self.stores.codes.get(store_id)
+        if store_code is None or store_code not in partitions:
+            return np.empty(0, dtype=np.int32)
+        return partitions[store_code]["row"]
+
+    def set_status(self, claim: Dict[str, Any], previous_status: Optional[str] = None):
+        """Apply a claim status change"""
+        status = claim.get("status")
+        if status not in STATUSES:
+            return
+        with self._lock:
+            row = self.claim_rows.get(str(claim.get("id")))
+            if row is not None:
+                self.claims.arrays["status"][row] = STATUSES.index(status)
+
+    # Writes that land while loading are applied too; duplicates are skipped by claim id
+    def _on_claim_created(self, claim: Dict[str, Any]):
+        if self.enabled:
+            self.add_claim(claim)
+
+    def _on_status_changed(self, claim: Dict[str, Any], previous_status: Optional[str] = None):
+        if self.enabled:
+            self.set_status(claim, previous_status)
+
+    def _fetch_claims(self, since: Optional[str] = None) -> int:
+        """Page through claims (optionally created at or after since) into the store"""
+        supabase = get_supabase_client()
+        added = 0
+        offset = 0
+        while True:
+            query = supabase.table("claims").select("id, user_id, store_id, status, created_at, claim_data")
+            if since:
+                query = query.gte("created_at", since)
+            rows = query.order("created_at").range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            for row in rows:
+                added += self.add_claim(row)
+            if len(rows) < PAGE_SIZE:
+                return added
+            offset += PAGE_SIZE
+
+    def _refresh_statuses(self):
+        """Re-read every claim's status (statuses are not part of the snapshot catch-up)"""
+        supabase = get_supabase_client()
+        offset = 0
+        while True:
+            rows = supabase.table("claims").select("id, status").order("created_at").range(
+                offset, offset + PAGE_SIZE - 1
+            ).execute().data or []
+            for row in rows:
+                self.set_status(row)
+            if len(rows) < PAGE_SIZE:
+                return
+            offset += PAGE_SIZE
+
+    # Persistence
+
+    def save_snapshot(self) -> bool:
+        """Write all columns as .npy files plus a JSON manifest, replacing the old snapshot"""
+        parent = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another worker is writing the same snapshot
+            os.close(lock_fd)
+            return False
+        tmp_path = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(self.path) + ".tmp-")
+        try:
+            self._write_snapshot(tmp_path)
+            old_path = f"{self.path}.old-{os.getpid()}"
+            if os.path.isdir(self.path):
+                os.rename(self.path, old_path)
+            os.rename(tmp_path, self.path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            return True
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.close(lock_fd)
+
+    def _write_snapshot(self, tmp_path: str):
+        with self._lock:
+            for name, _ in ITEM_COLUMNS:
+                np.save(os.path.join(tmp_path, f"item_{name}.npy"), self.items[name])
+            for name, _ in CLAIM_COLUMNS:
+                np.save(os.path.join(tmp_path, f"claim_{name}.npy"), self.claims[name])
+            for name, _ in ITEM_NAME_COLUMNS:
+                np.save(os.path.join(tmp_path, f"item_name_{name}.npy"), self.item_info[name])
+            manifest = {
+                "claim_ids": self.claim_ids,
+                "stores": self.stores.values,
+                "users": self.users.values,
+                "categories": self.categories.values,
+                "item_names": self.item_names.values,
+                "watermark": self.watermark
+            }
+        with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+    def load_snapshot(self) -> bool:
+        """Map a saved snapshot into the store, False if there is none"""
+        manifest_path = os.path.join(self.path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return False
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        with self._lock:
+            self._reset()
+            for columns, spec, prefix in ((self.items, ITEM_COLUMNS, "item"), (self.claims, CLAIM_COLUMNS, "claim"),
+                                          (self.item_info, ITEM_NAME_COLUMNS, "item_name")):
+                # Copy-on-write mappings: pages are read on demand and status updates stay
+                # private; the first append copies a column set into growable arrays
+                mapped = {
+                    name: np.load(os.path.join(self.path, f"{prefix}_{name}.npy"), mmap_mode="c")
+                    for name, _ in spec
+                }
+                if len({len(array) for array in mapped.values()}) != 1:
+                    raise ValueError(f"snapshot {prefix} columns have different lengths")
+                columns.size = len(mapped[spec[0][0]])
+                columns.arrays = mapped
+            if self.claims.size != len(manifest["claim_ids"]) or self.item_info.size != len(manifest["item_names"]):
+                raise ValueError("snapshot columns do not match its manifest")
+            self.claim_ids = manifest["claim_ids"]
+            self.claim_rows = {claim_id: row for row, claim_id in enumerate(self.claim_ids)}
+            self.stores = _Dictionary(manifest["stores"])
+            self.users = _Dictionary(manifest["users"])
+            self.categories = _Dictionary(manifest["categories"])
+            self.item_names = _Dictionary(manifest["item_names"])
+            self.watermark = manifest["watermark"]
+            self._index_stores()
+        return True
+
+    def _load(self):
+        started = time.perf_counter()
+        self.loaded_from_snapshot = False
+        try:
+            self.loaded_from_snapshot = self.load_snapshot()
+        except Exception as e:
+            print(f"Warning: could not read claim item snapshot, loading from the database: {e}")
+            with self._lock:
+                self._reset()
+
+        self._status_version = data_versions.scope_version("claim_status")
+        if self.loaded_from_snapshot:
+            self._fetch_claims(since=self.watermark)
+            self._refresh_statuses()
+        else:
+            self._fetch_claims()
+        self.last_load_ms = (time.perf_counter() - started) * 1000
+
+        try:
+            self.save_snapshot()
+        except OSError as e:
+            print(f"Warning: could not write claim item snapshot: {e}")
+
+    async def load(self):
+        """Load the store off the event loop"""
+        if not self.enabled:
+            return
+        print("🚀 Loading columnar claim item store...")
+        try:
+            await asyncio.to_thread(self._load)
+            self.ready = True
+            source = "snapshot + catch-up" if self.loaded_from_snapshot else "database"
+            print(f"✅ Claim item store ready: {self.claims.size} claims, {self.items.size} items "
+                  f"from {source} in {self.last_load_ms:.0f}ms")
+        except Exception as e:
+            print(f"❌ Error loading claim item store, analytics will use the database: {e}")
+
+    def _refresh(self):
+        self._fetch_claims(self.watermark)
+        # Own status changes arrive through claim_events; only a shared version can move elsewhere
+        version = data_versions.scope_version("claim_status")
+        if data_versions.shared is not None and version != self._status_version:
+            self._status_version = version
+            self._refresh_statuses()
+
+    async def refresh(self):
+        """Catch up on claims and status changes from other workers (scheduled job)"""
+        if self.ready:
+            await asyncio.to_thread(self._refresh)
+
+    async def snapshot(self):
+        """Persist the current columns (scheduled job)"""
+        if self.ready:
+            await asyncio.to_thread(self.save_snapshot)
+
+    async def close(self):
+        """Persist the current columns"""
+        if self.ready:
+            try:
+                await asyncio.to_thread(self.save_snapshot)
+            except OSError as e:
+                print(f"Warning: could not write claim item snapshot: {e}")
+
+    # Vectorized queries
+
+    def status_counts(self, start_day: date, bucket: str, store_id: Optional[str] = None) -> Dict[date, Dict[str, int]]:
+        """Claim counts per time bucket (day, week, fortnight, month) and status since start_day"""
+        # Capture the columns under the lock so a concurrent refresh never shows a half-written row
+        with self._lock:
+            days = self.claims["day"]
+            statuses = self.claims["status"]
+            rows = self._store_rows(self.store_claims, store_id) if store_id is not None else None
+        if rows is not None:
+            days, statuses = days[rows], statuses[rows]
+        mask = (days >= (start_day - date(1970, 1, 1)).days) & (statuses >= 0)
+        days = days[mask]
+
+        result: Dict[date, Dict[str, int]] = {}
+        if not len(days):
+            return result
+        # Count per (day, status) first, then fold the few distinct days into buckets
+        first = int(days.min())
+        keys = (days - first).astype(np.int64) * len(STATUSES) + statuses[mask]
+        counts = np.bincount(keys, minlength=(int(days.max()) - first + 1) * len(STATUSES)).reshape(-1, len(STATUSES))
+        buckets = np.arange(first, first + len(counts))
+        if bucket == "week":
+            # 1970-01-01 was a Thursday; weeks start on Monday
+            buckets = buckets - (buckets + 3) % 7
+        elif bucket == "fortnight":
+            buckets = buckets // 14 * 14
+        elif bucket == "month":
+            buckets = buckets.astype("datetime64[D]").astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+
+        epoch = date(1970, 1, 1).toordinal()
+        for day_index in np.flatnonzero(counts.any(axis=1)).tolist():
+            statuses_in_bucket = result.setdefault(date.fromordinal(epoch + int(buckets[day_index])), {})
+            for status_code, count in enumerate(counts[day_index].tolist()):
+                if count:
+                    status = STATUSES[status_code]
+                    statuses_in_bucket[status] = statuses_in_bucket.get(status, 0) + count
+        return result
+
+    def category_counts(self, store_id: Optional[str] = None) -> Dict[str, int]:
+        """Claimed item counts per (lower-cased) category"""
+        with self._lock:
+            codes = self.items["category"]
+            category_count = len(self.categories)
+            rows = self._store_rows(self.store_items, store_id) if store_id is not None else None
+        if rows is not None:
+            codes = codes[rows]
+        # Shift by one so items without a category (-1) land in bin 0
+        counts = np.bincount(codes + 1, minlength=category_count + 1)[1:]
+        return {self.categories.values[code]: int(count) for code, count in enumerate(counts.tolist()) if count}
+
+    def top_items(self, limit: int, store_id: Optional[str] = None,
+                  start_day: Optional[date] = None) -> List[Dict[str, Any]]:
+        """Most disputed items with their dispute count and last dispute time, optionally since start_day"""
+        with self._lock:
+            codes = self.items["item"]
+            item_claims = self.items["claim"]
+            claim_ts = self.claims["ts"]
+            claim_days = self.claims["day"]
+            last_seen_by_item = self.item_info["last_seen"]
+            item_count = len(self.item_names)
+            rows = self._store_rows(self.store_items, store_id) if store_id is not None else None
+        if rows is not None:
+            codes, item_claims = codes[rows], item_claims[rows]
+        if start_day is not None:
+            recent = claim_days[item_claims] >= (start_day - date(1970, 1, 1)).days
+            codes, item_claims = codes[recent], item_claims[recent]
+        if rows is not None:
+            # The global last_seen column spans all stores; recompute it for this store
+            last_seen_by_item = np.zeros(item_count, dtype=np.int64)
+            np.maximum.at(last_seen_by_item, codes, claim_ts[item_claims])
+        if not len(codes):
+            return []
+        counts = np.bincount(codes, minlength=item_count)
+        limit = min(limit, int(np.count_nonzero(counts)))
+        top = np.argpartition(-counts, limit - 1)[:limit]
+
+        rows = []
+        for code in top.tolist():
+            category_code = int(self.item_info.arrays["category"][code])
+            last_seen = int(last_seen_by_item[code])
+            rows.append({
+                "item_name": self.item_names.values[code],
+                "category": self.categories.values[category_code] if category_code >= 0 else "Unknown",
+                "disputes": int(counts[code]),
+                "last_dispute": datetime.fromtimestamp(last_seen, tz=timezone.utc).isoformat()
+            })
+        return sorted(rows, key=lambda row: (-row["disputes"], row["item_name"]))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get store size and memory statistics"""
+        nbytes = sum(array.nbytes for array in self.items.arrays.values())
+        nbytes += sum(array.nbytes for array in self.claims.arrays.values())
+        nbytes += sum(array.nbytes for array in self.item_info.arrays.values())
+        nbytes += sum(partition.arrays["row"].nbytes for partition in self.store_claims.values())
+        nbytes += sum(partition.arrays["row"].nbytes for partition in self.store_items.values())
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "claims": self.claims.size,
+            "items": self.items.size,
+            "stores": len(self.stores),
+            "users": len(self.users),
+            "categories": len(self.categories),
+            "distinct_items": len(self.item_names),
+            "column_bytes": nbytes,
+            "loaded_from_snapshot": self.loaded_from_snapshot,
+            "last_load_ms": round(self.last_load_ms, 1) if self.last_load_ms is not None else None,
+            "watermark": self.watermark,
+            "path": self.path
+        }
+
+# Global store instance, fed by claim writes once loaded
+claim_item_store = ClaimItemStore()
+claim_events.on_claim_created(claim_item_store._on_claim_created)
+claim_events.on_status_changed(claim_item_store._on_status_changed)
@@ -1,5 +1,4 @@
 import os
-import cohere
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timezone
 from dotenv import load_dotenv
@@ -10,9 +9,8 @@ from collections import Counter
 load_dotenv()
 
 # Import backend components
-from crud.crud_customer import CustomerCRUD
-from crud.crud_claim import ClaimCRUD
 from core.supabase_client import get_supabase
+from core.container import container
 
 class CohereEnhancedFraudDetector:
     """
@@ -21,9 +19,13 @@ class CohereEnhancedFraudDetector:
     """
     
     def __init__(self, api_key: Optional[str] = None):
-        self.client = cohere.ClientV2(api_key=api_key)
-        self.customer_crud = CustomerCRUD()
-        self.claim_crud = ClaimCRUD()
+        if api_key:
+            import cohere
+            self.client = cohere.ClientV2(api_key=api_key)
+        else:
+            self.client = container.get("cohere_client")
+        self.customer_crud = container.get("customer_crud")
+        self.claim_crud = container.get("claim_crud")
         self.supabase = get_supabase()
         
         # Fraud pattern templates for reranking
@@ -497,5 +499,6 @@ async def analyze_customer_fraud_risk(user_id: uuid.UUID,
     Returns:
         Comprehensive fraud analysis results with real backend data
     """
-    detector = CohereEnhancedFraudDetector(api_key)
+    # Reuse the process-wide detector unless a different key is asked for
+    detector = CohereEnhancedFraudDetector(api_key) if api_key else container.get("cohere_detector")
     return await detector.calculate_enhanced_fraud_score(user_id, current_claim)
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Data Versions
+Monotonic version counters behind the ETags of read-heavy endpoints
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from core.workers import get_worker_count
+from services.analytics_cache import analytics_cache
+from services.claim_events import claim_events
+
+# Header: magic, boot id, counter, bucket count
+_HEADER = struct.Struct("<8s8sQI")
+_HEADER_SIZE = 64
+_MAGIC = b"BSTNVER1"
+_SLOT = struct.Struct("<Q")
+
+def _default_path() -> str:
+    base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base_dir, "bastion-data-versions")
+
+class SharedVersionCounters:
+    """
+    Host-wide version counters in a memory-mapped file, so every worker issues
+    and recognises the same ETags.
+
+    Keys hash into a fixed table of buckets holding the counter value of their
+    last bump. A collision can only change a tag early, never keep it stale.
+    Bumps serialize on an flock; reads are single aligned 8-byte loads.
+    """
+
+    def __init__(self, path: str, buckets: int):
+        self.path = path
+        self.buckets = buckets
+        self.size = _HEADER_SIZE + buckets * _SLOT.size
+        self._mm: Optional[mmap.mmap] = None
+        self._lock_fd: Optional[int] = None
+        self._pid: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedVersionCounters"]:
+        """Share the counters when running multi-worker or when explicitly enabled"""
+        enabled = os.getenv("DATA_VERSIONS_SHARED")
+        if enabled is None:
+            if get_worker_count() <= 1:
+                return None
+        elif enabled.lower() != "true":
+            return None
+        path = os.getenv("DATA_VERSIONS_SHARED_PATH") or _default_path()
+        return cls(path, int(os.getenv("DATA_VERSIONS_SHARED_BUCKETS", "65536")))
+
+    @staticmethod
+    def remove_files(path: Optional[str] = None):
+        """Delete counters left over from a previous run (called before forking workers)"""
+        path = path or os.getenv("DATA_VERSIONS_SHARED_PATH") or _default_path()
+        for suffix in ("", ".lock"):
+            try:
+                os.unlink(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _open(self) -> mmap.mmap:
+        # Opened per process: an flock on a descriptor inherited across fork would not exclude anyone
+        if self._mm is not None and self._pid == os.getpid():
+            return self._mm
+        self._pid = os.getpid()
+        self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                valid = (
+                    len(header) == _HEADER.size
+                    and _HEADER.unpack(header)[0] == _MAGIC
+                    and _HEADER.unpack(header)[3] == self.buckets
+                    and os.fstat(fd).st_size == self.size
+                )
+                if not valid:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, uuid.uuid4().hex[:8].encode(), 0, self.buckets), 0)
+                self._mm = mmap.mmap(fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            finally:
+                os.close(fd)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        return self._mm
+
+    def _offset(self, key: str) -> int:
+        return _HEADER_SIZE + (zlib.crc32(key.encode()) % self.buckets) * _SLOT.size
+
+    @property
+    def boot_id(self) -> str:
+        return _HEADER.unpack_from(self._open(), 0)[1].decode()
+
+    @property
+    def counter(self) -> int:
+        return _HEADER.unpack_from(self._open(), 0)[2]
+
+    def bump(self, key: str) -> int:
+        mm = self._open()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            magic, boot_id, counter, buckets = _HEADER.unpack_from(mm, 0)
+            counter += 1
+            _HEADER.pack_into(mm, 0, magic, boot_id, counter, buckets)
+            _SLOT.pack_into(mm, self._offset(key), counter)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        return counter
+
+    def get(self, key: str) -> int:
+        return _SLOT.unpack_from(self._open(), self._offset(key))[0]
+
+class DataVersions:
+    """
+    Version counters for the data that read endpoints are computed from.
+
+    Every bump takes the next value of one counter, so a version never repeats
+    even after a per-user entry is evicted (evicted users fall back to the
+    highest version ever evicted). With several workers the counters live in
+    SharedVersionCounters, so a tag issued by one worker revalidates on any
+    other. Each worker's analytics response cache may still serve a body up to
+    ANALYTICS_CACHE_TTL_SECONDS old under a new tag. Writes made outside the
+    app (scripts, the SQL editor) are never seen; tags therefore also rotate
+    every ETAG_MAX_AGE_SECONDS.
+    """
+
+    def __init__(self):
+        self.max_age_seconds = int(os.getenv("ETAG_MAX_AGE_SECONDS", "60"))
+        self.max_tracked_users = int(os.getenv("ETAG_MAX_TRACKED_USERS", "50000"))
+        self.counter = 0
+        self.scopes: Dict[str, int] = {}
+        self.users: "OrderedDict[str, int]" = OrderedDict()
+        self.user_floor = 0
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self.shared = SharedVersionCounters.from_env()
+
+    @property
+    def boot_id(self) -> str:
+        return self.shared.boot_id if self.shared is not None else self._boot_id
+
+    def bump(self, scope: str):
+        """Mark a named data set (e.g. stores) as changed"""
+        if self.shared is not None:
+            self.shared.bump(f"scope:{scope}")
+            return
+        with self._lock:
+            self.counter += 1
+            self.scopes[scope] = self.counter
+
+    def bump_user(self, user_id: Optional[Any]):
+        """Mark everything derived from one user's claims or risk data as changed"""
+        if not user_id:
+            return
+        user_id = str(user_id).lower()
+        if self.shared is not None:
+            self.shared.bump(f"user:{user_id}")
+            return
+        with self._lock:
+            self.counter += 1
+            self.users[user_id] = self.counter
+            self.users.move_to_end(user_id)
+            while len(self.users) > self.max_tracked_users:
+                _, evicted = self.users.popitem(last=False)
+                self.user_floor = max(self.user_floor, evicted)
+
+    def scope_version(self, scope: str) -> int:
+        if self.shared is not None:
+            return self.shared.get(f"scope:{scope}")
+        return self.scopes.get(scope, 0)
+
+    def user_version(self, user_id: str) -> int:
+        if self.shared is not None:
+            return self.shared.get(f"user:{str(user_id).lower()}")
+        return self.users.get(str(user_id).lower(), self.user_floor)
+
+    def analytics_version(self) -> int:
+        # The cache generation is per process; workers agree on the shared scope instead
+        if self.shared is not None:
+            return self.shared.get("scope:analytics")
+        return analytics_cache.generation
+
+    def tag(self, scope: str, version: int) -> str:
+        """Weak ETag for a version of a scope, rotated every max_age_seconds"""
+        window = int(time.time() // self.max_age_seconds) if self.max_age_seconds > 0 else 0
+        return f'W/"{self.boot_id}-{scope}-{version}-{window}"'
+
+    def _on_claim_written(self, claim: Dict[str, Any], *_):
+        self.bump_user(claim.get("user_id"))
+        if self.shared is not None:
+            self.shared.bump("scope:analytics")
+
+    def _on_status_changed(self, claim: Dict[str, Any], *_):
+        self._on_claim_written(claim)
+        # Lets other workers' in-memory copies know a status changed somewhere
+        self.bump("claim_status")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get counter metrics"""
+        return {
+            "boot_id": self.boot_id,
+            "shared": self.shared is not None,
+            "counter": self.shared.counter if self.shared is not None else self.counter,
+            "scopes": dict(self.scopes),
+            "analytics_generation": analytics_cache.generation,
+            "tracked_users": len(self.users),
+            "max_age_seconds": self.max_age_seconds
+        }
+
+# Global counters, bumped by every claim write
+data_versions = DataVersions()
+claim_events.on_claim_created(data_versions._on_claim_written)
+claim_events.on_status_changed(data_versions._on_status_changed)
@@ -0,0 +1,304 @@
+"""
+Distinct Claimants
+HyperLogLog sketches of claimant user ids per day, store and category
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+import numpy as np
+from core.supabase_client import get_supabase_client
+from services.claim_events import claim_events
+
+# Page size for bulk reads, matches PostgREST's default max-rows
+PAGE_SIZE = 1000
+UNCATEGORIZED = "uncategorized"
+
+class HyperLogLog:
+    """
+    HyperLogLog cardinality sketch (Flajolet et al.) with 2^precision one-byte registers.
+
+    The relative standard error is about 1.04 / sqrt(2^precision), i.e. ~3.3%
+    at the default precision of 10 (1 KiB per sketch). Sketches of the same
+    precision merge losslessly by taking the register-wise maximum.
+    """
+
+    def __init__(self, precision: int = 10, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    @staticmethod
+    def position(value: str, precision: int) -> Tuple[int, int]:
+        """Register index and rank of a value, so one hash can feed several sketches"""
+        hashed = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+        remainder = hashed & ((1 << (64 - precision)) - 1)
+        return hashed >> (64 - precision), (64 - precision) - remainder.bit_length() + 1
+
+    def add_position(self, index: int, rank: int):
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value: str):
+        self.add_position(*self.position(value, self.precision))
+
+    def merge(self, other: "HyperLogLog"):
+        """Union another sketch into this one"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def copy(self) -> "HyperLogLog":
+        return HyperLogLog(self.precision, self.registers.copy())
+
+    @classmethod
+    def union(cls, sketches: Iterable["HyperLogLog"], precision: int) -> "HyperLogLog":
+        merged = cls(precision)
+        for sketch in sketches:
+            merged.merge(sketch)
+        return merged
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / float(np.ldexp(1.0, -self.registers.astype(np.int32)).sum())
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Small-range correction: linear counting while registers are still empty
+        if estimate <= 2.5 * self.m and zeros:
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+class _Rollup:
+    """Sketches of one period: overall, per store, per category and per (store, category)"""
+
+    def __init__(self, precision: int):
+        self.precision = precision
+        self.total = HyperLogLog(precision)
+        self.stores: Dict[str, HyperLogLog] = {}
+        self.categories: Dict[str, HyperLogLog] = {}
+        self.cells: Dict[Tuple[str, str], HyperLogLog] = {}
+
+    def _sketch(self, sketches: Dict[Any, HyperLogLog], key: Any) -> HyperLogLog:
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = HyperLogLog(self.precision)
+        return sketch
+
+    def add(self, user_id: str, store_id: str, categories: Iterable[str]):
+        index, rank = HyperLogLog.position(user_id, self.precision)
+        self.total.add_position(index, rank)
+        self._sketch(self.stores, store_id).add_position(index, rank)
+        for category in categories:
+            self._sketch(self.categories, category).add_position(index, rank)
+            self._sketch(self.cells, (store_id, category)).add_position(index, rank)
+
+    def merge(self, other: "_Rollup"):
+        self.total.merge(other.total)
+        for mine, theirs in ((self.stores, other.stores), (self.categories, other.categories), (self.cells, other.cells)):
+            for key, sketch in theirs.items():
+                self._sketch(mine, key).merge(sketch)
+
+    def select(self, store_id: Optional[str], category: Optional[str]) -> Optional[HyperLogLog]:
+        """The one pre-merged sketch answering a store/category filter"""
+        if store_id is not None and category is not None:
+            return self.cells.get((store_id, category))
+        if store_id is not None:
+            return self.stores.get(store_id)
+        if category is not None:
+            return self.categories.get(category)
+        return self.total
+
+    def groups(self, group_by: str, store_id: Optional[str],
+               category: Optional[str]) -> Iterable[Tuple[str, HyperLogLog]]:
+        """(store or category, sketch) pairs matching the filters"""
+        if group_by == "store" and category is None:
+            return ((name, sketch) for name, sketch in self.stores.items() if store_id in (None, name))
+        if group_by != "store" and store_id is None:
+            return ((name, sketch) for name, sketch in self.categories.items() if category in (None, name))
+        position = 0 if group_by == "store" else 1
+        return (
+            (key[position], sketch) for key, sketch in self.cells.items()
+            if store_id in (None, key[0]) and category in (None, key[1])
+        )
+
+    def __len__(self) -> int:
+        return 1 + len(self.stores) + len(self.categories) + len(self.cells)
+
+class DistinctClaimants:
+    """
+    HyperLogLogs of user ids per UTC day, rolled up per store, per category
+    and per (store, category).
+
+    A query merges one pre-rolled sketch per retained day, so it never touches
+    the claims table and its cost is bounded by the retention horizon. Days
+    older than ANALYTICS_HLL_RETENTION_DAYS are folded into a single history
+    rollup, which keeps memory fixed and still tells first-time from repeat
+    claimants (by inclusion-exclusion against everything before the range).
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ANALYTICS_DISTINCT_CLAIMANTS", "false").lower() == "true"
+        self.precision = int(os.getenv("ANALYTICS_HLL_PRECISION", "10"))
+        self.retention_days = int(os.getenv("ANALYTICS_HLL_RETENTION_DAYS", "400"))
+        self.ready = False
+        self.last_load_ms: Optional[float] = None
+        self.claims_counted = 0
+        # ISO day -> rollup; days before the horizon live in history
+        self.days: Dict[str, _Rollup] = {}
+        self.history = _Rollup(self.precision)
+        self.horizon = ""
+        # Claim ids seen while loading, so writes racing the load are not counted twice
+        self._loading_ids: Optional[set] = None
+        self._lock = threading.Lock()
+
+    def add_claim(self, claim: Dict[str, Any]):
+        """Record the claimant under every category the claim touches"""
+        created_at = claim.get("created_at")
+        user_id = claim.get("user_id")
+        if not created_at or not user_id:
+            return
+        parsed = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc)
+        day = parsed.date().isoformat()
+        store_id = str(claim.get("store_id"))
+
+        claim_data = claim.get("claim_data") or []
+        categories = {
+            item["category"].lower()
+            for item in (claim_data if isinstance(claim_data, list) else [])
+            if isinstance(item, dict) and item.get("category")
+        } or {UNCATEGORIZED}
+
+        with self._lock:
+            if self._loading_ids is not None:
+                claim_id = str(claim.get("id"))
+                if claim_id in self._loading_ids:
+                    return
+                self._loading_ids.add(claim_id)
+            self.claims_counted += 1
+            self._expire()
+            rollup = self.history if day < self.horizon else self.days.get(day)
+            if rollup is None:
+                rollup = self.days[day] = _Rollup(self.precision)
+            rollup.add(str(user_id), store_id, categories)
+
+    def _expire(self):
+        """Fold days that left the retention horizon into history (caller holds the lock)"""
+        horizon = (datetime.now(timezone.utc).date() - timedelta(days=self.retention_days)).isoformat()
+        if horizon == self.horizon:
+            return
+        self.horizon = horizon
+        for day in [day for day in self.days if day < horizon]:
+            self.history.merge(self.days.pop(day))
+
+    def covers(self, start: date) -> bool:
+        """Whether a range starting at start lies within the retained days"""
+        return start.isoformat() >= self.horizon
+
+    def _on_claim_created(self, claim: Dict[str, Any]):
+        if self.enabled and (self.ready or self._loading_ids is not None):
+            self.add_claim(claim)
+
+    def _days_between(self, start_key: str, end_key: str) -> List[_Rollup]:
+        return [rollup for day, rollup in self.days.items() if start_key <= day <= end_key]
+
+    def count(self, start: date, end: date, store_id: Optional[str] = None,
+              category: Optional[str] = None) -> Dict[str, int]:
+        """Distinct, first-time and repeat claimants between start and end (inclusive)"""
+        category = category.lower() if category else None
+        with self._lock:
+            self._expire()
+            in_range = HyperLogLog.union(
+                filter(None, (rollup.select(store_id, category)
+                              for rollup in self._days_between(start.isoformat(), end.isoformat()))),
+                self.precision
+            )
+            before_days = [self.history, *self._days_between("", (start - timedelta(days=1)).isoformat())]
+            before = HyperLogLog.union(
+                filter(None, (rollup.select(store_id, category) for rollup in before_days)), self.precision
+            )
+        distinct = in_range.count()
+        before_count = before.count()
+        before.merge(in_range)
+        # |range \ before| = |range ∪ before| - |before|, clamped to the estimate bounds
+        new = min(distinct, max(0, before.count() - before_count))
+        return {"distinct": distinct, "new": new, "repeat": distinct - new}
+
+    def breakdown(self, start: date, end: date, group_by: str, store_id: Optional[str] = None,
+                  category: Optional[str] = None) -> Dict[str, int]:
+        """Distinct claimants per store or per category between start and end"""
+        category = category.lower() if category else None
+        with self._lock:
+            self._expire()
+            groups: Dict[str, HyperLogLog] = {}
+            for rollup in self._days_between(start.isoformat(), end.isoformat()):
+                for name, sketch in rollup.groups(group_by, store_id, category):
+                    group = groups.get(name)
+                    if group is None:
+                        groups[name] = sketch.copy()
+                    else:
+                        group.merge(sketch)
+        return {name: sketch.count() for name, sketch in groups.items()}
+
+    def _load(self):
+        started = time.perf_counter()
+        with self._lock:
+            self._loading_ids = set()
+        supabase = get_supabase_client()
+        offset = 0
+        while True:
+            rows = supabase.table("claims").select("id, user_id, store_id, created_at, claim_data").order(
+                "created_at"
+            ).range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            for row in rows:
+                self.add_claim(row)
+            if len(rows) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        with self._lock:
+            self._loading_ids = None
+        self.last_load_ms = (time.perf_counter() - started) * 1000
+
+    async def load(self):
+        """Seed the sketches from all existing claims"""
+        if not self.enabled:
+            return
+        print("🚀 Loading distinct-claimant sketches...")
+        try:
+            await asyncio.to_thread(self._load)
+            self.ready = True
+            print(f"✅ Distinct-claimant sketches ready: {self.sketch_count()} sketches over {len(self.days)} days "
+                  f"from {self.claims_counted} claims in {self.last_load_ms:.0f}ms")
+        except Exception as e:
+            print(f"❌ Error loading distinct-claimant sketches: {e}")
+
+    def sketch_count(self) -> int:
+        return len(self.history) + sum(len(rollup) for rollup in self.days.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get sketch count, memory and error metrics"""
+        m = 1 << self.precision
+        sketches = self.sketch_count()
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "precision": self.precision,
+            "retention_days": self.retention_days,
+            "retained_days": len(self.days),
+            "horizon": self.horizon or None,
+            "sketches": sketches,
+            "register_bytes": sketches * m,
+            "standard_error": round(1.04 / math.sqrt(m), 4),
+            "claims_counted": self.claims_counted,
+            "last_load_ms": round(self.last_load_ms, 1) if self.last_load_ms is not None else None
+        }
+
+# Global sketches, fed by claim inserts once enabled
+distinct_claimants = DistinctClaimants()
+claim_events.on_claim_created(distinct_claimants._on_claim_created)
@@ -0,0 +1,272 @@
+"""
+Heavy Hitters
+Space-Saving sketches of the most disputed items and categories, updated as claims arrive
+"""
+
+import asyncio
+import heapq
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+from core.supabase_client import get_supabase_client
+from services.claim_events import claim_events
+
+# Page size for bulk reads, matches PostgREST's default max-rows
+PAGE_SIZE = 1000
+
+def _claim_day_and_time(created_at: str) -> Tuple[str, str]:
+    parsed = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    parsed = parsed.astimezone(timezone.utc)
+    return parsed.date().isoformat(), parsed.isoformat()
+
+class SpaceSaving:
+    """
+    Space-Saving summary (Metwally et al.) with at most `capacity` counters.
+
+    Every reported count overestimates the true count by at most its `error`,
+    and error <= total / capacity. Any key whose true count exceeds
+    total / capacity is guaranteed to be tracked. Summaries are mergeable, so
+    per-day sketches can be combined into any window with the same bound
+    over the window's total.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.total = 0
+        # key -> [count, error, label, last_seen]
+        self.counters: Dict[str, List[Any]] = {}
+        # Lazy min-heap of (count, key); stale entries are skipped on eviction
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, key: str, label: Optional[str] = None, seen_at: str = "", count: int = 1):
+        self.total += count
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += count
+            if seen_at > counter[3]:
+                counter[3] = seen_at
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[key] = [count, 0, label, seen_at]
+        else:
+            # Replace the smallest counter; its count becomes the newcomer's error bound
+            minimum = self._pop_min()
+            evicted = self.counters.pop(minimum)
+            counter = self.counters[key] = [evicted[0] + count, evicted[0], label, seen_at]
+        heapq.heappush(self._heap, (counter[0], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(counter[0], key) for key, counter in self.counters.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> str:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            counter = self.counters.get(key)
+            if counter is not None and counter[0] == count:
+                return key
+
+    def min_count(self) -> int:
+        """Upper bound on the count of any key that is not tracked"""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+
+    def max_error(self) -> int:
+        return self.total // self.capacity
+
+    def merge(self, others: Iterable["SpaceSaving"]) -> "SpaceSaving":
+        """Combine summaries (Agarwal et al. mergeable summaries) into a new one"""
+        sketches = [self, *others]
+        merged = SpaceSaving(max(sketch.capacity for sketch in sketches))
+        combined: Dict[str, List[Any]] = {}
+        # A key missing from a full sketch may hold up to that sketch's minimum count
+        total_floor = 0
+        for sketch in sketches:
+            floor = sketch.min_count()
+            total_floor += floor
+            merged.total += sketch.total
+            for key, (count, error, label, seen_at) in sketch.counters.items():
+                entry = combined.setdefault(key, [0, 0, label, ""])
+                entry[0] += count - floor
+                entry[1] += error - floor
+                entry[3] = max(entry[3], seen_at)
+        for entry in combined.values():
+            entry[0] += total_floor
+            entry[1] += total_floor
+        for key, entry in heapq.nlargest(merged.capacity, combined.items(), key=lambda kv: kv[1][0]):
+            merged.counters[key] = entry
+        merged._heap = [(counter[0], key) for key, counter in merged.counters.items()]
+        heapq.heapify(merged._heap)
+        return merged
+
+    def top(self, k: int) -> List[Dict[str, Any]]:
+        """Top k keys by estimated count, with the maximum overestimate of each"""
+        return [
+            {"key": key, "count": count, "error": error, "label": label, "last_seen": seen_at}
+            for key, (count, error, label, seen_at) in heapq.nlargest(
+                k, self.counters.items(), key=lambda kv: (kv[1][0], kv[0])
+            )
+        ]
+
+class HeavyHitters:
+    """
+    Item and category sketches kept all-time, per store and per UTC day.
+
+    Time windows merge the day sketches they cover; per-day sketches older
+    than the retention are dropped. Only claims seen by this process (startup
+    load plus claim_events) are counted, so multi-worker deployments should use
+    the exact mode when they need cross-worker accuracy.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ANALYTICS_HEAVY_HITTERS", "false").lower() == "true"
+        self.capacity = int(os.getenv("ANALYTICS_HH_CAPACITY", "512"))
+        self.day_capacity = int(os.getenv("ANALYTICS_HH_DAY_CAPACITY", "128"))
+        self.retention_days = int(os.getenv("ANALYTICS_HH_RETENTION_DAYS", "400"))
+        self.ready = False
+        self.last_load_ms: Optional[float] = None
+        self.claims_counted = 0
+        # Claim ids seen while loading, so writes racing the load are not counted twice
+        self._loading_ids: Optional[set] = None
+        self._latest_day = ""
+        self._lock = threading.Lock()
+        self.items: Dict[Tuple[str, ...], SpaceSaving] = {}
+        self.categories: Dict[Tuple[str, ...], SpaceSaving] = {}
+
+    def _sketch(self, sketches: Dict[Tuple[str, ...], SpaceSaving], scope: Tuple[str, ...]) -> SpaceSaving:
+        sketch = sketches.get(scope)
+        if sketch is None:
+            capacity = self.day_capacity if scope[0] == "day" else self.capacity
+            sketch = sketches[scope] = SpaceSaving(capacity)
+        return sketch
+
+    def add_claim(self, claim: Dict[str, Any]):
+        """Count one claim's items"""
+        claim_id = str(claim.get("id"))
+        created_at = claim.get("created_at")
+        claim_data = claim.get("claim_data") or []
+        if not created_at or not isinstance(claim_data, list):
+            return
+        day, seen_at = _claim_day_and_time(created_at)
+        scopes = [("all",), ("store", str(claim.get("store_id"))), ("day", day)]
+        with self._lock:
+            if self._loading_ids is not None:
+                if claim_id in self._loading_ids:
+                    return
+                self._loading_ids.add(claim_id)
+            self.claims_counted += 1
+
+            for item in claim_data:
+                if not isinstance(item, dict):
+                    continue
+                category = (item.get("category") or "").lower()
+                if "item_name" in item:
+                    for scope in scopes:
+                        self._sketch(self.items, scope).add(item["item_name"], category or "Unknown", seen_at)
+                if category:
+                    for scope in scopes:
+                        self._sketch(self.categories, scope).add(category, seen_at=seen_at)
+
+            if day > self._latest_day:
+                self._latest_day = day
+                self._prune(day)
+
+    def _prune(self, today: str):
+        cutoff = (datetime.fromisoformat(today) - timedelta(days=self.retention_days)).date().isoformat()
+        for sketches in (self.items, self.categories):
+            for scope in [scope for scope in sketches if scope[0] == "day" and scope[1] < cutoff]:
+                del sketches[scope]
+
+    def _on_claim_created(self, claim: Dict[str, Any]):
+        if self.enabled and (self.ready or self._loading_ids is not None):
+            self.add_claim(claim)
+
+    def _window(self, sketches: Dict[Tuple[str, ...], SpaceSaving], store_id: Optional[str],
+                days: Optional[int]) -> Optional[SpaceSaving]:
+        if days is None:
+            return sketches.get(("store", store_id) if store_id else ("all",))
+        if store_id:
+            raise ValueError("Sketches are kept per store or per day, not both")
+        start = (datetime.utcnow().date() - timedelta(days=days)).isoformat()
+        covered = [sketch for scope, sketch in sketches.items() if scope[0] == "day" and scope[1] >= start]
+        if not covered:
+            return None
+        return covered[0].merge(covered[1:])
+
+    def top_items(self, k: int, store_id: Optional[str] = None, days: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Top k items as {item_name, category, disputes, last_dispute, max_overestimate}"""
+        with self._lock:
+            sketch = self._window(self.items, store_id, days)
+            rows = sketch.top(k) if sketch is not None else []
+        return [
+            {
+                "item_name": row["key"],
+                "category": row["label"],
+                "disputes": row["count"],
+                "last_dispute": row["last_seen"],
+                "max_overestimate": row["error"]
+            }
+            for row in rows
+        ]
+
+    def category_counts(self, store_id: Optional[str] = None, days: Optional[int] = None) -> Dict[str, int]:
+        """Estimated item counts per (lower-cased) category"""
+        with self._lock:
+            sketch = self._window(self.categories, store_id, days)
+            if sketch is None:
+                return {}
+            return {key: count for key, (count, _, _, _) in sketch.counters.items()}
+
+    def _load(self):
+        started = time.perf_counter()
+        self._loading_ids = set()
+        supabase = get_supabase_client()
+        offset = 0
+        while True:
+            rows = supabase.table("claims").select("id, store_id, created_at, claim_data").order(
+                "created_at"
+            ).range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            for row in rows:
+                self.add_claim(row)
+            if len(rows) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        with self._lock:
+            self._loading_ids = None
+        self.last_load_ms = (time.perf_counter() - started) * 1000
+
+    async def load(self):
+        """Seed the sketches from all existing claims"""
+        if not self.enabled:
+            return
+        print("🚀 Loading heavy-hitter sketches...")
+        try:
+            await asyncio.to_thread(self._load)
+            self.ready = True
+            print(f"✅ Heavy-hitter sketches ready: {self.claims_counted} claims in {self.last_load_ms:.0f}ms")
+        except Exception as e:
+            print(f"❌ Error loading heavy-hitter sketches, top items will be exact: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get sketch sizes and error bounds"""
+        everything = self.items.get(("all",))
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "claims_counted": self.claims_counted,
+            "capacity": self.capacity,
+            "day_capacity": self.day_capacity,
+            "item_sketches": len(self.items),
+            "category_sketches": len(self.categories),
+            "items_counted": everything.total if everything else 0,
+            # Any reported all-time count exceeds the true count by at most this much
+            "max_overestimate": everything.max_error() if everything else 0,
+            "last_load_ms": round(self.last_load_ms, 1) if self.last_load_ms is not None else None
+        }
+
+# Global sketches, fed by claim inserts once enabled
+heavy_hitters = HeavyHitters()
+claim_events.on_claim_created(heavy_hitters._on_claim_created)
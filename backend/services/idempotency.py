@@ -0,0 +1,246 @@
+"""
+Idempotency Store
+Recent Idempotency-Key requests and their responses, so retries do not redo the work
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from postgrest.exceptions import APIError
+from core.supabase_client import get_supabase_client
+from core.workers import get_worker_count
+
+# Postgres unique_violation: another worker inserted the key first
+UNIQUE_VIOLATION = "23505"
+
+def _row_id(key: Tuple[str, ...]) -> str:
+    return hashlib.sha256("\n".join(key).encode()).hexdigest()
+
+class IdempotentRecord:
+    """One key: the request fingerprint plus either a pending future or the stored response"""
+
+    def __init__(self, fingerprint: str, remote: bool = False):
+        self.fingerprint = fingerprint
+        self.done = asyncio.get_running_loop().create_future()
+        self.status: Optional[int] = None
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.body = b""
+        self.expires_at = float("inf")
+        # Owned by another worker: completion is read from the shared table
+        self.remote = remote
+        # Token proving this worker still owns the shared row
+        self.owner_token: Optional[str] = None
+
+    @property
+    def completed(self) -> bool:
+        return self.status is not None
+
+class IdempotencyStore:
+    """
+    Bounded LRU of idempotency records, each kept for IDEMPOTENCY_TTL_SECONDS.
+
+    The first request with a key becomes the owner and runs; duplicates arriving
+    meanwhile wait for it. Responses below 500 are stored and replayed;
+    server errors are dropped so the next retry runs again.
+
+    With several workers (or IDEMPOTENCY_PERSIST=true) ownership is decided by
+    an insert into the idempotency_keys table (setup/idempotency.sql), so a retry
+    that lands on another worker waits for or replays the first response. A
+    running request holds the row for IDEMPOTENCY_LEASE_SECONDS, after which a
+    retry may take over from a worker that died.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+        self.ttl_seconds = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+        self.max_entries = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+        self.wait_timeout_seconds = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT_SECONDS", "60"))
+        self.lease_seconds = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "180"))
+        self.poll_interval_seconds = float(os.getenv("IDEMPOTENCY_POLL_INTERVAL_SECONDS", "0.5"))
+        self.purge_interval_seconds = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "300"))
+        self.persist = os.getenv("IDEMPOTENCY_PERSIST", "auto").lower() == "true" or (
+            os.getenv("IDEMPOTENCY_PERSIST", "auto").lower() == "auto" and get_worker_count() > 1
+        )
+        self.records: "OrderedDict[Tuple[str, ...], IdempotentRecord]" = OrderedDict()
+        self.stats = {
+            "executed": 0, "replayed": 0, "waited": 0, "conflicts": 0, "discarded": 0,
+            "shared_conflicts": 0, "shared_errors": 0
+        }
+
+    def _get(self, key: Tuple[str, ...]) -> Optional[IdempotentRecord]:
+        record = self.records.get(key)
+        if record is None:
+            return None
+        if record.expires_at < time.monotonic():
+            del self.records[key]
+            return None
+        self.records.move_to_end(key)
+        return record
+
+    def _add(self, key: Tuple[str, ...], record: IdempotentRecord) -> IdempotentRecord:
+        self.records[key] = record
+        self.records.move_to_end(key)
+        while len(self.records) > self.max_entries:
+            # Evict the least recently used completed record; running ones must stay visible
+            evicted = next((old_key for old_key, old in self.records.items() if old.completed), None)
+            if evicted is None:
+                break
+            del self.records[evicted]
+        return record
+
+    async def begin(self, key: Tuple[str, ...], fingerprint: str) -> Tuple[IdempotentRecord, bool]:
+        """Existing record for the key, or a new one owned by the caller (second value True)"""
+        record = self._get(key)
+        if record is not None:
+            return record, False
+        # Registered before the shared insert so duplicates on this worker wait on it
+        record = self._add(key, IdempotentRecord(fingerprint))
+
+        if self.persist:
+            record.owner_token = uuid.uuid4().hex
+            try:
+                row = await asyncio.to_thread(self._claim, key, fingerprint, record.owner_token)
+            except Exception as e:
+                # The claim insert needs the database too; fall back to this worker's records
+                self.stats["shared_errors"] += 1
+                print(f"⚠️ Idempotency table unavailable, deduplicating on this worker only: {e}")
+                record.owner_token = None
+                row = None
+            if row is not None:
+                self.stats["shared_conflicts"] += 1
+                if self.records.get(key) is record:
+                    del self.records[key]
+                # Wake local duplicates; they retry and find the shared row
+                record.done.set_result(None)
+                remote = IdempotentRecord(row["fingerprint"], remote=True)
+                if self._fill(remote, row):
+                    self._add(key, remote)
+                return remote, False
+
+        self.stats["executed"] += 1
+        return record, True
+
+    def _claim(self, key: Tuple[str, ...], fingerprint: str, owner_token: str) -> Optional[Dict[str, Any]]:
+        """Insert the key's row; None when this worker now owns it, else the other worker's row"""
+        table = get_supabase_client().table("idempotency_keys")
+        row_id = _row_id(key)
+        for _ in range(3):
+            now = datetime.now(timezone.utc)
+            try:
+                table.insert({
+                    "id": row_id,
+                    "fingerprint": fingerprint,
+                    "owner": owner_token,
+                    "expires_at": (now + timedelta(seconds=self.lease_seconds)).isoformat()
+                }).execute()
+                return None
+            except APIError as e:
+                if e.code != UNIQUE_VIOLATION:
+                    raise
+            rows = table.select("*").eq("id", row_id).execute().data
+            if not rows:
+                # Discarded (server error) since the insert failed; try again
+                continue
+            row = rows[0]
+            if datetime.fromisoformat(row["expires_at"]) > now:
+                return row
+            # An expired response, or the lease of a worker that died: take it over
+            table.delete().eq("id", row_id).eq("owner", row["owner"]).execute()
+        raise RuntimeError(f"Could not claim idempotency key row {row_id}")
+
+    def _fill(self, record: IdempotentRecord, row: Dict[str, Any]) -> bool:
+        """Copy a completed shared row into a record, False while it is still running"""
+        if row.get("status") is None:
+            return False
+        record.status = row["status"]
+        record.headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in row["headers"] or []]
+        record.body = base64.b64decode(row.get("body") or "")
+        remaining = (datetime.fromisoformat(row["expires_at"]) - datetime.now(timezone.utc)).total_seconds()
+        record.expires_at = time.monotonic() + min(remaining, self.ttl_seconds)
+        return True
+
+    async def wait(self, key: Tuple[str, ...], record: IdempotentRecord):
+        """Wait until the owner completes or drops the record; remote ones are polled from the shared table"""
+        if not record.remote:
+            await asyncio.shield(record.done)
+            return
+        row_id = _row_id(key)
+        while True:
+            await asyncio.sleep(self.poll_interval_seconds)
+            rows = await asyncio.to_thread(
+                lambda: get_supabase_client().table("idempotency_keys").select("*").eq("id", row_id).execute().data
+            )
+            if not rows or rows[0]["fingerprint"] != record.fingerprint:
+                # Dropped after a server error, or taken over by another request; the caller retries
+                return
+            row = rows[0]
+            if self._fill(record, row):
+                self._add(key, record)
+                return
+            if datetime.fromisoformat(row["expires_at"]) <= datetime.now(timezone.utc):
+                # Lease ran out; the caller retries and takes the key over
+                return
+
+    async def complete(self, key: Tuple[str, ...], record: IdempotentRecord, status: Optional[int],
+                       headers: List[Tuple[bytes, bytes]], body: bytes):
+        """Store the owner's response (or drop the record if it must not be replayed)"""
+        stored = status is not None and status < 500
+        if stored:
+            record.status, record.headers, record.body = status, headers, body
+            record.expires_at = time.monotonic() + self.ttl_seconds
+        else:
+            self.stats["discarded"] += 1
+            if self.records.get(key) is record:
+                del self.records[key]
+        if not record.done.done():
+            record.done.set_result(None)
+
+        if record.owner_token is None:
+            return
+        try:
+            await asyncio.to_thread(self._publish if stored else self._release, key, record)
+        except Exception as e:
+            # The row's lease still runs out, after which a retry runs again
+            self.stats["shared_errors"] += 1
+            print(f"⚠️ Could not store idempotent response in the shared table: {e}")
+
+    def _publish(self, key: Tuple[str, ...], record: IdempotentRecord):
+        get_supabase_client().table("idempotency_keys").update({
+            "status": record.status,
+            "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in record.headers],
+            "body": base64.b64encode(record.body).decode(),
+            "expires_at": (datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)).isoformat()
+        }).eq("id", _row_id(key)).eq("owner", record.owner_token).execute()
+
+    def _release(self, key: Tuple[str, ...], record: IdempotentRecord):
+        get_supabase_client().table("idempotency_keys").delete().eq(
+            "id", _row_id(key)
+        ).eq("owner", record.owner_token).execute()
+
+    async def purge_expired(self):
+        """Delete expired rows from the shared table (scheduled job)"""
+        await asyncio.to_thread(
+            lambda: get_supabase_client().table("idempotency_keys").delete().lt(
+                "expires_at", datetime.now(timezone.utc).isoformat()
+            ).execute()
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get replay counters"""
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "persist": self.persist,
+            "entries": len(self.records),
+            "in_flight": sum(1 for record in self.records.values() if not record.completed),
+            "ttl_seconds": self.ttl_seconds
+        }
+
+# Global store
+idempotency_store = IdempotencyStore()
@@ -1,16 +1,15 @@
 import os
-import cohere
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable
 from datetime import datetime, timezone, timedelta
 import asyncio
 import hashlib
 from dotenv import load_dotenv
 import uuid
 from collections import Counter
-from .cohere_scorer import CohereEnhancedFraudDetector
-from crud.crud_customer import CustomerCRUD
-from crud.crud_claim import ClaimCRUD
 from core.supabase_client import get_supabase
+from core.workers import HostSemaphore, get_worker_count
+from core.container import container
+from services.outcome_statistics import outcome_statistics
 
 class MLFraudService:
     """
@@ -20,15 +19,21 @@ class MLFraudService:
     
     def __init__(self, api_key: Optional[str] = None):
         load_dotenv()
-        self.client = cohere.ClientV2(api_key=api_key or os.getenv("COHERE_API_KEY"))
-        self.customer_crud = CustomerCRUD()
-        self.claim_crud = ClaimCRUD()
+        # Cohere client is built on first rerank; without an explicit key the process-wide one is used
+        self._api_key = api_key
+        self._client = None
+        self.customer_crud = container.get("customer_crud")
+        self.claim_crud = container.get("claim_crud")
         self.supabase = get_supabase()
         # Feature flag: allow disabling Cohere (fallback only)
         self.cohere_enabled = (os.getenv("COHERE_ENABLED", "true").lower() == "true")
-        # Concurrency limit to avoid flooding Cohere
+        # Concurrency limit to avoid flooding Cohere; with several workers the
+        # permits are lock files, so the host-wide total stays at COHERE_MAX_CONCURRENCY
         max_conc = int(os.getenv("COHERE_MAX_CONCURRENCY", "2"))
-        self._cohere_semaphore = asyncio.Semaphore(max_conc)
+        if get_worker_count() > 1:
+            self._cohere_semaphore = HostSemaphore("cohere", max_conc)
+        else:
+            self._cohere_semaphore = asyncio.Semaphore(max_conc)
         # Simple in-memory TTL cache for rerank calls
         self._rerank_cache: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
         self._rerank_ttl_seconds = int(os.getenv("COHERE_RERANK_TTL_SECONDS", "21600"))  # default 6h
@@ -47,6 +52,16 @@ class MLFraudService:
             "Suspicious round number quantities like 10, 15, 20 items per return"
         ]
     
+    @property
+    def client(self):
+        if self._client is None:
+            if self._api_key:
+                import cohere
+                self._client = cohere.ClientV2(api_key=self._api_key)
+            else:
+                self._client = container.get("cohere_client")
+        return self._client
+    
     async def calculate_fraud_score(self, user_id: uuid.UUID, claim_data: List[Dict[str, Any]], use_ai: Optional[bool] = None) -> Dict[str, Any]:
         """
         Calculate comprehensive fraud score using ML analysis
@@ -65,6 +80,35 @@ class MLFraudService:
         
         historical_data = await self._get_historical_data(user_id)
         
+        return await self.score_claim(user_data, claim_data, historical_data, use_ai=use_ai)
+    
+    async def calculate_two_phase_score(self, user_id: uuid.UUID, claim_data: List[Dict[str, Any]]
+                                        ) -> Tuple[Dict[str, Any], Callable[[], Awaitable[Dict[str, Any]]]]:
+        """
+        Rule-based score now, plus a coroutine function computing the AI-adjusted score later
+
+        Both phases score the same user and history snapshot, so writes made in
+        between (e.g. the preliminary risk score) do not feed into the refinement.
+        """
+        user_data = await self._get_user_data(user_id)
+        if not user_data:
+            raise ValueError(f"User {user_id} not found in database")
+        historical_data = await self._get_historical_data(user_id)
+
+        preliminary = await self.score_claim(user_data, claim_data, historical_data, use_ai=False)
+
+        async def refine() -> Dict[str, Any]:
+            return await self.score_claim(user_data, claim_data, historical_data, use_ai=True)
+
+        return preliminary, refine
+    
+    async def score_claim(self, user_data: Dict[str, Any], claim_data: List[Dict[str, Any]],
+                          historical_data: List[Dict[str, Any]], use_ai: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Score a claim from already fetched user and historical data
+        
+        Used directly by bulk recomputation, which fetches claims for many users at once.
+        """
         # Generate behavior description for AI analysis
         behavior_description = self._generate_behavior_description(user_data, claim_data, historical_data)
         
@@ -89,18 +133,21 @@ class MLFraudService:
             "historical_summary": self._summarize_historical_data(historical_data)
         }
     
-    async def should_flag_user(self, fraud_score: int, user_id: uuid.UUID) -> bool:
+    async def should_flag_user(self, fraud_score: int, user_id: uuid.UUID,
+                               previously_flagged: Optional[bool] = None) -> bool:
         """Determine if user should be flagged based on ML analysis"""
         if fraud_score >= 85:
             return True
         
-        # Check existing flag status for lower threshold
-        try:
-            user = await self.customer_crud.get_user_by_kyc_id(user_id)
-            if user and user.get('is_flagged'):
-                return fraud_score >= 60
-        except Exception:
-            pass
+        # Check existing flag status for lower threshold (looked up unless given)
+        if previously_flagged is None:
+            try:
+                user = await self.customer_crud.get_user_by_kyc_id(user_id)
+                previously_flagged = bool(user and user.get('is_flagged'))
+            except Exception:
+                previously_flagged = False
+        if previously_flagged:
+            return fraud_score >= 60
         
         return fraud_score >= 75
     
@@ -111,34 +158,42 @@ class MLFraudService:
             if not user:
                 return None
             
-            return {
-                "risk_score": user.get("risk_score", 0),
-                "is_flagged": user.get("is_flagged", False),
-                "total_claims": user.get("total_claims", 0),
-                "created_at": user.get("created_at"),
-                "email": user.get("email"),
-                "name": user.get("name")
-            }
+            return self.build_user_data(user)
         except Exception as e:
             print(f"Error fetching user data: {e}")
             return None
     
+    @staticmethod
+    def build_user_data(user: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a users row into the profile used for scoring"""
+        return {
+            "risk_score": user.get("risk_score", 0),
+            "is_flagged": user.get("is_flagged", False),
+            "total_claims": user.get("total_claims", 0),
+            "created_at": user.get("created_at"),
+            "email": user.get("email"),
+            "name": user.get("name")
+        }
+    
+    @staticmethod
+    def build_historical_data(claims: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Shape claims rows into the history used for scoring"""
+        return [
+            {
+                "created_at": claim.get("created_at"),
+                "claim_data": claim.get("claim_data", []),
+                "status": claim.get("status"),
+                "store_id": claim.get("store_id"),
+                "email_at_store": claim.get("email_at_store")
+            }
+            for claim in claims
+        ]
+    
     async def _get_historical_data(self, user_id: uuid.UUID) -> List[Dict[str, Any]]:
         """Fetch historical claims data from database"""
         try:
             claims = await self.claim_crud.get_claims_by_user(user_id, limit=100)
-            
-            historical_data = []
-            for claim in claims:
-                historical_data.append({
-                    "created_at": claim.get("created_at"),
-                    "claim_data": claim.get("claim_data", []),
-                    "status": claim.get("status"),
-                    "store_id": claim.get("store_id"),
-                    "email_at_store": claim.get("email_at_store")
-                })
-            
-            return historical_data
+            return self.build_historical_data(claims)
         except Exception as e:
             print(f"Error fetching historical data: {e}")
             return []
@@ -257,6 +312,11 @@ class MLFraudService:
         categories = [item.get('category', '').lower() for item in claim_data]
         high_risk_ratio = sum(1 for cat in categories if cat in high_risk_categories) / max(1, len(categories))
         category_score = high_risk_ratio * 80
+        # Blend in denial rates learned from merchant outcomes (OUTCOME_STATS_BLEND_WEIGHT)
+        learned_score = outcome_statistics.category_risk(categories)
+        if learned_score is not None:
+            weight = outcome_statistics.blend_weight
+            category_score = (1 - weight) * category_score + weight * learned_score
         factors.append(('category_risk', category_score, 0.25))
         
         # Historical risk factor (20%)
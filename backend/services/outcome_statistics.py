@@ -0,0 +1,231 @@
+"""
+Outcome Statistics
+Denial rates per category and per fraud signal, updated one outcome at a time
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from core.supabase_client import get_supabase_client
+from services.claim_events import claim_events
+
+RESOLVED_STATUSES = ("APPROVED", "DENIED")
+HIGH_RISK_CATEGORIES = {"electronics", "jewelry", "luxury", "designer", "gaming"}
+ROUND_QUANTITIES = {10, 15, 20}
+
+Key = Tuple[str, str]
+
+def claim_signals(claim_data: Iterable[Dict[str, Any]]) -> List[str]:
+    """Rule-based fraud signals present in a claim's items"""
+    items = list(claim_data or [])
+    signals = []
+    if any(str(item.get("category", "")).lower() in HIGH_RISK_CATEGORIES for item in items):
+        signals.append("high_risk_category")
+    if sum((item.get("price") or 0) * (item.get("quantity") or 1) for item in items) > 500:
+        signals.append("high_value")
+    if any((item.get("quantity") or 0) in ROUND_QUANTITIES for item in items):
+        signals.append("round_quantity")
+    if any((item.get("quantity") or 0) >= 5 for item in items):
+        signals.append("bulk_quantity")
+    if len(items) >= 3:
+        signals.append("multi_item")
+    return signals
+
+class OutcomeStatistics:
+    """
+    Running (outcomes, denied) counters keyed by (dimension, key).
+
+    Every status change into or out of APPROVED/DENIED adds or removes one
+    outcome for the claim's store, each of its item categories, each rule
+    signal it shows and, when this process scored it, each AI fraud pattern
+    that matched. Deltas are pushed to the `outcome_statistics` table in
+    batches (setup/outcome_statistics.sql) and the totals are re-read every
+    OUTCOME_STATS_REFRESH_SECONDS, so no recompute over all claims is needed.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("OUTCOME_STATS_ENABLED", "false").lower() == "true"
+        self.refresh_seconds = float(os.getenv("OUTCOME_STATS_REFRESH_SECONDS", "300"))
+        self.flush_interval_seconds = float(os.getenv("OUTCOME_STATS_FLUSH_INTERVAL_SECONDS", "2.0"))
+        # Pseudo-count pulling sparse keys towards the overall denial rate
+        self.prior_weight = float(os.getenv("OUTCOME_STATS_PRIOR_WEIGHT", "20"))
+        self.min_outcomes = int(os.getenv("OUTCOME_STATS_MIN_OUTCOMES", "30"))
+        # Share of the category factor taken from learned denial rates (0 keeps the static list)
+        self.blend_weight = min(1.0, max(0.0, float(os.getenv("OUTCOME_STATS_BLEND_WEIGHT", "0"))))
+        self.max_remembered_claims = int(os.getenv("OUTCOME_STATS_MAX_REMEMBERED_CLAIMS", "50000"))
+
+        self.counts: Dict[Key, List[int]] = {}
+        self.pending: Dict[Key, List[int]] = {}
+        # AI fraud patterns matched when a claim was scored, until its outcome arrives
+        self.claim_patterns: "OrderedDict[str, List[str]]" = OrderedDict()
+        self.last_refreshed: Optional[float] = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {"outcomes": 0, "reversals": 0, "flushes": 0, "failed_flushes": 0, "rows_written": 0}
+
+    def remember_patterns(self, claim_id: Any, fraud_indicators: List[Dict[str, Any]]):
+        """Keep the AI patterns a claim matched so its outcome can be credited to them"""
+        if not self.enabled or not claim_id or not fraud_indicators:
+            return
+        claim_id = str(claim_id)
+        self.claim_patterns[claim_id] = [indicator["pattern"] for indicator in fraud_indicators if indicator.get("pattern")]
+        self.claim_patterns.move_to_end(claim_id)
+        while len(self.claim_patterns) > self.max_remembered_claims:
+            self.claim_patterns.popitem(last=False)
+
+    def _keys(self, claim: Dict[str, Any], patterns: List[str]) -> List[Key]:
+        items = claim.get("claim_data") or []
+        keys = [("all", "all")]
+        if claim.get("store_id"):
+            keys.append(("store", str(claim["store_id"])))
+        categories = {str(item.get("category", "")).lower() for item in items if item.get("category")}
+        keys.extend(("category", category) for category in sorted(categories))
+        keys.extend(("signal", signal) for signal in claim_signals(items))
+        keys.extend(("pattern", pattern) for pattern in patterns)
+        return keys
+
+    def _apply(self, keys: List[Key], sign: int, denied: bool):
+        for key in keys:
+            for table in (self.counts, self.pending):
+                row = table.setdefault(key, [0, 0])
+                row[0] += sign
+                row[1] += sign if denied else 0
+
+    def _on_status_changed(self, claim: Dict[str, Any], previous_status: Optional[str] = None):
+        if not self.enabled:
+            return
+        new_status = claim.get("status")
+        if new_status == previous_status:
+            return
+        claim_id = str(claim.get("id"))
+        patterns = self.claim_patterns.get(claim_id, [])
+        keys = self._keys(claim, patterns)
+        if previous_status in RESOLVED_STATUSES:
+            self._apply(keys, -1, previous_status == "DENIED")
+            self.stats["reversals"] += 1
+        if new_status in RESOLVED_STATUSES:
+            self._apply(keys, 1, new_status == "DENIED")
+            self.stats["outcomes"] += 1
+        self._ensure_flush_task()
+
+    def denial_rate(self, dimension: str, key: str) -> Optional[float]:
+        """Denial rate of one key, smoothed towards the overall rate; None without outcomes"""
+        outcomes, denied = self.counts.get((dimension, key), (0, 0))
+        total_outcomes, total_denied = self.counts.get(("all", "all"), (0, 0))
+        if outcomes <= 0 or total_outcomes <= 0:
+            return None
+        prior = total_denied / total_outcomes
+        return (denied + prior * self.prior_weight) / (outcomes + self.prior_weight)
+
+    def category_risk(self, categories: Iterable[str]) -> Optional[float]:
+        """Mean learned denial rate (0-100) of a claim's categories, None until enough outcomes"""
+        if self.blend_weight <= 0 or self.counts.get(("all", "all"), (0, 0))[0] < self.min_outcomes:
+            return None
+        rates = [self.denial_rate("category", category.lower()) for category in categories if category]
+        rates = [rate for rate in rates if rate is not None]
+        return sum(rates) / len(rates) * 100 if rates else None
+
+    async def flush(self) -> int:
+        """Push pending deltas to the database, returns the number of keys written"""
+        async with self._flush_lock:
+            batch = {key: row for key, row in self.pending.items() if row != [0, 0]}
+            self.pending = {}
+            if not batch:
+                return 0
+            rows = [
+                {"dimension": dimension, "key": key, "outcomes": outcomes, "denied": denied}
+                for (dimension, key), (outcomes, denied) in batch.items()
+            ]
+            try:
+                await asyncio.to_thread(
+                    lambda: get_supabase_client().rpc("apply_outcome_statistics", {"p_rows": rows}).execute()
+                )
+            except Exception as e:
+                print(f"❌ Outcome statistics flush failed for {len(rows)} keys: {e}")
+                self.stats["failed_flushes"] += 1
+                # Merge back with deltas recorded in the meantime
+                for key, (outcomes, denied) in batch.items():
+                    row = self.pending.setdefault(key, [0, 0])
+                    row[0] += outcomes
+                    row[1] += denied
+                return 0
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(rows)
+            return len(rows)
+
+    def _ensure_flush_task(self):
+        if self._flush_task and not self._flush_task.done():
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_periodically())
+        except RuntimeError:
+            # No running loop (e.g. a script); the caller flushes explicitly
+            self._flush_task = None
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            if not self.pending:
+                return
+            await self.flush()
+
+    async def refresh(self):
+        """Replace the totals with the stored ones plus deltas not yet flushed"""
+        # Hold the flush lock so a batch is never in neither the table nor pending
+        async with self._flush_lock:
+            rows = await asyncio.to_thread(
+                lambda: get_supabase_client().table("outcome_statistics").select(
+                    "dimension, key, outcomes, denied"
+                ).execute().data or []
+            )
+            counts = {(row["dimension"], row["key"]): [row["outcomes"], row["denied"]] for row in rows}
+            for key, (outcomes, denied) in self.pending.items():
+                row = counts.setdefault(key, [0, 0])
+                row[0] += outcomes
+                row[1] += denied
+            self.counts = counts
+        self.last_refreshed = time.time()
+        print(f"📈 Outcome statistics loaded: {len(counts)} keys")
+
+    async def close(self):
+        """Flush whatever is left"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+    def _rates(self, dimension: str, limit: int) -> List[Dict[str, Any]]:
+        rows = []
+        for (row_dimension, key), (outcomes, denied) in self.counts.items():
+            if row_dimension != dimension or outcomes <= 0:
+                continue
+            rows.append({
+                "key": key,
+                "outcomes": outcomes,
+                "denied": denied,
+                "denialRate": round(denied / outcomes, 4),
+                "smoothedDenialRate": round(self.denial_rate(dimension, key), 4)
+            })
+        return sorted(rows, key=lambda row: row["smoothedDenialRate"], reverse=True)[:limit]
+
+    def get_stats(self, limit: int = 20) -> Dict[str, Any]:
+        """Get denial rates per category, rule signal and AI pattern"""
+        outcomes, denied = self.counts.get(("all", "all"), (0, 0))
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "blend_weight": self.blend_weight,
+            "total_outcomes": outcomes,
+            "overall_denial_rate": round(denied / outcomes, 4) if outcomes else None,
+            "pending_keys": len(self.pending),
+            "remembered_claims": len(self.claim_patterns),
+            "last_refreshed": self.last_refreshed,
+            "categories": self._rates("category", limit),
+            "signals": self._rates("signal", limit),
+            "patterns": self._rates("pattern", limit)
+        }
+
+# Global statistics, fed by every claim status change
+outcome_statistics = OutcomeStatistics()
+claim_events.on_status_changed(outcome_statistics._on_status_changed)
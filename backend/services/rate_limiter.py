@@ -0,0 +1,286 @@
+"""
+Rate Limiter
+Token buckets per caller and route class, optionally shared by all workers on a host
+"""
+
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from core.workers import get_worker_count
+
+# Routes that spend Cohere budget or scan many rows get their own, smaller buckets
+ROUTE_CLASSES = {
+    "ai": ("/api/v1/ml-fraud/analyze", "/api/v1/ml-fraud/jobs", "/api/v1/ml-fraud/submit-with-ml", "/api/v1/claims/submit"),
+    "search": ("/api/v1/admin/users/search", "/api/v1/admin/users/list"),
+}
+
+# Header: magic, capacity
+_HEADER = struct.Struct("<8sI")
+_HEADER_SIZE = 64
+_MAGIC = b"BSTNRTL1"
+# Record: tokens, last refill (epoch seconds), bucket key
+_RECORD = struct.Struct("<dd16s")
+# Slots probed per key; a full neighbourhood evicts its stalest bucket
+_PROBES = 8
+
+def _default_path() -> str:
+    base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base_dir, "bastion-rate-limits")
+
+@dataclass(frozen=True)
+class Limit:
+    """A bucket of `burst` tokens refilled at `per_minute` tokens per minute"""
+    name: str
+    per_minute: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+    @property
+    def window_seconds(self) -> int:
+        return max(1, int(round(self.burst / self.rate))) if self.rate else 0
+
+    def policy(self) -> str:
+        return f"{self.burst};w={self.window_seconds}"
+
+class LocalTokenBuckets:
+    """Buckets in a bounded LRU dict, private to this process"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.buckets: "OrderedDict[bytes, List[float]]" = OrderedDict()
+
+    def take_all(self, buckets: List[Tuple[bytes, Limit]], now: float) -> List[float]:
+        """
+        Take one token from every bucket, or from none of them if any is empty.
+        Returns the tokens each bucket has left after the take (negative where refused).
+        """
+        refilled = []
+        for key, limit in buckets:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [float(limit.burst), now]
+            else:
+                self.buckets.move_to_end(key)
+            bucket[0] = min(float(limit.burst), bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+            refilled.append(bucket)
+        remaining = [bucket[0] - 1 for bucket in refilled]
+        if min(remaining) >= 0:
+            for bucket in refilled:
+                bucket[0] -= 1
+        while len(self.buckets) > self.max_entries:
+            # The stalest bucket has refilled the most, so dropping it loses the least
+            self.buckets.popitem(last=False)
+        return remaining
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+class SharedTokenBuckets:
+    """
+    Open-addressing table of buckets in a memory-mapped file shared by all workers.
+
+    Every take is a read-modify-write of all of a request's buckets under one
+    flock, a few microseconds. When
+    the probed slots are all taken the stalest bucket is overwritten: a bucket
+    idle long enough to refill is indistinguishable from a fresh one.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self.size = _HEADER_SIZE + capacity * _RECORD.size
+        self._mm: Optional[mmap.mmap] = None
+        self._pid: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedTokenBuckets"]:
+        """Share buckets when running multi-worker or when explicitly enabled"""
+        enabled = os.getenv("RATE_LIMIT_SHARED")
+        if enabled is None:
+            if get_worker_count() <= 1:
+                return None
+        elif enabled.lower() != "true":
+            return None
+        path = os.getenv("RATE_LIMIT_SHARED_PATH") or _default_path()
+        return cls(path, int(os.getenv("RATE_LIMIT_SHARED_SLOTS", "65536")))
+
+    @staticmethod
+    def remove_files(path: Optional[str] = None):
+        """Delete buckets left over from a previous run"""
+        path = path or os.getenv("RATE_LIMIT_SHARED_PATH") or _default_path()
+        for suffix in ("", ".lock"):
+            try:
+                os.unlink(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _open(self) -> mmap.mmap:
+        """Map the table lazily so that every forked worker gets its own mapping"""
+        # Opened per process: an flock on a descriptor inherited across fork would not exclude anyone
+        if self._mm is not None and self._pid == os.getpid():
+            return self._mm
+        self._pid = os.getpid()
+        self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                valid = (
+                    len(header) == _HEADER.size
+                    and _HEADER.unpack(header) == (_MAGIC, self.capacity)
+                    and os.fstat(fd).st_size == self.size
+                )
+                if not valid:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, self.capacity), 0)
+                self._mm = mmap.mmap(fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            finally:
+                os.close(fd)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        return self._mm
+
+    def _offset(self, slot: int) -> int:
+        return _HEADER_SIZE + slot * _RECORD.size
+
+    def _refill(self, mm: mmap.mmap, key: bytes, limit: Limit, now: float) -> Tuple[int, float]:
+        """Find (or claim) the key's slot and store its refilled tokens; caller holds the lock"""
+        start = int.from_bytes(key[:8], "little") % self.capacity
+        target = None
+        stalest = None
+        for probe in range(min(_PROBES, self.capacity)):
+            slot = (start + probe) % self.capacity
+            tokens, last, slot_key = _RECORD.unpack_from(mm, self._offset(slot))
+            if slot_key == key:
+                target = slot
+                break
+            if last == 0:
+                target, tokens = slot, float(limit.burst)
+                break
+            if stalest is None or last < stalest[1]:
+                stalest = (slot, last)
+        if target is None:
+            target, tokens = stalest[0], float(limit.burst)
+            self.evictions += 1
+        elif slot_key != key:
+            tokens = float(limit.burst)
+        else:
+            tokens = min(float(limit.burst), tokens + (now - last) * limit.rate)
+        # Written at once, so a later key of the same request never evicts this slot
+        _RECORD.pack_into(mm, self._offset(target), tokens, now, key)
+        return target, tokens
+
+    def take_all(self, buckets: List[Tuple[bytes, Limit]], now: float) -> List[float]:
+        """Same contract as LocalTokenBuckets.take_all, atomic across workers"""
+        mm = self._open()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            refilled = [(key, self._refill(mm, key, limit, now)) for key, limit in buckets]
+            remaining = [tokens - 1 for _, (_, tokens) in refilled]
+            if min(remaining) >= 0:
+                for key, (slot, tokens) in refilled:
+                    _RECORD.pack_into(mm, self._offset(slot), tokens - 1, now, key)
+            return remaining
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+class RateLimiter:
+    """
+    Token-bucket limits per caller (API key, or client address without one) and route class.
+
+    Each route class has a per-minute rate with a burst allowance; AI-scoring
+    routes can additionally carry a daily quota, itself a slow-refilling bucket.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+        self.limits: Dict[str, List[Limit]] = {}
+        for route_class, per_minute, burst in (("ai", "30", "10"), ("search", "120", "30"), ("default", "600", "100")):
+            prefix = f"RATE_LIMIT_{route_class.upper()}"
+            self.limits[route_class] = [Limit(
+                route_class,
+                float(os.getenv(f"{prefix}_PER_MINUTE", per_minute)),
+                int(os.getenv(f"{prefix}_BURST", burst))
+            )]
+        ai_daily_quota = int(os.getenv("RATE_LIMIT_AI_DAILY_QUOTA", "0"))
+        if ai_daily_quota > 0:
+            self.limits["ai"].append(Limit("ai-daily", ai_daily_quota / 1440.0, ai_daily_quota))
+
+        self.shared = SharedTokenBuckets.from_env()
+        self.local = LocalTokenBuckets(int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000")))
+        self.stats = {"allowed": 0, "limited": 0}
+        self.limited_by_class: Dict[str, int] = {}
+
+    @staticmethod
+    def classify(path: str) -> str:
+        for route_class, paths in ROUTE_CLASSES.items():
+            if path in paths:
+                return route_class
+        return "default"
+
+    def check(self, caller: str, route_class: str) -> Tuple[bool, Dict[str, str]]:
+        """Take a token from every bucket of the class, or from none when one is empty; returns (allowed, headers)"""
+        now = time.time()
+        store = self.shared if self.shared is not None else self.local
+        limits = self.limits[route_class]
+        buckets = [(hashlib.blake2b(f"{limit.name}:{caller}".encode(), digest_size=16).digest(), limit)
+                   for limit in limits]
+        # A refused request costs nothing, so hammering a per-minute limit never drains the daily quota
+        taken = store.take_all(buckets, now)
+        allowed = min(taken) >= 0
+        tightest: Optional[Tuple[float, Limit]] = None
+        for remaining, limit in zip(taken, limits):
+            if tightest is None or remaining / limit.burst < tightest[0] / tightest[1].burst:
+                tightest = (remaining, limit)
+
+        remaining, limit = tightest
+        # Seconds until one token (refused) or a full bucket (allowed) is available
+        missing = (1 - (remaining + 1)) if remaining < 0 else (limit.burst - remaining)
+        reset = max(1, int(-(-missing // limit.rate))) if limit.rate else 0
+        headers = {
+            "RateLimit-Limit": str(limit.burst),
+            "RateLimit-Remaining": str(max(0, int(remaining))),
+            "RateLimit-Reset": str(reset),
+            "RateLimit-Policy": ", ".join(limit.policy() for limit in self.limits[route_class])
+        }
+        if allowed:
+            self.stats["allowed"] += 1
+        else:
+            self.stats["limited"] += 1
+            self.limited_by_class[route_class] = self.limited_by_class.get(route_class, 0) + 1
+            headers["Retry-After"] = str(reset)
+        return allowed, headers
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get limiter configuration and counters"""
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "limited_by_class": dict(self.limited_by_class),
+            "limits": {
+                route_class: [{"name": limit.name, "per_minute": limit.per_minute, "burst": limit.burst}
+                              for limit in limits]
+                for route_class, limits in self.limits.items()
+            },
+            "backend": "shared" if self.shared is not None else "local",
+            "local_buckets": len(self.local),
+            "shared_evictions": self.shared.evictions if self.shared is not None else 0
+        }
+
+# Global limiter
+rate_limiter = RateLimiter()
@@ -0,0 +1,159 @@
+"""
+Risk Distribution
+Compact per-user arrays of cached risk scores for histogram and calibration analytics
+"""
+
+import time
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+import numpy as np
+
+# Slot value for users without enough claims to score
+NO_SCORE = -1
+
+class RiskDistribution:
+    """
+    Mirror of the risk score cache as NumPy columns, one slot per user.
+
+    The cache pushes every stored result through update(), so the columns stay
+    current without rescanning users. Store membership is kept per user and
+    flattened into (user slot, store) pairs only when it changed since the last
+    query.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.slots: Dict[str, int] = {}
+        self.size = 0
+        self.score = np.full(capacity, NO_SCORE, dtype=np.int16)
+        self.flagged = np.zeros(capacity, dtype=np.bool_)
+        self.pending = np.zeros(capacity, dtype=np.int32)
+        self.approved = np.zeros(capacity, dtype=np.int32)
+        self.denied = np.zeros(capacity, dtype=np.int32)
+        self.user_stores: Dict[int, Tuple[str, ...]] = {}
+        self._pairs: Optional[Tuple[np.ndarray, np.ndarray, List[str]]] = None
+        self.last_synced: Optional[float] = None
+
+    def _grow(self):
+        capacity = len(self.score) * 2
+        for name, fill in (("score", NO_SCORE), ("flagged", False), ("pending", 0), ("approved", 0), ("denied", 0)):
+            column = getattr(self, name)
+            grown = np.full(capacity, fill, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def update(self, user_id: str, risk_data: Dict[str, Any]):
+        """Record a user's latest risk data"""
+        slot = self.slots.get(user_id)
+        if slot is None:
+            if self.size == len(self.score):
+                self._grow()
+            slot = self.slots[user_id] = self.size
+            self.size += 1
+
+        score = risk_data.get("risk_score")
+        self.score[slot] = NO_SCORE if score is None or risk_data.get("insufficient_data") else score
+        self.flagged[slot] = bool(risk_data.get("is_flagged"))
+        self.pending[slot] = risk_data.get("pending_claims", 0)
+        self.approved[slot] = risk_data.get("approved_claims", 0)
+        self.denied[slot] = risk_data.get("denied_claims", 0)
+
+        # Shared-segment records carry no store ids; keep what we already know then
+        store_ids = risk_data.get("store_ids")
+        if store_ids is not None:
+            store_ids = tuple(sorted(store_ids))
+            if self.user_stores.get(slot) != store_ids:
+                self.user_stores[slot] = store_ids
+                self._pairs = None
+
+    def sync(self, records: Iterable[Tuple[str, Dict[str, Any]]]):
+        """Refresh from another source of risk data (e.g. the shared segment)"""
+        for user_id, risk_data in records:
+            self.update(user_id, risk_data)
+        self.last_synced = time.monotonic()
+
+    def _store_pairs(self) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        if self._pairs is None:
+            store_codes: Dict[str, int] = {}
+            slots: List[int] = []
+            codes: List[int] = []
+            for slot, store_ids in self.user_stores.items():
+                for store_id in store_ids:
+                    slots.append(slot)
+                    codes.append(store_codes.setdefault(store_id, len(store_codes)))
+            self._pairs = (np.array(slots, dtype=np.int64), np.array(codes, dtype=np.int64), list(store_codes))
+        return self._pairs
+
+    def histogram(self, bins: int) -> Dict[str, Any]:
+        """User counts (and flagged counts) per equal-width score bin over 0-100"""
+        score = self.score[:self.size]
+        scored = score >= 0
+        # Scores of exactly 100 fall into the last bin
+        index = np.minimum(score[scored].astype(np.int64) * bins // 100, bins - 1)
+        users = np.bincount(index, minlength=bins)
+        flagged = np.bincount(index, weights=self.flagged[:self.size][scored], minlength=bins)
+        edges = [round(i * 100 / bins, 1) for i in range(bins + 1)]
+        return {
+            "totalUsers": int(self.size),
+            "scoredUsers": int(scored.sum()),
+            "insufficientData": int(self.size - scored.sum()),
+            "meanScore": round(float(score[scored].mean()), 1) if scored.any() else None,
+            "medianScore": float(np.median(score[scored])) if scored.any() else None,
+            "bins": [
+                {
+                    "min": edges[i],
+                    "max": edges[i + 1],
+                    "users": int(users[i]),
+                    "flagged": int(flagged[i])
+                }
+                for i in range(bins)
+            ]
+        }
+
+    def flagged_by_store(self) -> List[Dict[str, Any]]:
+        """Flagged ratio and mean score of the users who claimed at each store"""
+        slots, codes, store_ids = self._store_pairs()
+        if not len(slots):
+            return []
+        stores = len(store_ids)
+        score = self.score[slots]
+        scored = score >= 0
+        users = np.bincount(codes, minlength=stores)
+        flagged = np.bincount(codes, weights=self.flagged[slots], minlength=stores)
+        scored_users = np.bincount(codes[scored], minlength=stores)
+        score_sums = np.bincount(codes[scored], weights=score[scored], minlength=stores)
+
+        rows = []
+        for code, store_id in enumerate(store_ids):
+            rows.append({
+                "storeId": store_id,
+                "users": int(users[code]),
+                "flaggedUsers": int(flagged[code]),
+                "flaggedRatio": round(float(flagged[code] / users[code]), 4) if users[code] else 0.0,
+                "avgRiskScore": round(float(score_sums[code] / scored_users[code]), 1) if scored_users[code] else None
+            })
+        return sorted(rows, key=lambda row: row["flaggedRatio"], reverse=True)
+
+    def calibration(self) -> List[Dict[str, Any]]:
+        """Claim outcomes of the users in each score decile"""
+        score = self.score[:self.size]
+        scored = score >= 0
+        decile = np.minimum(score[scored].astype(np.int64) // 10, 9)
+        users = np.bincount(decile, minlength=10)
+        pending = np.bincount(decile, weights=self.pending[:self.size][scored], minlength=10)
+        approved = np.bincount(decile, weights=self.approved[:self.size][scored], minlength=10)
+        denied = np.bincount(decile, weights=self.denied[:self.size][scored], minlength=10)
+
+        rows = []
+        for i in range(10):
+            resolved = approved[i] + denied[i]
+            rows.append({
+                "decile": i + 1,
+                "minScore": i * 10,
+                "maxScore": 100 if i == 9 else i * 10 + 9,
+                "users": int(users[i]),
+                "pendingClaims": int(pending[i]),
+                "approvedClaims": int(approved[i]),
+                "deniedClaims": int(denied[i]),
+                "approvalRate": round(float(approved[i] / resolved), 4) if resolved else None,
+                "denialRate": round(float(denied[i] / resolved), 4) if resolved else None
+            })
+        return rows
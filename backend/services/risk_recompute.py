@@ -0,0 +1,277 @@
+"""
+Risk Recompute Engine
+Recomputes every user's risk score on a process pool, off the serving event loop
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Callable, Tuple
+from core.supabase_client import get_supabase_client
+from core.workers import get_available_cores
+from core.container import container
+from services.ml_fraud_service import MLFraudService
+from services.risk_score_cache import RiskScoreCache, build_risk_data, risk_score_cache
+
+# Page size for bulk reads, matches PostgREST's default max-rows
+PAGE_SIZE = 1000
+# Claims kept per user for the historical part of the score (same as MLFraudService)
+HISTORY_LIMIT = 100
+
+_worker_service: Optional[MLFraudService] = None
+
+def _init_worker(nice: int):
+    """Process pool initializer: lower priority and build one scoring service per process"""
+    global _worker_service
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+    # Forked workers inherit the parent's container; build their own Cohere client and service
+    container.override("cohere_client", None)
+    container.override("ml_fraud_service", None)
+    _worker_service = container.get("ml_fraud_service")
+
+def _score_shard(users: List[Dict[str, Any]], use_ai: bool, max_claims_per_user: int,
+                 fetch_claims_limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """Process pool entry point: score one shard of users"""
+    return asyncio.run(score_shard(_worker_service, users, use_ai, max_claims_per_user, fetch_claims_limit))
+
+def _fetch_shard_claims(user_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Fetch all claims of a shard in bulk, grouped per user newest first"""
+    supabase = get_supabase_client()
+    claims_by_user: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    offset = 0
+    while True:
+        response = (
+            supabase
+            .table("claims")
+            .select("id, user_id, store_id, email_at_store, status, created_at, claim_data")
+            .in_("user_id", user_ids)
+            .order("created_at", desc=True)
+            .range(offset, offset + PAGE_SIZE - 1)
+            .execute()
+        )
+        rows = response.data or []
+        for row in rows:
+            claims_by_user[row["user_id"]].append(row)
+        if len(rows) < PAGE_SIZE:
+            return claims_by_user
+        offset += PAGE_SIZE
+
+async def score_shard(service: MLFraudService, users: List[Dict[str, Any]], use_ai: bool,
+                      max_claims_per_user: int, fetch_claims_limit: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """Score a shard of users from one bulk claims fetch, using the same logic as the live cache"""
+    # The bulk fetch blocks; keep it off the loop, which with processes=0 is the serving one
+    claims_by_user = await asyncio.to_thread(_fetch_shard_claims, [user["id"] for user in users])
+
+    results = []
+    for user in users:
+        claims = claims_by_user.get(user["id"], [])
+        user_data = MLFraudService.build_user_data(user)
+        historical_data = MLFraudService.build_historical_data(claims[:HISTORY_LIMIT])
+
+        async def score_items(items: List[Dict[str, Any]]) -> int:
+            fraud_analysis = await service.score_claim(user_data, items, historical_data, use_ai=use_ai)
+            return fraud_analysis["fraud_score"]
+
+        risk_data = await build_risk_data(claims[:fetch_claims_limit], score_items, max_claims_per_user)
+        results.append((user["id"], risk_data))
+    return results
+
+class RiskRecomputeJob:
+    """Progress of a single full-population recompute"""
+
+    def __init__(self, reason: str):
+        self.id = str(uuid.uuid4())
+        self.reason = reason
+        self.status = "queued"
+        self.total_users = 0
+        self.processed_users = 0
+        self.failed_users = 0
+        self.total_shards = 0
+        self.completed_shards = 0
+        self.processes = 0
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self._started = 0.0
+        self._elapsed: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self._elapsed is not None:
+            elapsed = self._elapsed
+        else:
+            elapsed = time.perf_counter() - self._started if self._started else 0.0
+        done = self.processed_users + self.failed_users
+        return {
+            "job_id": self.id,
+            "reason": self.reason,
+            "status": self.status,
+            "total_users": self.total_users,
+            "processed_users": self.processed_users,
+            "failed_users": self.failed_users,
+            "progress": round(done / self.total_users * 100, 1) if self.total_users else 0.0,
+            "total_shards": self.total_shards,
+            "completed_shards": self.completed_shards,
+            "processes": self.processes,
+            "elapsed_seconds": round(elapsed, 2),
+            "users_per_second": round(self.processed_users / elapsed, 1) if elapsed else 0.0,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+
+class RiskRecomputeEngine:
+    """
+    Shards all users across a process pool and streams results into the cache.
+
+    Each worker fetches its shard's claims in bulk and scores them with the same
+    MLFraudService logic as live recalculation. Results flow back into the risk
+    score cache (and its write-back buffer) as shards complete.
+    """
+
+    def __init__(self, cache: RiskScoreCache):
+        self.cache = cache
+        self.supabase = get_supabase_client()
+        # 0 runs the shards on the event loop (useful for debugging)
+        self.processes = int(os.getenv("RISK_RECOMPUTE_PROCESSES", str(get_available_cores())))
+        self.shard_size = int(os.getenv("RISK_RECOMPUTE_SHARD_SIZE", "100"))
+        self.worker_nice = int(os.getenv("RISK_RECOMPUTE_NICE", "10"))
+        self.start_method = os.getenv("RISK_RECOMPUTE_START_METHOD", "spawn")
+        # Periodic full recomputes on the cache owner; 0 / unset leaves only the startup warm-up
+        self.interval_seconds = float(os.getenv("RISK_RECOMPUTE_INTERVAL_SECONDS", "0"))
+        self.cron = os.getenv("RISK_RECOMPUTE_CRON") or None
+        # Scheduled runs still going after this long are cancelled; 0 waits indefinitely
+        self.timeout_seconds = float(os.getenv("RISK_RECOMPUTE_TIMEOUT_SECONDS", "3600")) or None
+        self.current_job: Optional[RiskRecomputeJob] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, reason: str = "manual") -> RiskRecomputeJob:
+        """Start a recompute in the background, raises RuntimeError if one is running"""
+        if self.is_running():
+            raise RuntimeError("A risk recompute job is already running")
+        job = RiskRecomputeJob(reason)
+        self.current_job = job
+        self._task = asyncio.create_task(self.run(job))
+        return job
+
+    async def run_scheduled(self, reason: str) -> RiskRecomputeJob:
+        """Start a recompute and wait for it, so the scheduler sees its duration and errors"""
+        job = self.start(reason=reason)
+        try:
+            await asyncio.shield(self._task)
+        except asyncio.CancelledError:
+            # Timed out or shutting down: stop the process pool rather than leave it running unwatched
+            self._task.cancel()
+            raise
+        if job.status == "failed":
+            raise RuntimeError(job.error)
+        return job
+
+    def _fetch_users(self) -> List[Dict[str, Any]]:
+        users = []
+        offset = 0
+        while True:
+            response = self.supabase.table("users").select("*").range(offset, offset + PAGE_SIZE - 1).execute()
+            rows = response.data or []
+            users.extend(rows)
+            if len(rows) < PAGE_SIZE:
+                return users
+            offset += PAGE_SIZE
+
+    async def run(self, job: Optional[RiskRecomputeJob] = None,
+                  progress: Optional[Callable[[RiskRecomputeJob], None]] = None) -> RiskRecomputeJob:
+        """Run a full recompute to completion"""
+        job = job or RiskRecomputeJob("manual")
+        self.current_job = job
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        job._started = time.perf_counter()
+        print(f"🚀 Starting risk recompute job {job.id} ({job.reason})...")
+
+        try:
+            users = await asyncio.to_thread(self._fetch_users)
+            job.total_users = len(users)
+
+            # Seed the write-back buffer so unchanged scores are not written again
+            for user in users:
+                self.cache.write_buffer.remember(user["id"], user.get("risk_score"), bool(user.get("is_flagged")))
+
+            shards = [users[i:i + self.shard_size] for i in range(0, len(users), self.shard_size)]
+            job.total_shards = len(shards)
+            args = (self.cache.use_ai_in_cache, self.cache.max_claims_per_user, self.cache.fetch_claims_limit)
+
+            if shards and self.processes > 0:
+                job.processes = min(self.processes, len(shards))
+                pool = ProcessPoolExecutor(
+                    max_workers=job.processes,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=(self.worker_nice,)
+                )
+                try:
+                    async def run_shard(shard):
+                        try:
+                            return shard, await asyncio.wrap_future(pool.submit(_score_shard, shard, *args))
+                        except Exception as e:
+                            return shard, e
+
+                    pending = [run_shard(shard) for shard in shards]
+                    for next_done in asyncio.as_completed(pending):
+                        self._apply_shard(job, *await next_done)
+                        if progress:
+                            progress(job)
+                finally:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            else:
+                for shard in shards:
+                    try:
+                        results = await score_shard(self.cache.ml_fraud_service, shard, *args)
+                        self._apply_shard(job, shard, results)
+                    except Exception as e:
+                        self._apply_shard(job, shard, e)
+                    if progress:
+                        progress(job)
+
+            await self.cache.write_buffer.flush()
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            print(f"⚠️ Risk recompute job {job.id} cancelled")
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"❌ Risk recompute job {job.id} failed: {e}")
+        finally:
+            job.finished_at = datetime.utcnow()
+            job._elapsed = time.perf_counter() - job._started
+
+        if job.status == "completed":
+            print(f"✅ Risk recompute job {job.id} complete: {job.processed_users} users scored, "
+                  f"{job.failed_users} failed in {job._elapsed:.1f}s")
+        return job
+
+    def _apply_shard(self, job: RiskRecomputeJob, shard: List[Dict[str, Any]], results: Any):
+        job.completed_shards += 1
+        if isinstance(results, Exception):
+            print(f"Error scoring shard of {len(shard)} users: {results}")
+            job.failed_users += len(shard)
+            return
+        for user_id, risk_data in results:
+            self.cache.store_result(user_id, risk_data)
+        job.processed_users += len(results)
+        job.failed_users += len(shard) - len(results)
+
+# Global engine instance
+risk_recompute_engine = RiskRecomputeEngine(risk_score_cache)
@@ -6,11 +6,140 @@ Handles background calculation and caching of user risk scores to improve perfor
 import asyncio
 import os
 import uuid
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Awaitable, Callable
 from datetime import datetime, timedelta
 import json
+import time
 from core.supabase_client import get_supabase_client
-from services.ml_fraud_service import MLFraudService
+from core.container import container
+from services.risk_score_writeback import RiskScoreWriteBuffer
+from services.shared_risk_cache import SharedRiskScoreSegment
+from services.risk_distribution import RiskDistribution
+from services.data_versions import data_versions
+
+async def build_risk_data(claims: List[Dict[str, Any]],
+                          score_items: Callable[[List[Dict[str, Any]]], Awaitable[int]],
+                          max_claims_per_user: int) -> Dict[str, Any]:
+    """
+    Aggregate a user's recent claims (newest first) into cached risk data
+    
+    score_items returns the fraud score of a single claim's items, so the same
+    aggregation serves per-user recalculation and bulk recomputation.
+    """
+    # If no claims, mark as insufficient data
+    if not claims:
+        risk_data = {
+            "risk_score": None,  # N/A
+            "is_flagged": False,
+            "insufficient_data": True,
+            "total_claims": 0,
+            "store_ids": [],
+            "last_calculated": datetime.utcnow().isoformat()
+        }
+        return risk_data
+    
+    # Calculate statistics
+    total_claims = len(claims)
+    pending_claims = len([c for c in claims if c["status"] == "PENDING"])
+    approved_claims = len([c for c in claims if c["status"] == "APPROVED"])
+    denied_claims = len([c for c in claims if c["status"] == "DENIED"])
+    
+    # Process claims for ML analysis
+    processed_claims = []
+    total_value = 0
+    
+    # Analyze only the most recent N claims to reduce processing
+    for claim in claims[:max_claims_per_user]:
+        claim_data = claim.get("claim_data", [])
+        if isinstance(claim_data, str):
+            try:
+                claim_data = json.loads(claim_data)
+            except:
+                claim_data = []
+        
+        if claim_data:
+            claim_value = sum(float(item.get("price", 0)) * int(item.get("quantity", 1)) for item in claim_data)
+            total_value += claim_value
+            processed_claims.append({
+                "items": claim_data,
+                "status": claim["status"],
+                "value": claim_value
+            })
+    
+    # Calculate risk score using ML fraud detection
+    calculated_risk_score = 0
+    calculated_is_flagged = False
+    
+    if processed_claims:
+        # Calculate risk score based on all user's claims
+        risk_scores = []
+        high_risk_claims = 0
+        
+        for claim in processed_claims:
+            if claim["items"]:
+                # Calculate fraud score for this claim
+                fraud_score = await score_items(claim["items"])
+                risk_scores.append(fraud_score)
+                
+                # Count high-risk claims (score > 70)
+                if fraud_score > 70:
+                    high_risk_claims += 1
+        
+        if risk_scores:
+            # Calculate weighted risk score
+            avg_risk_score = sum(risk_scores) / len(risk_scores)
+            
+            # Apply penalties for patterns
+            penalty_factors = 0
+            
+            # Penalty for high denial rate
+            if total_claims > 0:
+                denial_rate = denied_claims / total_claims
+                if denial_rate > 0.5:  # More than 50% denied
+                    penalty_factors += 20
+                elif denial_rate > 0.3:  # More than 30% denied
+                    penalty_factors += 10
+            
+            # Penalty for high-value claims
+            if total_claims > 0:
+                avg_claim_value = total_value / total_claims
+                if avg_claim_value > 500:  # High-value claims
+                    penalty_factors += 15
+                elif avg_claim_value > 200:  # Medium-value claims
+                    penalty_factors += 5
+            
+            # Penalty for frequent claims
+            if total_claims > 10:  # More than 10 claims
+                penalty_factors += 10
+            elif total_claims > 5:  # More than 5 claims
+                penalty_factors += 5
+            
+            # Penalty for high proportion of high-risk claims
+            if total_claims > 0:
+                high_risk_ratio = high_risk_claims / total_claims
+                if high_risk_ratio > 0.5:  # More than 50% high-risk
+                    penalty_factors += 25
+                elif high_risk_ratio > 0.3:  # More than 30% high-risk
+                    penalty_factors += 15
+            
+            # Calculate final risk score
+            calculated_risk_score = min(100, int(avg_risk_score + penalty_factors))
+            calculated_is_flagged = calculated_risk_score > 75
+    
+    risk_data = {
+        "risk_score": calculated_risk_score,
+        "is_flagged": calculated_is_flagged,
+        "insufficient_data": False,
+        "total_claims": total_claims,
+        "pending_claims": pending_claims,
+        "approved_claims": approved_claims,
+        "denied_claims": denied_claims,
+        "total_value": total_value,
+        # Stores the user claimed at, for per-store risk analytics
+        "store_ids": sorted({str(c["store_id"]) for c in claims if c.get("store_id")}),
+        "last_calculated": datetime.utcnow().isoformat()
+    }
+    return risk_data
 
 class RiskScoreCache:
     """
@@ -19,53 +148,47 @@ class RiskScoreCache:
     
     def __init__(self):
         self.cache: Dict[str, Dict[str, Any]] = {}
-        self.ml_fraud_service = MLFraudService()
         self.supabase = get_supabase_client()
         self.last_updated = {}
         self.calculation_in_progress = set()
+        # Recalculations started without awaiting them, kept referenced until done
+        self._background_tasks = set()
+        # Recomputed scores are written back in batches instead of one update per user
+        self.write_buffer = RiskScoreWriteBuffer()
+        # Host-wide segment shared by all workers (None when running a single process)
+        self.shared = SharedRiskScoreSegment.from_env()
+        # Compact score columns for distribution analytics, updated on every store
+        self.distribution = RiskDistribution()
+        self.distribution_sync_seconds = float(os.getenv("RISK_DISTRIBUTION_SYNC_SECONDS", "30"))
         # Configuration to limit AI/claim processing in cache to avoid excessive Cohere calls
         self.use_ai_in_cache = (os.getenv("COHERE_USE_AI_IN_CACHE", "false").lower() == "true")
         self.max_claims_per_user = int(os.getenv("RISK_CACHE_MAX_CLAIMS_PER_USER", "3"))
         self.fetch_claims_limit = int(os.getenv("RISK_CACHE_FETCH_LIMIT", "20"))
     
-    async def initialize_cache(self):
-        """Initialize cache with all users on startup"""
-        print("🚀 Starting risk score cache initialization...")
-        
-        try:
-            # Get all users
-            users_response = self.supabase.table("users").select("id, full_name, created_at").execute()
-            
-            if not users_response.data:
-                print("No users found to calculate risk scores for")
-                return
-            
-            total_users = len(users_response.data)
-            print(f"📊 Calculating risk scores for {total_users} users...")
-            
-            # Calculate risk scores for all users in batches to avoid overwhelming the system
-            batch_size = 5
-            for i in range(0, total_users, batch_size):
-                batch = users_response.data[i:i + batch_size]
-                tasks = []
-                
-                for user in batch:
-                    user_id = user["id"]
-                    if user_id not in self.calculation_in_progress:
-                        self.calculation_in_progress.add(user_id)
-                        tasks.append(self._calculate_user_risk_score(user_id))
-                
-                # Process batch concurrently
-                if tasks:
-                    await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # Small delay between batches to prevent overwhelming the system
-                await asyncio.sleep(0.1)
-            
-            print(f"✅ Risk score cache initialization complete! Cached {len(self.cache)} users")
-            
-        except Exception as e:
-            print(f"❌ Error initializing risk score cache: {e}")
+    @property
+    def ml_fraud_service(self):
+        # Shared with the route handlers, built on first scoring
+        return container.get("ml_fraud_service")
+    
+    def should_warm_up(self) -> bool:
+        """Only one worker per host warms the cache up when the segment is shared"""
+        return self.shared is None or self.shared.try_become_owner()
+    
+    def _store(self, user_id: str, risk_data: Dict[str, Any]):
+        """Cache risk data locally and publish it to the other workers"""
+        self.cache[user_id] = risk_data
+        self.distribution.update(user_id, risk_data)
+        data_versions.bump("risk")
+        data_versions.bump_user(user_id)
+        if self.shared is not None:
+            self.shared.put(user_id, risk_data)
+    
+    def _get_cached(self, user_id: str) -> Optional[Dict[str, Any]]:
+        if self.shared is not None:
+            risk_data = self.shared.get(user_id)
+            if risk_data is not None:
+                return risk_data
+        return self.cache.get(user_id)
     
     async def _calculate_user_risk_score(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Calculate risk score for a single user"""
@@ -74,7 +197,7 @@ class RiskScoreCache:
             claims_response = (
                 self.supabase
                 .table("claims")
-                .select("id, status, created_at, claim_data")
+                .select("id, store_id, status, created_at, claim_data")
                 .eq("user_id", user_id)
                 .order("created_at", desc=True)
                 .limit(self.fetch_claims_limit)
@@ -83,133 +206,16 @@ class RiskScoreCache:
             
             claims = claims_response.data if claims_response.data else []
             
-            # If no claims, mark as insufficient data
-            if not claims:
-                risk_data = {
-                    "risk_score": None,  # N/A
-                    "is_flagged": False,
-                    "insufficient_data": True,
-                    "total_claims": 0,
-                    "last_calculated": datetime.utcnow().isoformat()
-                }
-                self.cache[user_id] = risk_data
-                self.calculation_in_progress.discard(user_id)
-                return risk_data
-            
-            # Calculate statistics
-            total_claims = len(claims)
-            pending_claims = len([c for c in claims if c["status"] == "PENDING"])
-            approved_claims = len([c for c in claims if c["status"] == "APPROVED"])
-            denied_claims = len([c for c in claims if c["status"] == "DENIED"])
-            
-            # Process claims for ML analysis
-            processed_claims = []
-            total_value = 0
-            
-            # Analyze only the most recent N claims to reduce processing
-            for claim in claims[: self.max_claims_per_user]:
-                claim_data = claim.get("claim_data", [])
-                if isinstance(claim_data, str):
-                    try:
-                        claim_data = json.loads(claim_data)
-                    except:
-                        claim_data = []
-                
-                if claim_data:
-                    claim_value = sum(float(item.get("price", 0)) * int(item.get("quantity", 1)) for item in claim_data)
-                    total_value += claim_value
-                    processed_claims.append({
-                        "items": claim_data,
-                        "status": claim["status"],
-                        "value": claim_value
-                    })
-            
-            # Calculate risk score using ML fraud detection
-            calculated_risk_score = 0
-            calculated_is_flagged = False
-            
-            if processed_claims:
-                # Calculate risk score based on all user's claims
-                risk_scores = []
-                high_risk_claims = 0
-                
-                for claim in processed_claims:
-                    if claim["items"]:
-                        # Calculate fraud score for this claim
-                        fraud_analysis = await self.ml_fraud_service.calculate_fraud_score(
-                            user_id=uuid.UUID(user_id),
-                            claim_data=claim["items"],
-                            use_ai=self.use_ai_in_cache
-                        )
-                        risk_scores.append(fraud_analysis["fraud_score"])
-                        
-                        # Count high-risk claims (score > 70)
-                        if fraud_analysis["fraud_score"] > 70:
-                            high_risk_claims += 1
-                
-                if risk_scores:
-                    # Calculate weighted risk score
-                    avg_risk_score = sum(risk_scores) / len(risk_scores)
-                    
-                    # Apply penalties for patterns
-                    penalty_factors = 0
-                    
-                    # Penalty for high denial rate
-                    if total_claims > 0:
-                        denial_rate = denied_claims / total_claims
-                        if denial_rate > 0.5:  # More than 50% denied
-                            penalty_factors += 20
-                        elif denial_rate > 0.3:  # More than 30% denied
-                            penalty_factors += 10
-                    
-                    # Penalty for high-value claims
-                    if total_claims > 0:
-                        avg_claim_value = total_value / total_claims
-                        if avg_claim_value > 500:  # High-value claims
-                            penalty_factors += 15
-                        elif avg_claim_value > 200:  # Medium-value claims
-                            penalty_factors += 5
-                    
-                    # Penalty for frequent claims
-                    if total_claims > 10:  # More than 10 claims
-                        penalty_factors += 10
-                    elif total_claims > 5:  # More than 5 claims
-                        penalty_factors += 5
-                    
-                    # Penalty for high proportion of high-risk claims
-                    if total_claims > 0:
-                        high_risk_ratio = high_risk_claims / total_claims
-                        if high_risk_ratio > 0.5:  # More than 50% high-risk
-                            penalty_factors += 25
-                        elif high_risk_ratio > 0.3:  # More than 30% high-risk
-                            penalty_factors += 15
-                    
-                    # Calculate final risk score
-                    calculated_risk_score = min(100, int(avg_risk_score + penalty_factors))
-                    calculated_is_flagged = calculated_risk_score > 75
-            
-            # Cache the results
-            risk_data = {
-                "risk_score": calculated_risk_score,
-                "is_flagged": calculated_is_flagged,
-                "insufficient_data": False,
-                "total_claims": total_claims,
-                "pending_claims": pending_claims,
-                "approved_claims": approved_claims,
-                "denied_claims": denied_claims,
-                "total_value": total_value,
-                "last_calculated": datetime.utcnow().isoformat()
-            }
-            
-            self.cache[user_id] = risk_data
-            self.last_updated[user_id] = datetime.utcnow()
-            
-            # Update database with calculated values
-            self.supabase.table("users").update({
-                "risk_score": calculated_risk_score,
-                "is_flagged": calculated_is_flagged
-            }).eq("id", user_id).execute()
+            async def score_items(items: List[Dict[str, Any]]) -> int:
+                fraud_analysis = await self.ml_fraud_service.calculate_fraud_score(
+                    user_id=uuid.UUID(user_id),
+                    claim_data=items,
+                    use_ai=self.use_ai_in_cache
+                )
+                return fraud_analysis["fraud_score"]
             
+            risk_data = await build_risk_data(claims, score_items, self.max_claims_per_user)
+            self.store_result(user_id, risk_data)
             self.calculation_in_progress.discard(user_id)
             return risk_data
             
@@ -218,10 +224,19 @@ class RiskScoreCache:
             self.calculation_in_progress.discard(user_id)
             return None
     
+    def store_result(self, user_id: str, risk_data: Dict[str, Any]):
+        """Cache freshly calculated risk data and queue it for write-back"""
+        self._store(user_id, risk_data)
+        if risk_data.get("insufficient_data"):
+            return
+        self.last_updated[user_id] = datetime.utcnow()
+        self.write_buffer.add(user_id, risk_data["risk_score"], risk_data["is_flagged"])
+    
     async def get_user_risk_score(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get cached risk score for a user"""
-        if user_id in self.cache:
-            return self.cache[user_id]
+        cached = self._get_cached(user_id)
+        if cached is not None:
+            return cached
         
         # If not in cache and not currently being calculated, calculate it
         if user_id not in self.calculation_in_progress:
@@ -234,6 +249,24 @@ class RiskScoreCache:
         if user_id not in self.calculation_in_progress:
             await self._calculate_user_risk_score(user_id)
     
+    def recalculate_in_background(self, user_id: str):
+        """Recalculate a user's risk score without making the caller wait for it"""
+        if user_id in self.calculation_in_progress:
+            return
+        task = asyncio.get_running_loop().create_task(self.recalculate_user_risk_score(user_id))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def get_distribution(self) -> RiskDistribution:
+        """Score columns for analytics, synced from the shared segment in non-owner workers"""
+        if self.shared is not None and not self.shared.is_owner():
+            last_synced = self.distribution.last_synced
+            if last_synced is None or time.monotonic() - last_synced > self.distribution_sync_seconds:
+                records = await asyncio.to_thread(lambda: list(self.shared.items()))
+                self.distribution.sync(records)
+                data_versions.bump("risk")
+        return self.distribution
+    
     def get_cache_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
         total_users = len(self.cache)
@@ -244,7 +277,9 @@ class RiskScoreCache:
             "total_cached_users": total_users,
             "users_with_risk_scores": users_with_data,
             "users_with_insufficient_data": users_without_data,
-            "calculations_in_progress": len(self.calculation_in_progress)
+            "calculations_in_progress": len(self.calculation_in_progress),
+            "write_back": self.write_buffer.get_stats(),
+            "shared_segment": self.shared.get_stats() if self.shared is not None else None
         }
 
 # Global cache instance
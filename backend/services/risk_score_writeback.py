@@ -0,0 +1,145 @@
+"""
+Risk Score Write-Back Buffer
+Coalesces recomputed user risk scores and flushes them to the database in batches
+"""
+
+import asyncio
+import os
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from core.supabase_client import get_supabase_client
+
+class RiskScoreWriteBuffer:
+    """
+    Collects (risk_score, is_flagged) updates per user and writes them back in bulk.
+
+    Users that end up with the same values are written with a single
+    ``update(...).in_("id", [...])`` call, so a flush costs at most one request
+    per distinct (score, flag) pair per chunk instead of one request per user.
+    """
+
+    def __init__(self):
+        self.supabase = get_supabase_client()
+        self.pending: Dict[str, Tuple[Optional[int], bool]] = {}
+        # Last values known to be in the database, used to skip no-op writes
+        self.last_written: Dict[str, Tuple[Optional[int], bool]] = {}
+        self.max_batch_size = int(os.getenv("RISK_WRITEBACK_BATCH_SIZE", "500"))
+        self.flush_interval_seconds = float(os.getenv("RISK_WRITEBACK_FLUSH_INTERVAL_SECONDS", "2.0"))
+        # Number of ids per ``in_`` filter, keeps request URLs well below proxy limits
+        self.ids_per_request = int(os.getenv("RISK_WRITEBACK_IDS_PER_REQUEST", "100"))
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {
+            "queued": 0,
+            "skipped_unchanged": 0,
+            "rows_written": 0,
+            "requests": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def remember(self, user_id: str, risk_score: Optional[int], is_flagged: bool):
+        """Record values already present in the database (e.g. read from the users table)"""
+        self.last_written[user_id] = (risk_score, is_flagged)
+
+    def add(self, user_id: str, risk_score: Optional[int], is_flagged: bool):
+        """Queue a score for write-back, skipping it when the stored values are unchanged"""
+        values = (risk_score, is_flagged)
+        if self.pending.get(user_id, self.last_written.get(user_id)) == values:
+            self.stats["skipped_unchanged"] += 1
+            return
+
+        self.pending[user_id] = values
+        self.stats["queued"] += 1
+        self._ensure_flush_task()
+
+        if len(self.pending) >= self.max_batch_size:
+            self._schedule_flush()
+
+    async def flush(self) -> int:
+        """Write all pending scores to the database, returns the number of rows written"""
+        async with self._flush_lock:
+            if not self.pending:
+                return 0
+
+            batch = self.pending
+            self.pending = {}
+
+            started = time.perf_counter()
+            try:
+                requests_made = await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                print(f"❌ Risk score write-back failed for {len(batch)} users: {e}")
+                self.stats["failed_flushes"] += 1
+                # Re-queue without clobbering values recomputed in the meantime
+                for user_id, values in batch.items():
+                    self.pending.setdefault(user_id, values)
+                return 0
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.last_written.update(batch)
+            self.stats["rows_written"] += len(batch)
+            self.stats["requests"] += requests_made
+            self.stats["flushes"] += 1
+            self.stats["last_flush_ms"] = round(elapsed_ms, 2)
+            self.stats["max_flush_ms"] = round(max(self.stats["max_flush_ms"], elapsed_ms), 2)
+            self.stats["total_flush_ms"] += elapsed_ms
+            return len(batch)
+
+    def _write_batch(self, batch: Dict[str, Tuple[Optional[int], bool]]) -> int:
+        """Group users by identical values and issue one update per group chunk"""
+        groups: Dict[Tuple[Optional[int], bool], List[str]] = {}
+        for user_id, values in batch.items():
+            groups.setdefault(values, []).append(user_id)
+
+        requests_made = 0
+        for (risk_score, is_flagged), user_ids in groups.items():
+            for i in range(0, len(user_ids), self.ids_per_request):
+                chunk = user_ids[i:i + self.ids_per_request]
+                self.supabase.table("users").update({
+                    "risk_score": risk_score,
+                    "is_flagged": is_flagged
+                }).in_("id", chunk).execute()
+                requests_made += 1
+        return requests_made
+
+    def _schedule_flush(self):
+        try:
+            asyncio.get_running_loop().create_task(self.flush())
+        except RuntimeError:
+            # No running loop (e.g. called from a script); the caller flushes explicitly
+            pass
+
+    def _ensure_flush_task(self):
+        if self._flush_task and not self._flush_task.done():
+            return
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_periodically())
+        except RuntimeError:
+            self._flush_task = None
+
+    async def _flush_periodically(self):
+        """Flush on a timer until the buffer stays empty"""
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            if not self.pending:
+                return
+            await self.flush()
+
+    async def close(self):
+        """Stop the timer and flush whatever is left"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get write-back statistics including flush latency"""
+        flushes = self.stats["flushes"]
+        return {
+            **{k: v for k, v in self.stats.items() if k != "total_flush_ms"},
+            "pending": len(self.pending),
+            "avg_flush_ms": round(self.stats["total_flush_ms"] / flushes, 2) if flushes else 0.0,
+        }
@@ -0,0 +1,326 @@
+"""
+Job Scheduler
+Supervised interval and cron jobs for the background work of a serving worker
+"""
+
+import asyncio
+import fcntl
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from services.admission import admission_controller
+
+# Lane of the jobs bounded by SCHEDULER_MAX_CONCURRENT_JOBS
+SHARED_LANE = "shared"
+
+# Field ranges of "minute hour day-of-month month day-of-week"; day-of-week 0 is Sunday
+_CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+class CronSchedule:
+    """
+    Five-field cron expression evaluated in UTC. Each field is `*`, a number, a
+    range `a-b`, a step `*/n` or `a-b/n`, or a comma-separated list of those.
+    """
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, _CRON_FIELDS)
+        )
+        # Like cron, a restricted day-of-month and day-of-week match if either does
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        try:
+            for part in field.split(","):
+                span, _, step = part.partition("/")
+                step = int(step) if step else 1
+                if span == "*":
+                    start, end = low, high
+                elif "-" in span:
+                    start, end = (int(value) for value in span.split("-", 1))
+                else:
+                    start = int(span)
+                    end = high if "/" in part else start
+                if start < low or end > high or start > end or step < 1:
+                    raise ValueError
+                values.update(range(start, end + 1, step))
+        except ValueError:
+            raise ValueError(f"Invalid cron field {field!r}") from None
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after `moment` (UTC)"""
+        candidate = moment.astimezone(timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Skip whole months, days and hours at a time; five years covers every valid expression
+        limit = candidate + timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                month_start = candidate.replace(day=1, hour=0, minute=0)
+                candidate = (month_start + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+class ScheduledJob:
+    """
+    One registered job: its schedule and limits, plus what its runs did.
+
+    `lane` picks the concurrency cap a run waits for: the shared lane, a named
+    lane of its own that runs one job at a time (so a long job cannot starve the
+    shared one), or None for no cap (one-off startup loads).
+    """
+
+    def __init__(self, name: str, func: Callable[[], Awaitable[Any]], interval: Optional[float] = None,
+                 cron: Optional[str] = None, run_at_start: bool = False, jitter: float = 0.0,
+                 max_concurrent: int = 1, timeout: Optional[float] = None, singleton: bool = False,
+                 lane: Optional[str] = SHARED_LANE):
+        if interval is not None and interval <= 0:
+            raise ValueError(f"Job {name} needs a positive interval")
+        if interval is not None and cron:
+            raise ValueError(f"Job {name} takes an interval or a cron expression, not both")
+        if interval is None and not cron and not run_at_start:
+            raise ValueError(f"Job {name} would never run")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.cron = CronSchedule(cron) if cron else None
+        self.run_at_start = run_at_start
+        self.jitter = jitter
+        self.max_concurrent = max(1, max_concurrent)
+        self.timeout = timeout
+        self.singleton = singleton
+        self.lane = lane
+
+        self.running: Set[asyncio.Task] = set()
+        self.next_run_at: Optional[float] = None
+        self.last_started_at: Optional[float] = None
+        self.last_finished_at: Optional[float] = None
+        self.last_status: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.last_duration_ms: Optional[float] = None
+        self.total_duration_ms = 0.0
+        self.max_duration_ms = 0.0
+        self.stats = {"runs": 0, "succeeded": 0, "failed": 0, "timed_out": 0,
+                      "skipped_overlap": 0, "skipped_elsewhere": 0, "deferred": 0}
+
+    def next_slot(self, now: float) -> float:
+        """Next due time (epoch seconds) before jitter; interval slots are aligned to the clock"""
+        if self.cron is not None:
+            return self.cron.next_after(datetime.fromtimestamp(now, timezone.utc)).timestamp()
+        # Aligned slots are the same in every worker, which lets singleton jobs agree on a run
+        return (math.floor(now / self.interval) + 1) * self.interval
+
+    def current_slot(self, now: float) -> float:
+        """The slot a run started now belongs to"""
+        if self.interval is not None:
+            return math.floor(now / self.interval) * self.interval
+        return math.floor(now / 60) * 60
+
+    def to_dict(self) -> Dict[str, Any]:
+        def iso(value: Optional[float]) -> Optional[str]:
+            return datetime.fromtimestamp(value, timezone.utc).isoformat() if value else None
+
+        finished = self.stats["succeeded"] + self.stats["failed"] + self.stats["timed_out"]
+        return {
+            "name": self.name,
+            "schedule": self.cron.expression if self.cron else (f"every {self.interval:g}s" if self.interval else "once"),
+            "singleton": self.singleton,
+            "lane": self.lane,
+            "max_concurrent": self.max_concurrent,
+            "running": len(self.running),
+            **self.stats,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+            "last_started_at": iso(self.last_started_at),
+            "last_finished_at": iso(self.last_finished_at),
+            "last_duration_ms": self.last_duration_ms,
+            "avg_duration_ms": round(self.total_duration_ms / finished, 2) if finished else None,
+            "max_duration_ms": round(self.max_duration_ms, 2),
+            "next_run_at": iso(self.next_run_at)
+        }
+
+class Scheduler:
+    """
+    Runs registered jobs on their schedule inside the serving worker.
+
+    Every run is a tracked task: failures and timeouts are logged and recorded,
+    a job never overlaps itself beyond `max_concurrent`, and at most
+    SCHEDULER_MAX_CONCURRENT_JOBS runs of shared-lane jobs execute at once
+    (other lanes run one job at a time, or are uncapped). While
+    admission control reports overload, runs wait (up to
+    SCHEDULER_MAX_DEFER_SECONDS) so background work yields to requests.
+    Singleton jobs run in one worker per host: a lock file under
+    SCHEDULER_LOCK_DIR records the last slot that ran.
+    """
+
+    def __init__(self):
+        self.max_concurrent_jobs = int(os.getenv("SCHEDULER_MAX_CONCURRENT_JOBS", "2"))
+        self.defer_on_overload = os.getenv("SCHEDULER_DEFER_ON_OVERLOAD", "true").lower() == "true"
+        self.max_defer_seconds = float(os.getenv("SCHEDULER_MAX_DEFER_SECONDS", "300"))
+        self.defer_poll_seconds = float(os.getenv("SCHEDULER_DEFER_POLL_SECONDS", "1.0"))
+        self.lock_dir = os.getenv("SCHEDULER_LOCK_DIR") or tempfile.gettempdir()
+
+        self.jobs: Dict[str, ScheduledJob] = {}
+        # lane -> semaphore, None until started
+        self._lanes: Optional[Dict[str, asyncio.Semaphore]] = None
+        self._supervisors: List[asyncio.Task] = []
+        self._runs: Set[asyncio.Task] = set()
+
+    def add_job(self, name: str, func: Callable[[], Awaitable[Any]], **options) -> ScheduledJob:
+        """Register a coroutine function; see ScheduledJob for the options"""
+        if name in self.jobs:
+            raise ValueError(f"Job {name} is already registered")
+        job = ScheduledJob(name, func, **options)
+        self.jobs[name] = job
+        if self._lanes is not None:
+            self._supervisors.append(asyncio.create_task(self._supervise(job)))
+        return job
+
+    def start(self):
+        """Start the schedules of all registered jobs (once per worker)"""
+        if self._lanes is not None:
+            return
+        self._lanes = {SHARED_LANE: asyncio.Semaphore(self.max_concurrent_jobs)}
+        self._supervisors = [asyncio.create_task(self._supervise(job)) for job in self.jobs.values()]
+
+    async def close(self):
+        """Stop the schedules and cancel runs still in progress"""
+        tasks = [*self._supervisors, *self._runs]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._supervisors = []
+        self._lanes = None
+
+    async def _supervise(self, job: ScheduledJob):
+        if job.run_at_start:
+            job.next_run_at = time.time()
+            await asyncio.sleep(random.uniform(0, job.jitter))
+            self._launch(job, slot=job.current_slot(time.time()))
+        if job.interval is None and job.cron is None:
+            job.next_run_at = None
+            return
+        while True:
+            slot = job.next_slot(time.time())
+            job.next_run_at = slot + random.uniform(0, job.jitter)
+            await asyncio.sleep(max(0.0, job.next_run_at - time.time()))
+            self._launch(job, slot=slot)
+
+    def _launch(self, job: ScheduledJob, slot: Optional[float] = None) -> Optional[asyncio.Task]:
+        if len(job.running) >= job.max_concurrent:
+            job.stats["skipped_overlap"] += 1
+            return None
+        task = asyncio.create_task(self._execute(job, slot))
+        for tasks in (job.running, self._runs):
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        return task
+
+    def run_now(self, name: str) -> Optional[asyncio.Task]:
+        """Start a job outside its schedule; None when it is already at its concurrency limit"""
+        if self._lanes is None:
+            raise RuntimeError("Scheduler is not running")
+        return self._launch(self.jobs[name])
+
+    async def _wait_for_capacity(self, job: ScheduledJob):
+        if not (self.defer_on_overload and admission_controller.enabled):
+            return
+        deadline = time.monotonic() + self.max_defer_seconds
+        if admission_controller.overload_level() > 0:
+            job.stats["deferred"] += 1
+        while admission_controller.overload_level() > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(self.defer_poll_seconds)
+
+    def _claim_slot(self, job: ScheduledJob, slot: Optional[float]) -> Optional[int]:
+        """Lock the job's file unless another worker holds it or already ran this slot"""
+        fd = os.open(os.path.join(self.lock_dir, f"bastion-job-{job.name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        recorded = os.pread(fd, 32, 0).decode().strip()
+        if slot is not None and recorded and float(recorded) >= slot:
+            os.close(fd)
+            return None
+        ran_slot = f"{slot if slot is not None else job.current_slot(time.time()):.0f}"
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, ran_slot.encode(), 0)
+        return fd
+
+    async def _execute(self, job: ScheduledJob, slot: Optional[float]):
+        await self._wait_for_capacity(job)
+        if job.lane is None:
+            await self._run(job, slot)
+            return
+        lane = self._lanes.get(job.lane)
+        if lane is None:
+            lane = self._lanes[job.lane] = asyncio.Semaphore(1)
+        async with lane:
+            await self._run(job, slot)
+
+    async def _run(self, job: ScheduledJob, slot: Optional[float]):
+        lock_fd = None
+        if job.singleton:
+            lock_fd = self._claim_slot(job, slot)
+            if lock_fd is None:
+                job.stats["skipped_elsewhere"] += 1
+                return
+        job.stats["runs"] += 1
+        job.last_started_at = time.time()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(job.func(), timeout=job.timeout)
+            job.last_status, job.last_error = "succeeded", None
+        except asyncio.TimeoutError:
+            job.last_status, job.last_error = "timed_out", f"Timed out after {job.timeout:g}s"
+            print(f"⚠️ Background job {job.name} timed out after {job.timeout:g}s")
+        except Exception as e:
+            job.last_status, job.last_error = "failed", str(e)
+            print(f"❌ Background job {job.name} failed: {e}")
+        finally:
+            if lock_fd is not None:
+                os.close(lock_fd)
+        duration_ms = (time.perf_counter() - started) * 1000
+        job.stats[job.last_status] += 1
+        job.last_finished_at = time.time()
+        job.last_duration_ms = round(duration_ms, 2)
+        job.total_duration_ms += duration_ms
+        job.max_duration_ms = max(job.max_duration_ms, duration_ms)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get every job's schedule, last outcome and durations"""
+        return {
+            "running": self._lanes is not None,
+            "max_concurrent_jobs": self.max_concurrent_jobs,
+            "active_runs": len(self._runs),
+            "defer_on_overload": self.defer_on_overload and admission_controller.enabled,
+            "jobs": [job.to_dict() for job in self.jobs.values()]
+        }
+
+# Global scheduler, one per serving worker
+scheduler = Scheduler()
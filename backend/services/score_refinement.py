@@ -0,0 +1,95 @@
+"""
+Score Refinement
+Second phase of two-phase scoring: the AI-adjusted score, computed after the response
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from core.supabase_client import get_supabase_client
+from services.scoring_jobs import scoring_jobs, QueueFullError
+from services.webhooks import webhook_dispatcher, decision_for
+
+# (risk_score, is_flagged) of the refined analysis
+Refine = Callable[[], Awaitable[Tuple[int, bool]]]
+
+class ScoreRefiner:
+    """
+    Runs the Cohere-backed refinement of a claim scored with rules only.
+
+    Refinements are queued on the scoring job pool, so their job id can be
+    polled or streamed (GET /api/v1/ml-fraud/jobs/{job_id}). Once done, the
+    claim row gets both scores and the final decision, the user's risk score
+    is updated if it moved, and the store receives a `claim.decision_refined`
+    webhook with `decision_changed` set when the decision differs from the
+    preliminary one. When the queue is full the preliminary decision stands.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("TWO_PHASE_SCORING_ENABLED", "false").lower() == "true"
+        self.stats = {"scheduled": 0, "refined": 0, "decision_changed": 0, "skipped": 0, "record_failures": 0}
+
+    async def schedule(self, claim: Dict[str, Any], risk_score: int, is_flagged: bool, refine: Refine,
+                       on_refined: Optional[Callable[[int, bool], Awaitable[None]]] = None) -> Optional[str]:
+        """Queue the refinement of a claim's preliminary score; returns the job id (None if skipped)"""
+        async def work() -> Dict[str, Any]:
+            return await self._refine(claim, risk_score, is_flagged, refine, on_refined)
+
+        try:
+            job = await scoring_jobs.submit(work, metadata={
+                "kind": "refinement",
+                "claim_id": claim.get("id"),
+                "user_id": claim.get("user_id"),
+                # Lets the claim's merchant read the job
+                "store_id": claim.get("store_id")
+            })
+        except QueueFullError:
+            self.stats["skipped"] += 1
+            print(f"⚠️ Scoring queue full, keeping the preliminary score of claim {claim.get('id')}")
+            return None
+        self.stats["scheduled"] += 1
+        return job.id
+
+    async def _refine(self, claim: Dict[str, Any], risk_score: int, is_flagged: bool, refine: Refine,
+                      on_refined: Optional[Callable[[int, bool], Awaitable[None]]]) -> Dict[str, Any]:
+        refined_score, refined_flagged = await refine()
+        preliminary_decision = decision_for(risk_score, is_flagged)
+        refined_decision = decision_for(refined_score, refined_flagged)
+        refinement = {
+            "preliminary_risk_score": risk_score,
+            "preliminary_decision": preliminary_decision,
+            "risk_score": refined_score,
+            "is_flagged": refined_flagged,
+            "decision": refined_decision,
+            "decision_changed": refined_decision != preliminary_decision
+        }
+
+        try:
+            await asyncio.to_thread(
+                lambda: get_supabase_client().table("claims").update({
+                    "preliminary_risk_score": risk_score,
+                    "risk_score": refined_score,
+                    "decision": refined_decision,
+                    "decision_changed": refinement["decision_changed"]
+                }).eq("id", claim["id"]).execute()
+            )
+        except Exception as e:
+            # Columns from setup/two_phase_scoring.sql may be missing; the webhook still goes out
+            self.stats["record_failures"] += 1
+            print(f"⚠️ Could not store refined score of claim {claim.get('id')}: {e}")
+
+        if on_refined is not None and (refined_score, refined_flagged) != (risk_score, is_flagged):
+            await on_refined(refined_score, refined_flagged)
+
+        webhook_dispatcher.claim_decision_refined(claim, refinement)
+        self.stats["refined"] += 1
+        if refinement["decision_changed"]:
+            self.stats["decision_changed"] += 1
+        return {"claim_id": claim.get("id"), **refinement}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get refinement counters"""
+        return {**self.stats, "enabled": self.enabled}
+
+# Global refiner
+score_refiner = ScoreRefiner()
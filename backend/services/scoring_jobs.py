@@ -0,0 +1,306 @@
+"""
+Scoring Jobs
+Bounded queue and worker pool for fraud analyses that outlive the HTTP request
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+import httpx
+from core.supabase_client import get_supabase_client
+from core.outbound import check_outbound_url_async, UnsafeURLError
+from core.workers import get_worker_count
+from services.webhooks import SIGNATURE_HEADER, sign_payload, webhook_dispatcher
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room left"""
+
+class ScoringJob:
+    """One queued analysis: the work to run, its state and, once finished, its result"""
+
+    def __init__(self, work: Callable[[], Awaitable[Dict[str, Any]]], callback_url: Optional[str] = None,
+                 metadata: Optional[Dict[str, Any]] = None):
+        self.id = f"job_{uuid.uuid4().hex}"
+        self.work = work
+        self.callback_url = callback_url
+        self.callback_secret = webhook_dispatcher.new_secret() if callback_url else None
+        self.metadata = metadata or {}
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.expires_at = float("inf")
+        # Woken (and replaced) on every status change, for SSE subscribers
+        self.changed = asyncio.Event()
+
+    def _set_status(self, status: str):
+        self.status = status
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            **self.metadata,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "result": self.result,
+            "error": self.error
+        }
+
+class ScoringJobQueue:
+    """
+    Runs analyses on SCORING_JOBS_WORKERS tasks fed by a queue of at most
+    SCORING_JOBS_MAX_QUEUED jobs; submit() fails fast when it is full.
+
+    Finished jobs are kept for SCORING_JOBS_RESULT_TTL_SECONDS. With several
+    serving workers a job is also written to the `scoring_jobs` table
+    (setup/scoring_jobs.sql), so polling and streaming work whichever worker
+    the client reaches. A callback URL receives the finished job as a POST
+    signed like outbound webhooks, with a per-job secret.
+    """
+
+    def __init__(self):
+        self.worker_count = int(os.getenv("SCORING_JOBS_WORKERS", "4"))
+        self.max_queued = int(os.getenv("SCORING_JOBS_MAX_QUEUED", "1000"))
+        self.result_ttl_seconds = float(os.getenv("SCORING_JOBS_RESULT_TTL_SECONDS", "3600"))
+        self.max_stored = int(os.getenv("SCORING_JOBS_MAX_STORED", "10000"))
+        self.job_timeout_seconds = float(os.getenv("SCORING_JOBS_TIMEOUT_SECONDS", "120"))
+        self.callback_attempts = int(os.getenv("SCORING_JOBS_CALLBACK_ATTEMPTS", "3"))
+        self.poll_interval_seconds = float(os.getenv("SCORING_JOBS_POLL_INTERVAL_SECONDS", "1.0"))
+        self.heartbeat_seconds = float(os.getenv("SCORING_JOBS_HEARTBEAT_SECONDS", "15"))
+        self.purge_interval_seconds = float(os.getenv("SCORING_JOBS_PURGE_INTERVAL_SECONDS", "300"))
+        self.persist = os.getenv("SCORING_JOBS_PERSIST", "auto").lower() == "true" or (
+            os.getenv("SCORING_JOBS_PERSIST", "auto").lower() == "auto" and get_worker_count() > 1
+        )
+
+        self.queue: Optional[asyncio.Queue] = None
+        # Queue slots held by submissions still persisting their job
+        self._reserved = 0
+        self.jobs: "OrderedDict[str, ScoringJob]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+        self._callbacks: Set[asyncio.Task] = set()
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {
+            "submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0,
+            "callbacks_sent": 0, "callbacks_failed": 0, "total_run_ms": 0.0, "max_queue_wait_ms": 0.0
+        }
+
+    def start(self):
+        """Start the worker tasks (once per serving worker)"""
+        if self._workers:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queued)
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
+        self._workers = [asyncio.create_task(self._run_worker()) for _ in range(self.worker_count)]
+
+    async def close(self):
+        """Stop the workers; queued jobs and pending callbacks are dropped"""
+        tasks = [*self._workers, *self._callbacks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def submit(self, work: Callable[[], Awaitable[Dict[str, Any]]], callback_url: Optional[str] = None,
+                     metadata: Optional[Dict[str, Any]] = None) -> ScoringJob:
+        """Queue an analysis; raises QueueFullError when at capacity"""
+        if self.queue is None:
+            self.start()
+        # Reserve the slot before awaiting, so concurrent submits cannot overfill the queue
+        if self.queue.qsize() + self._reserved >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise QueueFullError(f"Scoring queue is full ({self.max_queued} jobs)")
+        job = ScoringJob(work, callback_url, metadata)
+        self.jobs[job.id] = job
+        self._evict()
+        self._reserved += 1
+        try:
+            if self.persist:
+                await self._save(job)
+        except BaseException:
+            # Cancelled before it was queued: do not leave it "queued" forever
+            self.jobs.pop(job.id, None)
+            raise
+        finally:
+            self._reserved -= 1
+        self.queue.put_nowait(job)
+        self.stats["submitted"] += 1
+        return job
+
+    def _evict(self):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self.jobs.items() if job.expires_at < now]:
+            del self.jobs[job_id]
+        while len(self.jobs) > self.max_stored:
+            # Oldest finished job first; queued and running jobs must stay visible
+            evicted = next((job_id for job_id, job in self.jobs.items() if job.status in TERMINAL_STATUSES), None)
+            if evicted is None:
+                break
+            del self.jobs[evicted]
+
+    async def _run_worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                print(f"❌ Scoring job {job.id} crashed: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: ScoringJob):
+        job.started_at = datetime.now(timezone.utc)
+        wait_ms = (job.started_at - job.created_at).total_seconds() * 1000
+        self.stats["max_queue_wait_ms"] = round(max(self.stats["max_queue_wait_ms"], wait_ms), 2)
+        job._set_status("running")
+        started = time.perf_counter()
+        try:
+            job.result = await asyncio.wait_for(job.work(), timeout=self.job_timeout_seconds)
+            status = "succeeded"
+        except asyncio.TimeoutError:
+            job.error = f"Analysis timed out after {self.job_timeout_seconds:g}s"
+            status = "failed"
+        except Exception as e:
+            job.error = str(e)
+            status = "failed"
+        job.work = None
+        self.stats["total_run_ms"] += (time.perf_counter() - started) * 1000
+        self.stats[status] += 1
+        job.finished_at = datetime.now(timezone.utc)
+        job.expires_at = time.monotonic() + self.result_ttl_seconds
+        job._set_status(status)
+
+        if self.persist:
+            await self._save(job)
+        if job.callback_url:
+            # Retries must not hold a worker that could be scoring the next job
+            task = asyncio.create_task(self._send_callback(job))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+
+    async def _send_callback(self, job: ScoringJob):
+        body = json.dumps(job.to_dict(), default=str).encode()
+        for attempt in range(self.callback_attempts):
+            try:
+                # Checked at submit too; the host may resolve elsewhere by now
+                await check_outbound_url_async(job.callback_url)
+            except UnsafeURLError as e:
+                self.stats["callbacks_failed"] += 1
+                print(f"⚠️ Refusing callback for scoring job {job.id}: {e}")
+                return
+            try:
+                response = await self._client.post(job.callback_url, content=body, headers={
+                    "Content-Type": "application/json",
+                    SIGNATURE_HEADER: sign_payload(job.callback_secret, body)
+                })
+                if response.status_code < 300:
+                    self.stats["callbacks_sent"] += 1
+                    return
+            except httpx.HTTPError:
+                pass
+            if attempt < self.callback_attempts - 1:
+                await asyncio.sleep(2 ** attempt)
+        self.stats["callbacks_failed"] += 1
+        print(f"⚠️ Callback for scoring job {job.id} failed after {self.callback_attempts} attempts")
+
+    async def _save(self, job: ScoringJob):
+        state = job.to_dict()
+        record = {
+            "id": job.id,
+            "status": job.status,
+            "metadata": job.metadata,
+            **{key: state[key] for key in ("created_at", "started_at", "finished_at", "result", "error")},
+            "expires_at": (datetime.now(timezone.utc) + timedelta(seconds=self.result_ttl_seconds)).isoformat()
+        }
+        try:
+            await asyncio.to_thread(lambda: get_supabase_client().table("scoring_jobs").upsert(record).execute())
+        except Exception as e:
+            print(f"⚠️ Could not persist scoring job {job.id}: {e}")
+
+    async def purge_expired(self):
+        """Delete expired rows from the shared table (scheduled job)"""
+        await asyncio.to_thread(
+            lambda: get_supabase_client().table("scoring_jobs").delete().lt(
+                "expires_at", datetime.now(timezone.utc).isoformat()
+            ).execute()
+        )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Current state of a job, from this worker or the shared table"""
+        job = self.jobs.get(job_id)
+        if job is not None and job.expires_at >= time.monotonic():
+            return job.to_dict()
+        if not self.persist:
+            return None
+        rows = await asyncio.to_thread(
+            lambda: get_supabase_client().table("scoring_jobs").select("*").eq("id", job_id).gte(
+                "expires_at", datetime.now(timezone.utc).isoformat()
+            ).execute().data
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            **(row.get("metadata") or {}),
+            **{key: row.get(key) for key in ("created_at", "started_at", "finished_at", "result", "error")}
+        }
+
+    async def events(self, job_id: str, is_disconnected=None) -> AsyncIterator[str]:
+        """Yield SSE frames with each status change until the job finishes"""
+        last_status = None
+        while True:
+            job = self.jobs.get(job_id)
+            changed = job.changed if job is not None else None
+            state = await self.get(job_id)
+            if state is None:
+                yield f"event: error\ndata: {json.dumps({'detail': 'Job not found or expired'})}\n\n"
+                return
+            if state["status"] != last_status:
+                last_status = state["status"]
+                event = "result" if last_status in TERMINAL_STATUSES else "status"
+                yield f"event: {event}\ndata: {json.dumps(state, default=str)}\n\n"
+                if event == "result":
+                    return
+            # Local jobs wake us on change; jobs owned by another worker are polled
+            wait = changed.wait() if changed is not None else asyncio.sleep(self.poll_interval_seconds)
+            try:
+                await asyncio.wait_for(wait, timeout=self.heartbeat_seconds)
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth and job counters"""
+        finished = self.stats["succeeded"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "total_run_ms": round(self.stats["total_run_ms"], 2),
+            "avg_run_ms": round(self.stats["total_run_ms"] / finished, 2) if finished else 0.0,
+            "workers": len(self._workers),
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "running": sum(1 for job in self.jobs.values() if job.status == "running"),
+            "max_queued": self.max_queued,
+            "stored_jobs": len(self.jobs),
+            "persist": self.persist
+        }
+
+# Global queue, one worker pool per serving worker
+scoring_jobs = ScoringJobQueue()
@@ -0,0 +1,318 @@
+"""
+Shared Risk Score Segment
+Memory-mapped risk score table shared by all worker processes on a host
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, Optional, Tuple
+from core.workers import get_worker_count
+
+# Header: magic, capacity, used slots
+_HEADER = struct.Struct("<8sII")
+_HEADER_SIZE = 64
+_MAGIC = b"BSTNRSK2"
+
+# Record: seq, used, flags, risk_score, total/pending/approved/denied claims,
+# total_value, last_calculated (epoch seconds), store count, store codes, user id bytes
+_STORES_PER_RECORD = 8
+_RECORD = struct.Struct(f"<IBBh4iddB{_STORES_PER_RECORD}H16s7x")
+_SEQ = struct.Struct("<I")
+
+# Store table after the records: write-once (length, store id) entries; code = index + 1
+_STORE_SLOTS = 4096
+_STORE = struct.Struct("<B63s")
+
+_FLAG_FLAGGED = 1
+_FLAG_INSUFFICIENT_DATA = 2
+_FLAG_HAS_SCORE = 4
+
+def _default_path() -> str:
+    base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base_dir, "bastion-risk-cache")
+
+def _user_key(user_id: str) -> bytes:
+    try:
+        return uuid.UUID(str(user_id)).bytes
+    except ValueError:
+        return uuid.uuid5(uuid.NAMESPACE_OID, str(user_id)).bytes
+
+class SharedRiskScoreSegment:
+    """
+    Fixed-capacity open-addressing hash table of risk scores in a memory-mapped file.
+
+    Writers serialize on an flock; readers are lock-free and use a per-record
+    sequence counter (seqlock) to detect torn reads. One process per host holds
+    the owner lock and is responsible for warming the segment up.
+
+    Store ids are interned in a table after the records so that per-store
+    analytics work in every worker; a record keeps at most eight stores.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self._stores_offset = _HEADER_SIZE + capacity * _RECORD.size
+        self.size = self._stores_offset + _STORE_SLOTS * _STORE.size
+        self._mm: Optional[mmap.mmap] = None
+        self._pid: Optional[int] = None
+        self._lock_fd: Optional[int] = None
+        self._owner_fd: Optional[int] = None
+        self._owner_pid: Optional[int] = None
+        # Store code -> id, safe to cache since table entries never change once written
+        self._store_names: Dict[int, str] = {}
+        self.full_warnings = 0
+        self.store_warnings = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedRiskScoreSegment"]:
+        """Build a segment when running multi-worker or when explicitly enabled"""
+        enabled = os.getenv("RISK_CACHE_SHARED")
+        if enabled is None:
+            if get_worker_count() <= 1:
+                return None
+        elif enabled.lower() != "true":
+            return None
+
+        path = os.getenv("RISK_CACHE_SHARED_PATH") or _default_path()
+        capacity = int(os.getenv("RISK_CACHE_SHARED_SLOTS", "131072"))
+        return cls(path, capacity)
+
+    @staticmethod
+    def remove_files(path: Optional[str] = None):
+        """Delete a stale segment (called by the process manager before forking workers)"""
+        path = path or os.getenv("RISK_CACHE_SHARED_PATH") or _default_path()
+        for suffix in ("", ".lock"):
+            try:
+                os.unlink(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _open(self) -> mmap.mmap:
+        """Map the segment lazily so that every forked worker gets its own mapping"""
+        # Opened per process: an flock on a descriptor inherited across fork would not exclude anyone
+        if self._mm is not None and self._pid == os.getpid():
+            return self._mm
+        self._pid = os.getpid()
+        self._store_names = {}
+
+        self._lock_fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                valid = (
+                    len(header) == _HEADER.size
+                    and _HEADER.unpack(header)[:2] == (_MAGIC, self.capacity)
+                    and os.fstat(fd).st_size == self.size
+                )
+                if not valid:
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, self.size)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, self.capacity, 0), 0)
+                self._mm = mmap.mmap(fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            finally:
+                os.close(fd)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        return self._mm
+
+    def try_become_owner(self) -> bool:
+        """Take the per-host owner lock; held for the lifetime of the process"""
+        if self.is_owner():
+            return True
+        fd = os.open(self.path + ".owner", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._owner_fd = fd
+        self._owner_pid = os.getpid()
+        return True
+
+    def is_owner(self) -> bool:
+        # An owner lock inherited from the parent does not make a forked child the owner
+        return self._owner_fd is not None and self._owner_pid == os.getpid()
+
+    def _offset(self, slot: int) -> int:
+        return _HEADER_SIZE + slot * _RECORD.size
+
+    def _find_slot(self, mm: mmap.mmap, key: bytes, for_write: bool) -> Optional[int]:
+        start = int.from_bytes(key[:8], "little") % self.capacity
+        for probe in range(self.capacity):
+            slot = (start + probe) % self.capacity
+            record = _RECORD.unpack_from(mm, self._offset(slot))
+            used, slot_key = record[1], record[-1]
+            if not used:
+                return slot if for_write else None
+            if slot_key == key:
+                return slot
+        return None
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Read a user's cached risk data, None on miss"""
+        mm = self._open()
+        key = _user_key(user_id)
+        slot = self._find_slot(mm, key, for_write=False)
+        if slot is None:
+            return None
+
+        record = self._read_record(mm, slot)
+        if record is None or record[-1] != key:
+            return None
+        return self._to_risk_data(mm, record)
+
+    def _read_record(self, mm: mmap.mmap, slot: int) -> Optional[tuple]:
+        """Consistent copy of a used record, None if empty or still being written"""
+        offset = self._offset(slot)
+        for _ in range(100):
+            before = _SEQ.unpack_from(mm, offset)[0]
+            if before & 1:
+                continue
+            record = _RECORD.unpack_from(mm, offset)
+            if _SEQ.unpack_from(mm, offset)[0] == before:
+                return record if record[1] else None
+        return None
+
+    def _store_offset(self, code: int) -> int:
+        return self._stores_offset + (code - 1) * _STORE.size
+
+    def _store_name(self, mm: mmap.mmap, code: int) -> str:
+        name = self._store_names.get(code)
+        if name is None:
+            length, raw = _STORE.unpack_from(mm, self._store_offset(code))
+            name = self._store_names[code] = raw[:length].decode()
+        return name
+
+    def _store_code(self, mm: mmap.mmap, store_id: str) -> Optional[int]:
+        """Code of a store id, interning it if new; caller holds the lock"""
+        raw = store_id.encode()
+        if len(raw) > _STORE.size - 1:
+            return None
+        start = int.from_bytes(uuid.uuid5(uuid.NAMESPACE_OID, store_id).bytes[:8], "little") % _STORE_SLOTS
+        for probe in range(_STORE_SLOTS):
+            code = (start + probe) % _STORE_SLOTS + 1
+            length, slot_raw = _STORE.unpack_from(mm, self._store_offset(code))
+            if not length:
+                # Written before any record refers to it, so lock-free readers never see it half-done
+                _STORE.pack_into(mm, self._store_offset(code), len(raw), raw)
+                return code
+            if slot_raw[:length] == raw:
+                return code
+        return None
+
+    def _to_risk_data(self, mm: mmap.mmap, record: tuple) -> Dict[str, Any]:
+        (_, _, flags, risk_score, total_claims, pending_claims, approved_claims,
+         denied_claims, total_value, last_calculated, store_count) = record[:11]
+        store_codes = record[11:11 + store_count]
+        risk_data = {
+            "risk_score": risk_score if flags & _FLAG_HAS_SCORE else None,
+            "is_flagged": bool(flags & _FLAG_FLAGGED),
+            "insufficient_data": bool(flags & _FLAG_INSUFFICIENT_DATA),
+            "total_claims": total_claims,
+            "store_ids": [self._store_name(mm, code) for code in store_codes],
+            "last_calculated": datetime.utcfromtimestamp(last_calculated).isoformat()
+        }
+        if not flags & _FLAG_INSUFFICIENT_DATA:
+            risk_data.update({
+                "pending_claims": pending_claims,
+                "approved_claims": approved_claims,
+                "denied_claims": denied_claims,
+                "total_value": total_value
+            })
+        return risk_data
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Iterate over every (user_id, risk data) pair in the segment"""
+        mm = self._open()
+        for slot in range(self.capacity):
+            record = self._read_record(mm, slot)
+            if record is not None:
+                yield str(uuid.UUID(bytes=record[-1])), self._to_risk_data(mm, record)
+
+    def put(self, user_id: str, risk_data: Dict[str, Any]) -> bool:
+        """Publish a user's risk data to every worker, False if the segment is full"""
+        mm = self._open()
+        key = _user_key(user_id)
+
+        flags = 0
+        if risk_data.get("is_flagged"):
+            flags |= _FLAG_FLAGGED
+        if risk_data.get("insufficient_data"):
+            flags |= _FLAG_INSUFFICIENT_DATA
+        if risk_data.get("risk_score") is not None:
+            flags |= _FLAG_HAS_SCORE
+
+        try:
+            # Scores carry naive UTC timestamps (utcnow); read them back as UTC, not local time
+            calculated_at = datetime.fromisoformat(risk_data["last_calculated"])
+            if calculated_at.tzinfo is None:
+                calculated_at = calculated_at.replace(tzinfo=timezone.utc)
+            last_calculated = calculated_at.timestamp()
+        except (KeyError, TypeError, ValueError):
+            last_calculated = time.time()
+
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            slot = self._find_slot(mm, key, for_write=True)
+            if slot is None:
+                self.full_warnings += 1
+                if self.full_warnings == 1:
+                    print(f"⚠️ Shared risk cache is full ({self.capacity} slots), raise RISK_CACHE_SHARED_SLOTS")
+                return False
+
+            store_ids = [str(store_id) for store_id in risk_data.get("store_ids") or []]
+            codes = (self._store_code(mm, store_id) for store_id in store_ids[:_STORES_PER_RECORD])
+            store_codes = [code for code in codes if code is not None]
+            if len(store_codes) < len(store_ids):
+                self.store_warnings += 1
+                if self.store_warnings == 1:
+                    print(f"⚠️ Shared risk cache dropped store ids for user {user_id} (store table full or too many stores)")
+            store_fields = store_codes + [0] * (_STORES_PER_RECORD - len(store_codes))
+
+            offset = self._offset(slot)
+            seq, used = _RECORD.unpack_from(mm, offset)[:2]
+            _SEQ.pack_into(mm, offset, seq + 1)
+            _RECORD.pack_into(
+                mm, offset, seq + 1, 1, flags,
+                int(risk_data.get("risk_score") or 0),
+                int(risk_data.get("total_claims", 0)),
+                int(risk_data.get("pending_claims", 0)),
+                int(risk_data.get("approved_claims", 0)),
+                int(risk_data.get("denied_claims", 0)),
+                float(risk_data.get("total_value", 0.0)),
+                last_calculated,
+                len(store_codes),
+                *store_fields,
+                key
+            )
+            _SEQ.pack_into(mm, offset, seq + 2)
+
+            if not used:
+                magic, capacity, count = _HEADER.unpack_from(mm, 0)
+                _HEADER.pack_into(mm, 0, magic, capacity, count + 1)
+            return True
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return _HEADER.unpack_from(self._open(), 0)[2]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get segment occupancy statistics"""
+        used = len(self)
+        return {
+            "path": self.path,
+            "capacity": self.capacity,
+            "used_slots": used,
+            "load_factor": round(used / self.capacity, 4),
+            "is_owner": self.is_owner()
+        }
@@ -0,0 +1,491 @@
+"""
+Webhook Dispatcher
+Batched, signed, retried delivery of claim decisions to merchant endpoints
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import hmac
+import json
+import os
+import random
+import secrets
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import httpx
+from core.outbound import check_outbound_url_async
+from core.supabase_client import get_supabase_client
+from core.workers import get_worker_count
+from services.claim_events import claim_events
+
+EVENT_TYPES = ("claim.decision", "claim.decision_refined", "claim.status_changed")
+SIGNATURE_HEADER = "Bastion-Signature"
+
+def _default_path() -> str:
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "webhooks")
+
+def decision_for(risk_score: int, is_flagged: bool) -> str:
+    """Map a risk assessment to the action a merchant should take"""
+    if is_flagged:
+        return "manual_review"
+    if risk_score >= 60:
+        return "hold"
+    return "approve"
+
+def sign_payload(secret: str, body: bytes, timestamp: Optional[int] = None) -> str:
+    """Signature header value: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">"""
+    timestamp = timestamp if timestamp is not None else int(time.time())
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+def verify_signature(secret: str, body: bytes, header: str, tolerance_seconds: int = 300) -> bool:
+    """Check a signature header produced by sign_payload (used by receivers)"""
+    try:
+        parts = dict(part.split("=", 1) for part in header.split(","))
+        timestamp = int(parts["t"])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance_seconds:
+        return False
+    expected = sign_payload(secret, body, timestamp).split("v1=", 1)[1]
+    return hmac.compare_digest(expected, parts.get("v1", ""))
+
+class _QueueFile:
+    """
+    Append-only JSONL journal of events and acknowledgements.
+
+    Each worker claims one journal slot with an flock, so a restarted worker
+    replays exactly the events its predecessor on that slot left unacknowledged.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self._lock_fd: Optional[int] = None
+        self._file = None
+
+    def open(self) -> List[Dict[str, Any]]:
+        """Claim a slot and return its pending events, compacting the journal"""
+        os.makedirs(self.directory, exist_ok=True)
+        slot = 0
+        while True:
+            path = os.path.join(self.directory, f"queue-{slot}.jsonl")
+            fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                os.close(fd)
+                slot += 1
+        self._lock_fd, self.path = fd, path
+
+        pending = self._read(path)
+        # Adopt journals left by slots beyond the current worker count (scaled down)
+        if slot == 0:
+            extra = max(1, get_worker_count())
+            while os.path.exists(os.path.join(self.directory, f"queue-{extra}.jsonl")):
+                orphan = os.path.join(self.directory, f"queue-{extra}.jsonl")
+                orphan_fd = os.open(orphan + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    fcntl.flock(orphan_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    pending.update(self._read(orphan))
+                    os.unlink(orphan)
+                except BlockingIOError:
+                    pass
+                finally:
+                    os.close(orphan_fd)
+                extra += 1
+
+        temporary = path + ".tmp"
+        with open(temporary, "w") as journal:
+            for entry in pending.values():
+                journal.write(json.dumps(entry) + "\n")
+        os.replace(temporary, path)
+        self._file = open(path, "a", buffering=1)
+        return list(pending.values())
+
+    @staticmethod
+    def _read(path: str) -> Dict[str, Dict[str, Any]]:
+        pending: Dict[str, Dict[str, Any]] = {}
+        if not os.path.exists(path):
+            return pending
+        with open(path) as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash
+                    continue
+                if "ack" in entry:
+                    pending.pop(entry["ack"], None)
+                else:
+                    pending[entry["id"]] = entry
+        return pending
+
+    def append(self, entry: Dict[str, Any]):
+        if self._file is not None:
+            self._file.write(json.dumps(entry, default=str) + "\n")
+
+    def truncate(self):
+        """Start the journal afresh (only when nothing is outstanding)"""
+        if self._file is not None:
+            self._file.seek(0)
+            self._file.truncate()
+
+    def size(self) -> int:
+        return self._file.tell() if self._file is not None else 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+class _Endpoint:
+    """Per-endpoint delivery state: pending events, a concurrency cap and a batch signal"""
+
+    def __init__(self, endpoint_id: str, url: str, secret: str, concurrency: int):
+        self.id = endpoint_id
+        self.url = url
+        self.secret = secret
+        self.pending: Deque[Dict[str, Any]] = deque()
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dead = 0
+
+class WebhookDispatcher:
+    """
+    Pushes claim events to merchant endpoints off the request path.
+
+    enqueue() only journals the event and hands it to the dispatcher task,
+    so submit latency never depends on merchants. The dispatcher fans each
+    event out to the store's endpoints (setup/webhooks.sql); every endpoint
+    batches up to WEBHOOK_BATCH_SIZE events per POST, runs at most
+    WEBHOOK_ENDPOINT_CONCURRENCY requests at a time over a shared pooled
+    keep-alive client, and retries with exponential backoff and jitter.
+    Batches that are given up on are appended to dead-letter.jsonl next to
+    the journal, and an event is acknowledged in the journal once every
+    delivery succeeded or was dead-lettered.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("WEBHOOKS_ENABLED", "false").lower() == "true"
+        self.path = os.getenv("WEBHOOK_QUEUE_PATH") or _default_path()
+        self.batch_size = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+        self.batch_window_seconds = float(os.getenv("WEBHOOK_BATCH_WINDOW_MS", "200")) / 1000
+        self.concurrency = int(os.getenv("WEBHOOK_ENDPOINT_CONCURRENCY", "2"))
+        self.max_attempts = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+        self.max_backoff_seconds = float(os.getenv("WEBHOOK_MAX_BACKOFF_SECONDS", "300"))
+        self.timeout_seconds = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+        self.endpoints_ttl_seconds = float(os.getenv("WEBHOOK_ENDPOINTS_REFRESH_SECONDS", "60"))
+        self.journal_compact_bytes = int(os.getenv("WEBHOOK_JOURNAL_COMPACT_BYTES", str(1 << 20)))
+
+        self.journal = _QueueFile(self.path)
+        self.dead_letter_path = os.path.join(self.path, "dead-letter.jsonl")
+        self.inbox: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self.endpoints: Dict[str, _Endpoint] = {}
+        # store id -> (expires_at, endpoint rows)
+        self._store_endpoints: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+        # event id -> deliveries still outstanding
+        self._outstanding: Dict[str, int] = {}
+        # event id -> failed attempts to fan it out (e.g. endpoints could not be loaded)
+        self._dispatch_failures: Dict[str, int] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"enqueued": 0, "replayed": 0, "batches_sent": 0, "events_delivered": 0,
+                      "failed_attempts": 0, "dead_lettered": 0, "dead_letter_errors": 0, "no_endpoint": 0}
+
+    def start(self):
+        """Replay the journal and start dispatching (once per worker)"""
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            pending = self.journal.open()
+        except Exception as e:
+            print(f"❌ Could not open webhook journal, events will not survive restarts: {e}")
+            pending = []
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout_seconds,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=100, keepalive_expiry=60)
+        )
+        for event in pending:
+            self.inbox.put_nowait(event)
+        self.stats["replayed"] = len(pending)
+        if pending:
+            print(f"📬 Replaying {len(pending)} undelivered webhook events")
+        self._task = asyncio.create_task(self._dispatch())
+
+    def enqueue(self, event_type: str, store_id: Optional[str], data: Dict[str, Any]):
+        """Journal an event for delivery; never blocks on the network"""
+        if not self.enabled or self._task is None or not store_id:
+            return
+        event = {
+            "id": f"evt_{uuid.uuid4().hex}",
+            "type": event_type,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "store_id": str(store_id),
+            "data": data
+        }
+        self.journal.append(event)
+        self.inbox.put_nowait(event)
+        self.stats["enqueued"] += 1
+
+    def claim_decision(self, claim: Dict[str, Any], risk_score: int, is_flagged: bool, preliminary: bool = False):
+        """Notify the claim's store of the risk decision for a new claim"""
+        self.enqueue("claim.decision", claim.get("store_id"), {
+            "claim_id": claim.get("id"),
+            "user_id": claim.get("user_id"),
+            "status": claim.get("status"),
+            "decision": decision_for(risk_score, is_flagged),
+            "risk_score": risk_score,
+            "is_flagged": is_flagged,
+            # A claim.decision_refined event follows
+            "preliminary": preliminary
+        })
+
+    def claim_decision_refined(self, claim: Dict[str, Any], refinement: Dict[str, Any]):
+        """Notify the claim's store of the AI-refined decision that followed a preliminary one"""
+        self.enqueue("claim.decision_refined", claim.get("store_id"), {
+            "claim_id": claim.get("id"),
+            "user_id": claim.get("user_id"),
+            **refinement
+        })
+
+    def _on_status_changed(self, claim: Dict[str, Any], previous_status: Optional[str] = None):
+        self.enqueue("claim.status_changed", claim.get("store_id"), {
+            "claim_id": claim.get("id"),
+            "user_id": claim.get("user_id"),
+            "status": claim.get("status"),
+            "previous_status": previous_status
+        })
+
+    def _fetch_endpoints(self, store_id: str) -> List[Dict[str, Any]]:
+        return get_supabase_client().table("webhook_endpoints").select(
+            "id, url, secret, events"
+        ).eq("store_id", store_id).eq("enabled", True).execute().data or []
+
+    async def _endpoints_for(self, store_id: str) -> List[Dict[str, Any]]:
+        cached = self._store_endpoints.get(store_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        try:
+            rows = await asyncio.to_thread(self._fetch_endpoints, store_id)
+        except Exception as e:
+            print(f"❌ Could not load webhook endpoints for store {store_id}: {e}")
+            if cached is None:
+                # Nothing to fall back on; the event is retried rather than dropped
+                raise
+            # Keep serving the stale list rather than dropping events
+            rows = cached[1]
+        self._store_endpoints[store_id] = (time.monotonic() + self.endpoints_ttl_seconds, rows)
+        return rows
+
+    def invalidate_endpoints(self, store_id: Optional[str] = None):
+        """Forget cached endpoint lists after they were edited"""
+        if store_id is None:
+            self._store_endpoints.clear()
+        else:
+            self._store_endpoints.pop(str(store_id), None)
+
+    def _endpoint(self, row: Dict[str, Any]) -> _Endpoint:
+        endpoint = self.endpoints.get(row["id"])
+        if endpoint is None or endpoint.url != row["url"] or endpoint.secret != row["secret"]:
+            previous = endpoint
+            endpoint = self.endpoints[row["id"]] = _Endpoint(row["id"], row["url"], row["secret"], self.concurrency)
+            if previous is not None:
+                endpoint.pending.extend(previous.pending)
+                previous.pending.clear()
+                if previous.task is not None:
+                    previous.task.cancel()
+            endpoint.task = asyncio.create_task(self._run_endpoint(endpoint))
+        return endpoint
+
+    async def _dispatch(self):
+        while True:
+            event = await self.inbox.get()
+            # Counts as outstanding while its endpoints load, so the journal is not truncated under it
+            self._outstanding[event["id"]] = 1
+            try:
+                rows = [
+                    row for row in await self._endpoints_for(event["store_id"])
+                    if not row.get("events") or event["type"] in row["events"]
+                ]
+                if not rows:
+                    self.stats["no_endpoint"] += 1
+                    del self._outstanding[event["id"]]
+                    self._dispatch_failures.pop(event["id"], None)
+                    self._ack(event["id"])
+                    continue
+                # Resolve every endpoint first, so a failure never leaves the event half fanned out
+                endpoints = [self._endpoint(row) for row in rows]
+                self._outstanding[event["id"]] = len(endpoints)
+                self._dispatch_failures.pop(event["id"], None)
+                for endpoint in endpoints:
+                    endpoint.pending.append(event)
+                    endpoint.wakeup.set()
+            except Exception as e:
+                self._retry_dispatch(event, f"{type(e).__name__}: {e}")
+
+    def _retry_dispatch(self, event: Dict[str, Any], error: str):
+        """Re-queue an event that could not be fanned out, with backoff; dead-letter it in the end"""
+        attempts = self._dispatch_failures.get(event["id"], 0) + 1
+        if attempts >= self.max_attempts:
+            self._dispatch_failures.pop(event["id"], None)
+            self._outstanding.pop(event["id"], None)
+            self._dead_letter(None, [event], f"{error} (after {attempts} dispatch attempts)")
+            self._ack(event["id"])
+            return
+        self._dispatch_failures[event["id"]] = attempts
+        print(f"❌ Error dispatching webhook event {event['id']}, retrying: {error}")
+        # Stays outstanding while it waits, so the journal is not truncated under it
+        backoff = min(self.max_backoff_seconds, 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        asyncio.get_running_loop().call_later(backoff, self.inbox.put_nowait, event)
+
+    def _ack(self, event_id: str):
+        self.journal.append({"ack": event_id})
+        # Everything journaled so far is acknowledged once nothing is queued or in delivery
+        if not self._outstanding and self.inbox.empty() and self.journal.size() > self.journal_compact_bytes:
+            self.journal.truncate()
+
+    def _delivery_done(self, events: List[Dict[str, Any]]):
+        for event in events:
+            remaining = self._outstanding.get(event["id"], 1) - 1
+            if remaining <= 0:
+                self._outstanding.pop(event["id"], None)
+                self._ack(event["id"])
+            else:
+                self._outstanding[event["id"]] = remaining
+
+    async def _run_endpoint(self, endpoint: _Endpoint):
+        while True:
+            if not endpoint.pending:
+                endpoint.wakeup.clear()
+                await endpoint.wakeup.wait()
+            # Give a burst a moment to accumulate into one batch
+            if len(endpoint.pending) < self.batch_size:
+                await asyncio.sleep(self.batch_window_seconds)
+            batch = [endpoint.pending.popleft() for _ in range(min(self.batch_size, len(endpoint.pending)))]
+            if not batch:
+                continue
+            await endpoint.semaphore.acquire()
+            task = asyncio.create_task(self._deliver(endpoint, batch))
+            task.add_done_callback(lambda _: endpoint.semaphore.release())
+
+    async def _deliver(self, endpoint: _Endpoint, events: List[Dict[str, Any]]):
+        """Deliver one batch, dead-lettering it on failure; holds an endpoint slot throughout"""
+        try:
+            error = await self._post_batch(endpoint, events)
+        except Exception as e:
+            # e.g. an invalid endpoint URL; every batch must still be settled below
+            error = f"{type(e).__name__}: {e}"
+        if error is not None:
+            self._dead_letter(endpoint, events, error)
+        self._delivery_done(events)
+
+    async def _post_batch(self, endpoint: _Endpoint, events: List[Dict[str, Any]]) -> Optional[str]:
+        """POST one batch, retrying with exponential backoff; the final error, None once delivered"""
+        # Endpoints are checked when registered; the host may resolve elsewhere by now
+        await check_outbound_url_async(endpoint.url)
+        body = json.dumps({"id": f"whb_{uuid.uuid4().hex}", "events": events}, default=str).encode()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                response = await self._client.post(endpoint.url, content=body, headers={
+                    "Content-Type": "application/json",
+                    SIGNATURE_HEADER: sign_payload(endpoint.secret, body),
+                    "User-Agent": "Bastion-Webhooks/1.0"
+                })
+                if 200 <= response.status_code < 300:
+                    endpoint.delivered += len(events)
+                    self.stats["batches_sent"] += 1
+                    self.stats["events_delivered"] += len(events)
+                    return None
+                retryable = response.status_code >= 500 or response.status_code in (408, 429)
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                retryable = True
+                error = f"{type(e).__name__}: {e}"
+
+            endpoint.failed_attempts += 1
+            self.stats["failed_attempts"] += 1
+            if not retryable or attempt == self.max_attempts:
+                break
+            backoff = min(self.max_backoff_seconds, 2 ** (attempt - 1))
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+        return f"{error} (after {attempt} attempts)"
+
+    def _dead_letter(self, endpoint: Optional[_Endpoint], events: List[Dict[str, Any]], error: str):
+        """Append a batch that was given up on to the dead-letter file, for inspection or redelivery"""
+        if endpoint is not None:
+            endpoint.dead += len(events)
+        self.stats["dead_lettered"] += len(events)
+        target = endpoint.url if endpoint is not None else f"store {events[0].get('store_id')}"
+        print(f"❌ Giving up on {len(events)} webhook events for {target}: {error}")
+        entry = {
+            "endpoint_id": endpoint.id if endpoint is not None else None,
+            "url": endpoint.url if endpoint is not None else None,
+            "error": error,
+            "dead_lettered_at": datetime.utcnow().isoformat() + "Z",
+            "events": events
+        }
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            # One write per entry on an O_APPEND file, so workers do not interleave lines
+            fd = os.open(self.dead_letter_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, (json.dumps(entry, default=str) + "\n").encode())
+            finally:
+                os.close(fd)
+        except Exception as e:
+            self.stats["dead_letter_errors"] += 1
+            print(f"❌ Could not write webhook dead letters to {self.dead_letter_path}: {e}")
+
+    async def close(self):
+        """Stop dispatching; undelivered events stay in the journal for the next start"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        for endpoint in self.endpoints.values():
+            if endpoint.task is not None:
+                endpoint.task.cancel()
+        await self._client.aclose()
+        self.journal.close()
+        self._task = None
+
+    @staticmethod
+    def new_secret() -> str:
+        return f"whsec_{secrets.token_urlsafe(24)}"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get delivery counters and per-endpoint backlog"""
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "journal": self.journal.path,
+            "dead_letter": self.dead_letter_path,
+            "inbox": self.inbox.qsize(),
+            "outstanding_events": len(self._outstanding),
+            "endpoints": [
+                {
+                    "id": endpoint.id,
+                    "url": endpoint.url,
+                    "pending": len(endpoint.pending),
+                    "delivered": endpoint.delivered,
+                    "failed_attempts": endpoint.failed_attempts,
+                    "dead_lettered": endpoint.dead
+                }
+                for endpoint in self.endpoints.values()
+            ]
+        }
+
+# Global dispatcher, fed by the claim decision path and status updates
+webhook_dispatcher = WebhookDispatcher()
+claim_events.on_status_changed(webhook_dispatcher._on_status_changed)
@@ -0,0 +1,213 @@
+-- Project BASTION - Analytics rollups
+-- Run once in the Supabase SQL editor. Safe to re-run.
+--
+-- Claim counts are pre-aggregated per (UTC day, store, status) and item counts per
+-- (UTC day, store, status, category). Triggers on `claims` keep both tables current
+-- on insert, status change and delete; rebuild_claim_rollups() recomputes them from
+-- scratch (`make rebuild-rollups`).
+
+create table if not exists claim_daily_rollups (
+    day date not null,
+    store_id uuid not null,
+    status text not null,
+    claim_count integer not null default 0,
+    primary key (day, store_id, status)
+);
+
+create table if not exists claim_category_daily_rollups (
+    day date not null,
+    store_id uuid not null,
+    status text not null,
+    category text not null,
+    item_count integer not null default 0,
+    claim_count integer not null default 0,
+    primary key (day, store_id, status, category)
+);
+
+-- Per-store partitions: a merchant's queries only read its own rows
+create index if not exists claim_daily_rollups_store_day on claim_daily_rollups (store_id, day);
+create index if not exists claim_category_daily_rollups_store_day on claim_category_daily_rollups (store_id, day);
+create index if not exists claims_store_created_at on claims (store_id, created_at);
+
+-- Apply one claim to the rollups with sign +1 (add) or -1 (remove)
+create or replace function apply_claim_rollup(
+    p_created_at timestamptz,
+    p_store_id uuid,
+    p_status text,
+    p_claim_data jsonb,
+    p_sign integer
+) returns void
+language plpgsql
+as $$
+declare
+    v_day date := (p_created_at at time zone 'UTC')::date;
+    v_store uuid := coalesce(p_store_id, '00000000-0000-0000-0000-000000000000'::uuid);
+begin
+    insert into claim_daily_rollups (day, store_id, status, claim_count)
+    values (v_day, v_store, p_status, p_sign)
+    on conflict (day, store_id, status)
+    do update set claim_count = claim_daily_rollups.claim_count + excluded.claim_count;
+
+    insert into claim_category_daily_rollups (day, store_id, status, category, item_count, claim_count)
+    select v_day, v_store, p_status, lower(item->>'category'), p_sign * count(*), p_sign
+    from jsonb_array_elements(
+        case when jsonb_typeof(p_claim_data) = 'array' then p_claim_data else '[]'::jsonb end
+    ) as item
+    where item ? 'category'
+    group by lower(item->>'category')
+    on conflict (day, store_id, status, category)
+    do update set item_count = claim_category_daily_rollups.item_count + excluded.item_count,
+                  claim_count = claim_category_daily_rollups.claim_count + excluded.claim_count;
+end;
+$$;
+
+create or replace function claims_rollup_trigger() returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform apply_claim_rollup(old.created_at, old.store_id, old.status, old.claim_data, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform apply_claim_rollup(new.created_at, new.store_id, new.status, new.claim_data, 1);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists claims_rollup on claims;
+create trigger claims_rollup
+after insert or delete or update of status, created_at, store_id, claim_data on claims
+for each row execute function claims_rollup_trigger();
+
+-- Recompute both rollup tables from the claims table
+create or replace function rebuild_claim_rollups() returns void
+language plpgsql
+as $$
+begin
+    lock table claims in share mode;
+    delete from claim_daily_rollups where true;
+    delete from claim_category_daily_rollups where true;
+
+    insert into claim_daily_rollups (day, store_id, status, claim_count)
+    select (created_at at time zone 'UTC')::date,
+           coalesce(store_id, '00000000-0000-0000-0000-000000000000'::uuid),
+           status,
+           count(*)
+    from claims
+    group by 1, 2, 3;
+
+    insert into claim_category_daily_rollups (day, store_id, status, category, item_count, claim_count)
+    select (c.created_at at time zone 'UTC')::date,
+           coalesce(c.store_id, '00000000-0000-0000-0000-000000000000'::uuid),
+           c.status,
+           lower(item->>'category'),
+           count(*),
+           count(distinct c.id)
+    from claims c
+    cross join lateral jsonb_array_elements(
+        case when jsonb_typeof(c.claim_data) = 'array' then c.claim_data else '[]'::jsonb end
+    ) as item
+    where item ? 'category'
+    group by 1, 2, 3, 4;
+end;
+$$;
+
+-- Claim counts per time bucket and status, read by the dashboard endpoints.
+-- p_bucket: 'day', 'week' (Monday start), 'fortnight' (14-day blocks since 1970-01-01), 'month'
+-- p_store_id: restrict to one store's partition (null = all stores)
+drop function if exists claim_status_counts(date, text);
+create or replace function claim_status_counts(
+    p_start date,
+    p_bucket text default 'day',
+    p_store_id uuid default null
+) returns table (bucket date, status text, claim_count bigint)
+language sql
+stable
+as $$
+    select case p_bucket
+               when 'week' then date_trunc('week', day)::date
+               when 'fortnight' then date '1970-01-01' + ((day - date '1970-01-01') / 14) * 14
+               when 'month' then date_trunc('month', day)::date
+               else day
+           end as bucket,
+           status,
+           sum(claim_count)::bigint
+    from claim_daily_rollups
+    where day >= p_start
+      and (p_store_id is null or store_id = p_store_id)
+    group by 1, 2
+    order by 1;
+$$;
+
+-- Item counts per category, served from the category rollup
+drop function if exists claim_category_counts();
+create or replace function claim_category_counts(p_store_id uuid default null)
+returns table (category text, item_count bigint)
+language sql
+stable
+as $$
+    select category, sum(item_count)::bigint
+    from claim_category_daily_rollups
+    where p_store_id is null or store_id = p_store_id
+    group by category
+    having sum(item_count) > 0
+    order by 2 desc;
+$$;
+
+-- Most disputed items; only the top p_limit rows leave the database
+-- p_start: only count claims created on or after this day (UTC, null = all time)
+drop function if exists top_disputed_items(integer);
+drop function if exists top_disputed_items(integer, uuid);
+create or replace function top_disputed_items(
+    p_limit integer default 5,
+    p_store_id uuid default null,
+    p_start date default null
+)
+returns table (item_name text, category text, disputes bigint, last_dispute timestamptz)
+language sql
+stable
+as $$
+    select item->>'item_name',
+           (array_agg(coalesce(item->>'category', 'Unknown') order by c.created_at))[1],
+           count(*)::bigint,
+           max(c.created_at)
+    from claims c
+    cross join lateral jsonb_array_elements(
+        case when jsonb_typeof(c.claim_data) = 'array' then c.claim_data else '[]'::jsonb end
+    ) as item
+    where item ? 'item_name'
+      and (p_store_id is null or c.store_id = p_store_id)
+      and (p_start is null or c.created_at >= (p_start::timestamp at time zone 'UTC'))
+    group by item->>'item_name'
+    order by 3 desc, 1
+    limit p_limit;
+$$;
+
+-- Every dashboard section in one round trip.
+-- p_sections: any of 'status_counts', 'category_counts', 'top_items' (null = all)
+create or replace function analytics_dashboard(
+    p_start date,
+    p_bucket text default 'day',
+    p_sections text[] default null,
+    p_limit integer default 5,
+    p_store_id uuid default null
+) returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'status_counts',
+        case when p_sections is null or 'status_counts' = any(p_sections) then
+            (select coalesce(jsonb_agg(to_jsonb(s)), '[]'::jsonb) from claim_status_counts(p_start, p_bucket, p_store_id) s)
+        end,
+        'category_counts',
+        case when p_sections is null or 'category_counts' = any(p_sections) then
+            (select coalesce(jsonb_agg(to_jsonb(c)), '[]'::jsonb) from claim_category_counts(p_store_id) c)
+        end,
+        'top_items',
+        case when p_sections is null or 'top_items' = any(p_sections) then
+            (select coalesce(jsonb_agg(to_jsonb(t)), '[]'::jsonb) from top_disputed_items(p_limit, p_store_id) t)
+        end
+    );
+$$;
@@ -0,0 +1,21 @@
+-- Project BASTION - API keys
+-- Run once in the Supabase SQL editor. Safe to re-run.
+--
+-- Keys are never stored in clear: only a per-key salted SHA-256 plus the first
+-- 16 characters ("sk_live_xxxxxxxx"), which the API uses to find the row.
+-- Issue keys with `make create-api-key` or POST /api/v1/admin/api-keys.
+
+create table if not exists api_keys (
+    id uuid primary key default gen_random_uuid(),
+    name text not null,
+    mode text not null check (mode in ('test', 'live')),
+    -- Merchant keys are bound to one store; platform keys have none
+    store_id uuid references stores (id),
+    prefix text not null,
+    salt text not null,
+    key_hash text not null,
+    created_at timestamptz not null default now(),
+    revoked_at timestamptz
+);
+
+create index if not exists api_keys_prefix on api_keys (prefix) where revoked_at is null;
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Measure cold import and startup time of the API, and first-use cost of shared services
+Each run is a fresh interpreter. Usage: python3 setup/benchmark_startup.py [--runs N]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints one JSON line prefixed with RESULT
+PROBE = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+cohere_at_import = "cohere" in sys.modules
+
+async def run_startup():
+    await main.app.router.startup()
+
+asyncio.run(run_startup())
+ready = time.perf_counter()
+
+from core.container import container
+first_use = {}
+for name in ("ml_fraud_service", "cohere_client"):
+    t = time.perf_counter()
+    container.get(name)
+    first_use[name] = (time.perf_counter() - t) * 1000
+
+print("RESULT" + json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_use_ms": first_use,
+    "cohere_imported_at_startup": cohere_at_import,
+    "modules": len(sys.modules)
+}))
+"""
+
+def run_once() -> dict:
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, capture_output=True, text=True)
+    for line in output.stdout.splitlines():
+        if line.startswith("RESULT"):
+            return json.loads(line[len("RESULT"):])
+    raise RuntimeError(f"Probe failed:\n{output.stderr[-2000:]}")
+
+def benchmark(runs: int):
+    print(f"⏱️ Measuring cold start over {runs} runs...")
+    results = [run_once() for _ in range(runs)]
+
+    def median(values):
+        return round(statistics.median(values), 1)
+
+    print(f"   import main:        {median([r['import_ms'] for r in results])}ms (median)")
+    print(f"   startup handlers:   {median([r['startup_ms'] for r in results])}ms")
+    for name in results[0]["first_use_ms"]:
+        print(f"   first use {name + ':':<18} {median([r['first_use_ms'][name] for r in results])}ms")
+    print(f"   modules loaded:     {results[0]['modules']}")
+    print(f"   Cohere SDK imported at startup: {'yes' if results[0]['cohere_imported_at_startup'] else 'no'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark API cold start")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to average over")
+    args = parser.parse_args()
+    benchmark(args.runs)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Issue an API key (needed to bootstrap once API_KEY_AUTH_ENABLED=true)
+Usage: python3 setup/create_api_key.py NAME [--mode test|live] [--store-id UUID]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+
+from services.api_keys import api_key_store, KEY_MODES
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Issue a Bastion API key")
+    parser.add_argument("name", help="label shown in the dashboard")
+    parser.add_argument("--mode", choices=KEY_MODES, default="test")
+    parser.add_argument("--store-id", help="bind the key to one store (merchant key)")
+    args = parser.parse_args()
+
+    key = api_key_store.create_key(args.name, args.mode, args.store_id)
+    print(f"🔑 Created {key['mode']} key {key['id']} ({key['name']})")
+    print(f"   {key['api_key']}")
+    print("   Store it now, it cannot be shown again.")
@@ -0,0 +1,23 @@
+-- Project BASTION - Idempotency keys
+-- Run once in the Supabase SQL editor. Safe to re-run.
+--
+-- Idempotency-Key records shared by every API worker (see services/idempotency.py).
+-- The primary key makes the first insert win: that worker runs the request, the
+-- others wait for the stored response. A row without a status is a running request
+-- whose lease ends at expires_at; rows past expires_at are deleted by the workers.
+
+create table if not exists idempotency_keys (
+    -- SHA-256 of the caller, path and Idempotency-Key header
+    id text primary key,
+    fingerprint text not null,
+    -- Random token of the worker running the request
+    owner text not null,
+    status integer,
+    headers jsonb not null default '[]',
+    -- Response body, base64
+    body text,
+    created_at timestamptz not null default now(),
+    expires_at timestamptz not null
+);
+
+create index if not exists idempotency_keys_expires_at on idempotency_keys (expires_at);
@@ -0,0 +1,26 @@
+-- Project BASTION - Outcome statistics
+-- Run once in the Supabase SQL editor. Safe to re-run.
+--
+-- Running (outcomes, denied) counters per store, item category, rule signal and AI
+-- fraud pattern, fed by merchant-reported outcomes (see services/outcome_statistics.py).
+-- Workers send signed deltas, so no pass over the claims table is ever needed.
+
+create table if not exists outcome_statistics (
+    dimension text not null,
+    key text not null,
+    outcomes bigint not null default 0,
+    denied bigint not null default 0,
+    primary key (dimension, key)
+);
+
+-- Add a batch of deltas: [{"dimension", "key", "outcomes", "denied"}, ...]
+create or replace function apply_outcome_statistics(p_rows jsonb) returns void
+language sql
+as $$
+    insert into outcome_statistics (dimension, key, outcomes, denied)
+    select delta->>'dimension', delta->>'key', (delta->>'outcomes')::bigint, (delta->>'denied')::bigint
+    from jsonb_array_elements(p_rows) as delta
+    on conflict (dimension, key)
+    do update set outcomes = outcome_statistics.outcomes + excluded.outcomes,
+                  denied = outcome_statistics.denied + excluded.denied;
+$$;
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Rebuild the analytics rollup tables from the claims table
+Requires setup/analytics_rollups.sql to have been applied
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+
+from crud.crud_analytics import AnalyticsCRUD
+
+def rebuild_rollups():
+    """Recompute claim rollups in the database"""
+    print("🔁 Rebuilding analytics rollups...")
+    started = time.perf_counter()
+
+    try:
+        AnalyticsCRUD().rebuild_rollups()
+        print(f"✅ Rollups rebuilt in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        print(f"❌ Error rebuilding rollups: {e}")
+        raise
+
+if __name__ == "__main__":
+    rebuild_rollups()
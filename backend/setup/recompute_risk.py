@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Recompute every user's risk score on a process pool
+Usage: python3 setup/recompute_risk.py [--processes N] [--shard-size N]
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+
+from services.risk_recompute import risk_recompute_engine
+
+def print_progress(job):
+    """Print one progress line per completed shard"""
+    progress = job.to_dict()
+    print(f"  📊 {progress['progress']}% - {progress['processed_users']}/{progress['total_users']} users "
+          f"({progress['failed_users']} failed, {progress['users_per_second']} users/s)")
+
+async def recompute(processes, shard_size):
+    if processes is not None:
+        risk_recompute_engine.processes = processes
+    if shard_size is not None:
+        risk_recompute_engine.shard_size = shard_size
+
+    job = await risk_recompute_engine.run(progress=print_progress)
+    await risk_recompute_engine.cache.write_buffer.close()
+    print(f"💾 Write-back: {risk_recompute_engine.cache.write_buffer.get_stats()}")
+    return job
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute all user risk scores")
+    parser.add_argument("--processes", type=int, help="worker processes (0 runs in-process)")
+    parser.add_argument("--shard-size", type=int, help="users per shard")
+    args = parser.parse_args()
+
+    job = asyncio.run(recompute(args.processes, args.shard_size))
+    sys.exit(0 if job.status == "completed" else 1)
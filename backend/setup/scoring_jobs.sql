@@ -0,0 +1,20 @@
+-- Project BASTION - Scoring jobs
+-- Run once in the Supabase SQL editor. Safe to re-run.
+--
+-- Queued ML fraud analyses (POST /api/v1/ml-fraud/jobs) are mirrored here when the
+-- API runs several workers, so any worker can answer status polls. Rows past
+-- expires_at are deleted by the workers (see services/scoring_jobs.py).
+
+create table if not exists scoring_jobs (
+    id text primary key,
+    status text not null check (status in ('queued', 'running', 'succeeded', 'failed')),
+    metadata jsonb not null default '{}',
+    result jsonb,
+    error text,
+    created_at timestamptz not null default now(),
+    started_at timestamptz,
+    finished_at timestamptz,
+    expires_at timestamptz not null
+);
+
+create index if not exists scoring_jobs_expires_at on scoring_jobs (expires_at);
@@ -0,0 +1,11 @@
+-- Project BASTION - Two-phase scoring
+-- Run once in the Supabase SQL editor. Safe to re-run.
+--
+-- With TWO_PHASE_SCORING_ENABLED a claim is answered with a rule-based score and
+-- refined with AI afterwards (see services/score_refinement.py). The refinement
+-- records both scores and the final decision on the claim.
+
+alter table claims add column if not exists preliminary_risk_score integer;
+alter table claims add column if not exists risk_score integer;
+alter table claims add column if not exists decision text;
+alter table claims add column if not exists decision_changed boolean;
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Local webhook receiver for testing outbound decision webhooks
+Usage: python3 setup/webhook_receiver.py --secret whsec_... [--port 9000] [--fail-rate 0.2] [--delay-ms 0]
+Register http://localhost:9000/ as an endpoint, then submit claims.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from services.webhooks import SIGNATURE_HEADER, verify_signature
+
+def make_handler(secret, fail_rate, delay_ms):
+    seen_events = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if delay_ms:
+                time.sleep(delay_ms / 1000)
+            if secret and not verify_signature(secret, body, self.headers.get(SIGNATURE_HEADER, "")):
+                print("❌ Rejected batch with an invalid signature")
+                self.send_response(401)
+                self.end_headers()
+                return
+            if random.random() < fail_rate:
+                print("💥 Simulating a failure (503)")
+                self.send_response(503)
+                self.end_headers()
+                return
+
+            batch = json.loads(body)
+            for event in batch["events"]:
+                # Delivery is at-least-once: deduplicate on the event id
+                duplicate = event["id"] in seen_events
+                seen_events.add(event["id"])
+                data = event["data"]
+                print(f"{'🔁' if duplicate else '📨'} {event['type']} claim={data.get('claim_id')} "
+                      f"decision={data.get('decision', '-')} status={data.get('status')}")
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print signed Bastion webhook batches")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"), help="endpoint signing secret")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of batches answered with 503")
+    parser.add_argument("--delay-ms", type=int, default=0, help="artificial processing time per batch")
+    args = parser.parse_args()
+
+    if not args.secret:
+        print("⚠️ No --secret given, signatures will not be checked")
+    server = ThreadingHTTPServer(("0.0.0.0", args.port), make_handler(args.secret, args.fail_rate, args.delay_ms))
+    print(f"🚀 Webhook receiver listening on http://localhost:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
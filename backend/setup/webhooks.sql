@@ -0,0 +1,19 @@
+-- Project BASTION - Outbound webhooks
+-- Run once in the Supabase SQL editor. Safe to re-run.
+--
+-- Each store can register endpoints that receive claim events in signed batches
+-- (see services/webhooks.py and setup/webhook_receiver.py).
+
+create table if not exists webhook_endpoints (
+    id uuid primary key default gen_random_uuid(),
+    store_id uuid not null references stores (id),
+    url text not null,
+    -- Key for the Bastion-Signature HMAC, shown once when the endpoint is created
+    secret text not null,
+    -- Empty means every event type
+    events text[] not null default '{}',
+    enabled boolean not null default true,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists webhook_endpoints_store on webhook_endpoints (store_id) where enabled;